@@ -8,21 +8,39 @@ addons djeroku expects.
 
 Djeroku requires that you have pip, virtualenv, and git installed.
 
+Downloads are cached in ~/.djeroku/cache and shared between projects: the
+project template archive (revalidated by ETag, so an unchanged template is
+not downloaded again) and wheels of every dependency (so each is only
+downloaded and built once). With --offline, the project is built entirely
+from the cache.
+
 Usage:
     python create_djeroku_project.py project_name
 
     # for more info about what is going on
     python create_djeroku_project.py project_name --verbose
+
+    # without network access, from a previous run's cache
+    python create_djeroku_project.py project_name --offline
 """
 
 import argparse
+from contextlib import contextmanager
+import hashlib
+import json
 import sys
 import logging
+from multiprocessing.pool import ThreadPool
 import os
+import pipes
 import shutil
+import socket
 import platform
 import re
 import subprocess
+import tempfile
+from time import time
+import urllib2
 
 
 CONFIG = {
@@ -37,10 +55,40 @@ CONFIG = {
         'pip': 'pip -V',
         'virtualenv': 'virtualenv --version',
         'git': 'git --version'
-        }
+        },
+    # downloaded templates and built wheels, shared by every project
+    'cache_folder': os.path.join(os.path.expanduser('~'), '.djeroku', 'cache'),
+    # concurrent dependency downloads and builds
+    'install_workers': 4,
 }
 
 
+class CacheMiss(Exception):
+    pass
+
+
+class PhaseTimer(object):
+    """Logs each phase of the project creation and how long it took."""
+
+    def __init__(self):
+        self.timings = []
+
+    @contextmanager
+    def phase(self, name):
+        logging.info(name)
+        start = time()
+        try:
+            yield
+        finally:
+            self.timings.append((name, time() - start))
+
+    def report(self):
+        print 'Timing:'
+        for name, seconds in self.timings:
+            print '  %7.2fs  %s' % (seconds, name)
+        print '  %7.2fs  total' % sum(s for n, s in self.timings)
+
+
 def run(cmd):
     return 0 == subprocess.call(cmd, shell=True)
 
@@ -59,28 +107,47 @@ def get_venv_command(project_name=None):
     return pattern % project
 
 
-def create_djeroku_project(project_name):
+def create_djeroku_project(project_name, cache_dir=None, offline=False,
+                           timer=None):
     """
     Create a new project folder in this directory. Will prompt you for a
     project name, then create a new django project using the latest djeroku
     project template, including creating a virtualenvironment and installing
     all the dependencies.
     """
+    cache_dir = cache_dir or CONFIG['cache_folder']
+    wheel_dir = os.path.join(cache_dir, 'wheels')
+    timer = timer or PhaseTimer()
 
     # create virtualenv folder if necessary
     venv_path = os.path.join(project_name, CONFIG['virtualenv_folder'])
-    if not os.path.exists(venv_path):
-        logging.info('creating virtual environment')
-        run('virtualenv %s' % venv_path)
-    else:
-        logging.info('existing virtual environment found')
-
-    # install django
-    logging.info('installing django')
-    venv(
-        project_name,
-        'pip install %s' % CONFIG['django_pip_version']
-    )
+    with timer.phase('creating virtual environment'):
+        if not os.path.exists(venv_path):
+            run('virtualenv %s' % venv_path)
+        else:
+            logging.info('existing virtual environment found')
+
+    # fetch the template while django downloads
+    with timer.phase('fetching template and installing django'):
+        pool = ThreadPool(2)
+        template = pool.apply_async(
+            fetch_template,
+            (CONFIG['djeroku_template_path'], cache_dir, offline)
+        )
+        django_installed = pool.apply_async(
+            install_requirements,
+            (project_name, [CONFIG['django_pip_version']], wheel_dir, offline)
+        )
+        pool.close()
+        pool.join()
+        try:
+            template_path = template.get()
+        except (CacheMiss, urllib2.URLError, socket.error) as e:
+            logging.error('could not get the project template: %s', e)
+            return False
+        if not django_installed.get():
+            logging.error('could not install django')
+            return False
 
     # create project in temp dir
     temp_count = 1
@@ -90,45 +157,254 @@ def create_djeroku_project(project_name):
         if not os.path.exists(temp_project_path):
             break
 
-    logging.info('creating temporary project filestructure')
-    os.makedirs(temp_project_path)
-    venv(
-        project_name,
-        'django-admin startproject --template=%s --extension=py,html %s %s' % (
-            CONFIG['djeroku_template_path'], project_name, temp_project_path
+    with timer.phase('creating project filestructure'):
+        os.makedirs(temp_project_path)
+        venv(
+            project_name,
+            'django-admin startproject --template=%s --extension=py,html '
+            '%s %s' % (template_path, project_name, temp_project_path)
         )
-    )
 
-    # move project contents to real dir
-    for filename in os.listdir(temp_project_path):
-        shutil.move(
-            os.path.join(temp_project_path, filename),
-            os.path.join(project_name, filename)
-        )
+        # move project contents to real dir
+        for filename in os.listdir(temp_project_path):
+            shutil.move(
+                os.path.join(temp_project_path, filename),
+                os.path.join(project_name, filename)
+            )
 
-    # remove temp dir
-    os.rmdir(temp_project_path)
+        # remove temp dir
+        os.rmdir(temp_project_path)
 
     # install the djeroku dependencies with pip
-    logging.info('installing djeroku dependencies')
-    venv(project_name, 'pip install -r %s/reqs/dev.txt' % project_name)
+    with timer.phase('installing djeroku dependencies'):
+        requirements_path = os.path.join(project_name, 'reqs', 'dev.txt')
+        if not install_requirements(
+                project_name, read_requirements(requirements_path),
+                wheel_dir, offline, requirements_path):
+            logging.error('could not install the djeroku dependencies')
+            return False
 
     # setup the project
-    run_django_setup(project_name)
+    with timer.phase('running django setup commands'):
+        run_django_setup(project_name)
 
     print_welcome_message(project_name)
+    timer.report()
 
     return True
 
 
+def fetch_template(template_path, cache_dir, offline=False):
+    """
+    The local path of the project template archive. Downloads are cached
+    under the archive's ETag (the commit, for github archives) and
+    revalidated with it, so an unchanged template is not downloaded again.
+    The cached copy is used when offline or when the download fails.
+    """
+    if not re.match(r'^https?://', template_path):
+        return template_path
+
+    template_dir = os.path.join(cache_dir, 'templates')
+    index_path = os.path.join(template_dir, 'index.json')
+    index = _load_json(index_path)
+    cached = index.get(template_path)
+    cached_path = None
+    if cached is not None:
+        cached_path = os.path.join(template_dir, cached['file'])
+        if not os.path.exists(cached_path):
+            cached = cached_path = None
+
+    if offline:
+        if cached_path is None:
+            raise CacheMiss('no cached copy of %s' % template_path)
+        logging.info('using cached template %s', cached['file'])
+        return cached_path
+
+    request = urllib2.Request(template_path)
+    if cached is not None and cached.get('etag'):
+        request.add_header('If-None-Match', cached['etag'])
+    try:
+        response = urllib2.urlopen(request, timeout=60)
+    except urllib2.HTTPError as e:
+        if e.code == 304:
+            logging.info('cached template %s is current', cached['file'])
+            return cached_path
+        if cached_path is None:
+            raise
+        logging.warning('could not fetch template (%s) - using cache', e)
+        return cached_path
+    except (urllib2.URLError, socket.error) as e:
+        if cached_path is None:
+            raise
+        logging.warning('could not fetch template (%s) - using cache', e)
+        return cached_path
+
+    if not os.path.isdir(template_dir):
+        os.makedirs(template_dir)
+    temp_path = os.path.join(template_dir, '_download.%d' % os.getpid())
+    digest = hashlib.sha1()
+    with open(temp_path, 'wb') as f:
+        for block in iter(lambda: response.read(65536), ''):
+            digest.update(block)
+            f.write(block)
+
+    etag = response.info().getheader('ETag')
+    key = re.sub(r'[^a-zA-Z0-9]', '', (etag or '').replace('W/', ''))
+    filename = '%s.zip' % (key[:40] or digest.hexdigest())
+    os.rename(temp_path, os.path.join(template_dir, filename))
+
+    # drop the archive this one replaces, unless another url uses it
+    if cached is not None and cached['file'] != filename and not any(
+            entry['file'] == cached['file']
+            for url, entry in index.items() if url != template_path):
+        os.remove(cached_path)
+
+    index[template_path] = {'file': filename, 'etag': etag, 'fetched': time()}
+    _save_json(index_path, index)
+    logging.info('downloaded template %s', filename)
+    return os.path.join(template_dir, filename)
+
+
+def read_requirements(path):
+    """
+    The requirements in a pip requirements file, following `-r` includes.
+    Returns None if the file uses other pip options.
+    """
+    requirements = []
+    with open(path) as f:
+        for line in f:
+            line = line.split(' #', 1)[0].strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('-r'):
+                included = read_requirements(
+                    os.path.join(os.path.dirname(path), line[2:].strip())
+                )
+                if included is None:
+                    return None
+                requirements.extend(included)
+            elif line.startswith('-'):
+                return None
+            else:
+                requirements.append(pipes.quote(line))
+    return requirements
+
+
+def install_requirements(project_name, requirements, wheel_dir,
+                         offline=False, requirements_path=None):
+    """
+    Install requirements into the project's virtualenv from the shared
+    wheel cache. Unless offline, wheels missing from the cache are first
+    downloaded and built, several requirements at a time.
+    """
+    if requirements is None:
+        # an unparsed requirements file, handed to pip whole
+        requirements = ['-r %s' % requirements_path]
+
+    if not offline:
+        if not os.path.isdir(wheel_dir):
+            os.makedirs(wheel_dir)
+        missing = [r for r in requirements if not _cached_wheel(wheel_dir, r)]
+        if missing:
+            logging.debug('- building wheels: %s', ' '.join(missing))
+            pool = ThreadPool(min(CONFIG['install_workers'], len(missing)))
+            try:
+                built = pool.map(
+                    lambda requirement: build_wheels(
+                        project_name, requirement, wheel_dir
+                    ),
+                    missing
+                )
+            finally:
+                pool.close()
+                pool.join()
+            if not all(built):
+                logging.warning('some wheels could not be built')
+
+    return venv(
+        project_name,
+        'pip install -q --no-index --find-links=%s %s' % (
+            wheel_dir, ' '.join(requirements))
+    )
+
+
+def build_wheels(project_name, requirement, wheel_dir):
+    """
+    Build the wheels of one requirement and its dependencies into the
+    cache. Each build writes to a directory of its own, next to the cache,
+    and the wheels are then renamed into it - builds running side by side
+    share dependencies, and pip writing the same wheel into one directory
+    twice at once can leave it truncated.
+    """
+    build_dir = tempfile.mkdtemp(
+        prefix='wheels-', dir=os.path.dirname(os.path.abspath(wheel_dir))
+    )
+    try:
+        built = venv(
+            project_name,
+            'pip wheel -q --wheel-dir=%s --find-links=%s %s' % (
+                build_dir, wheel_dir, requirement)
+        )
+        for filename in os.listdir(build_dir):
+            if filename.endswith('.whl'):
+                # atomic, so other builds never see part of a wheel
+                os.rename(
+                    os.path.join(build_dir, filename),
+                    os.path.join(wheel_dir, filename)
+                )
+        return built
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def _cached_wheel(wheel_dir, requirement):
+    """Whether the cache already has a wheel for a pinned requirement."""
+    match = re.match(r'^([\w.-]+)==([\w.]+)$', requirement.strip('\'"'))
+    if match is None or not os.path.isdir(wheel_dir):
+        return False
+    prefix = '%s-%s-' % (
+        match.group(1).replace('-', '_').lower(), match.group(2)
+    )
+    return any(
+        filename.lower().startswith(prefix) and filename.endswith('.whl')
+        for filename in os.listdir(wheel_dir)
+    )
+
+
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def _save_json(path, data):
+    temp_path = '%s.%d' % (path, os.getpid())
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.rename(temp_path, path)
+
+
 def check_dependencies(dependencies):
     logging.info('checking for dependencies')
-    missing_dependencies = []
-    for dependency_name, command in dependencies.items():
-        logging.debug('- checking dependency: %s', dependency_name)
-        found = _check_dependency(command)
+    names = list(dependencies)
+    pool = ThreadPool(len(names) or 1)
+    try:
+        found = pool.map(
+            _check_dependency, [dependencies[name] for name in names]
+        )
+    finally:
+        pool.close()
+        pool.join()
 
-        if not found:
+    missing_dependencies = []
+    for dependency_name, dependency_found in zip(names, found):
+        logging.debug(
+            '- dependency %s: %s', dependency_name,
+            'found' if dependency_found else 'missing'
+        )
+        if not dependency_found:
             missing_dependencies.append(dependency_name)
 
     return dict(
@@ -150,12 +426,8 @@ def _check_dependency(command):
 
 def run_django_setup(project_name):
     logging.info('running django setup commands')
-    venv(project_name, 'python %s/manage.py syncdb' % project_name)
-    venv(project_name, 'python %s/manage.py migrate' % project_name)
-    venv(
-        project_name,
-        'python %s/manage.py collectstatic --noinput' % project_name
-    )
+    # migrate, the superuser prompt and collectstatic, in one process
+    venv(project_name, 'python %s/manage.py release' % project_name)
 
 
 def print_welcome_message(project_name):
@@ -207,14 +479,28 @@ def main():
         help='increase output verbosity',
         action='store_true'
     )
+    parser.add_argument(
+        '--offline',
+        help='build the project from the template and wheel caches only',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help='template and wheel cache folder (default %s)' % (
+            CONFIG['cache_folder']),
+        default=CONFIG['cache_folder']
+    )
     args = parser.parse_args()
 
     if args.verbose:
         logging.basicConfig(level=logging.DEBUG)
         logging.debug('Log level set to debug')
 
+    timer = PhaseTimer()
+
     # check dependencies
-    result = check_dependencies(CONFIG['dependencies'])
+    with timer.phase('checking dependencies'):
+        result = check_dependencies(CONFIG['dependencies'])
     if not result['dependencies_met']:
         for missing in result['missing']:
             logging.error('Missing required dependency `%s`', missing)
@@ -236,7 +522,10 @@ def main():
     os.makedirs(args.project_name)
 
     # create the project
-    create_djeroku_project(args.project_name)
+    if not create_djeroku_project(
+            args.project_name, args.cache_dir, args.offline, timer):
+        logging.error('project creation failed')
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
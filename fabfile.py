@@ -11,8 +11,9 @@ Includes helpful commands for managing a project.
   remotes.
 
 - serve
-  Syncs the db, runs any pending migrations, collects static assets, then runs
-  the local development server by calling `python manage.py runserver`
+  Runs the release steps (any pending migrations and changed static assets,
+  via `python manage.py release`), then runs the local development server by
+  calling `python manage.py runserver`
 
 - web
   Same as serve, but runs the web process using foreman instead of the django
@@ -26,19 +27,26 @@ Includes helpful commands for managing a project.
 - test
   Runs your tests using the django test runner.
 
+- bench
+  Benchmarks the full request stack in-process and through a local gunicorn,
+  on throwaway test databases, and compares the results with the saved
+  baseline (benchmarks.json), failing on a regression.
+  `fab bench:save_baseline=1` saves a new baseline.
+
 - deploy_staging
   Deploys the current local master branch to staging by calling
-  `git push staging master`, then syncs, migrates, and collects static.
+  `git push staging master`, then runs the release steps.
 
 - deploy_production
   Deploys the current local master branch to production by calling
-  `git push production master`, then syncs, migrates, and collects static.
+  `git push production master`, then runs the release steps.
 
 - promote_production
   Promotes the currently deployed staging environment to production by calling
   `heroku pipeline:promote`. This is a slightly better deployment process -
   first deploy to staging, then test that everything is working as expected,
   then promote it to move that exact slug to the production environment.
+  Then warms the production cache (`python manage.py warmcache`).
 
 - lint
   Runs flake8 on everything inside the project folder.
@@ -48,7 +56,7 @@ Deployment:
   You can deploy your app to staging by pushing master to the staging remote:
   `git push staging master`. This will build your project and make it
   accessible on staging-<your-app-name>.herokuapp.com. You almost certainly
-  will want to then call `heroku run python manage.py syncdb`
+  will want to then call `heroku run python manage.py release`
 
   When the code on staging is ready for production, you can promote the staging
   slug to your production app by calling `heroku pipeline:promote` or `fab
@@ -190,7 +198,7 @@ def heroku_setup():
 def deploy_staging():
     """
     Deploys the current local master branch to staging by calling
-    `git push staging master`, then syncs, migrates, and collects static.
+    `git push staging master`, then runs the release steps.
     """
     local('git push staging master')
     after_deploy('staging')
@@ -200,7 +208,7 @@ def deploy_staging():
 def deploy_production():
     """
     Deploys the current local master branch to production by calling
-    `git push production master`, then syncs, migrates, and collects static.
+    `git push production master`, then runs the release steps.
     """
     local('git push production master')
     after_deploy('production')
@@ -208,31 +216,31 @@ def deploy_production():
 
 @task
 def promote_production():
-    """Promotes the staging slug to production."""
+    """
+    Promotes the staging slug to production, then warms the production
+    cache with the urls and keys that were hot before the release.
+    """
     local('heroku pipeline:promote')
+    run('heroku run python manage.py warmcache --app=%s' % (
+        get_heroku_app_names()['production']
+    ))
 
 
 @task
 def serve():
     """
-    Sync db, migrate, collect static, and run the django
-    development server.
+    Migrate, collect static, and run the django development server.
     """
-    venv('python manage.py syncdb')
-    venv('python manage.py migrate')
-    venv('python manage.py collectstatic --noinput')
+    venv('python manage.py release')
     venv('python manage.py runserver 0.0.0.0:8000')
 
 
 @task
 def web():
     """
-    Sync db, migrate, collect static, and run the web
-    process using foreman.
+    Migrate, collect static, and run the web process using foreman.
     """
-    venv('python manage.py syncdb')
-    venv('python manage.py migrate')
-    venv('python manage.py collectstatic --noinput')
+    venv('python manage.py release')
     venv('foreman start web')
 
 
@@ -248,6 +256,21 @@ def test():
     venv('python manage.py test')
 
 
+@task
+def bench(save_baseline=False):
+    """
+    Benchmark the request stack and compare with the saved baseline.
+    """
+    venv('python manage.py release --noinput')
+    command = 'python manage.py bench'
+    if save_baseline:
+        command += ' --save-baseline'
+    with settings(warn_only=True):
+        result = local(venv_command(command), shell='/bin/bash')
+    if result.failed:
+        abort('Benchmarks failed or regressed from the baseline.')
+
+
 @task
 def lint():
     """Run flake8."""
@@ -256,20 +279,20 @@ def lint():
 
 # HELPERS
 def venv(cmd):
+    return run(venv_command(cmd))
+
+
+def venv_command(cmd):
     if platform.system == 'Windows':
         # untested - good luck, windows people! (submit a working PR)
-        return run('venv/bin/activate.bat && ' + cmd)
-    return run('source venv/bin/activate && ' + cmd)
+        return 'venv/bin/activate.bat && ' + cmd
+    return 'source venv/bin/activate && ' + cmd
 
 
 def after_deploy(remote):
     app_name = get_heroku_app_names()[remote]
-    run('heroku run python manage.py syncdb --app=%s' % app_name)
-    run('heroku run python manage.py migrate --app=%s' % app_name)
-    run(
-        'heroku run python manage.py collectstatic --noinput --app=%s' %
-        app_name
-    )
+    # one dyno runs every release step, so django boots once
+    run('heroku run python manage.py release --app=%s' % app_name)
 
 
 def cont(cmd, message):
@@ -0,0 +1,9 @@
+"""
+Djeroku support app.
+
+Performance and operations tooling shared by every djeroku project. Lives in
+the project/apps folder like any other app, so it is imported without a
+prefix (eg, `from djeroku import instrumentation`).
+"""
+
+default_app_config = 'djeroku.apps.DjerokuConfig'
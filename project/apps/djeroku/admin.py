@@ -0,0 +1,232 @@
+"""
+Admin changelists for large tables.
+
+A stock changelist runs an exact `COUNT(*)` of the filtered rows for the
+paginator and another of the whole table for the "N total" link, on every
+page view. `EstimatedCountAdminMixin` counts both with
+`djeroku.pagination.count_rows` instead: the planner's estimate above
+COUNT_ESTIMATE_THRESHOLD rows on postgres, a cached exact count otherwise.
+
+    class OrderAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+        list_filter = (
+            ('status', FacetChoicesFieldListFilter),
+            ('customer', FacetRelatedFieldListFilter),
+        )
+
+The Facet* list filters show how many rows each choice matches within the
+rest of the changelist - its search, lookups and other filters. The counts
+are one GROUP BY query per filter, run only when the sidebar is rendered and
+cached like the exact counts.
+
+`export_as_csv` and `export_as_json` are admin actions streaming the
+selected rows (`export_fields` of the ModelAdmin, or every concrete field)
+through `djeroku.export.export_response`:
+
+    class OrderAdmin(admin.ModelAdmin):
+        actions = [export_as_csv, export_as_json]
+        export_fields = ('id', 'customer__email', 'total')
+"""
+
+from __future__ import absolute_import
+
+import copy
+
+from django.conf import settings
+from django.contrib.admin import filters
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import SEARCH_VAR, ChangeList
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.db.models import Count
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.http import QueryDict
+from django.utils.encoding import force_text
+
+from djeroku.export import export_response
+from djeroku.pagination import (
+    EstimatedCountPaginator, count_rows, query_cache_key
+)
+
+
+class EstimatedCountChangeList(ChangeList):
+
+    def get_results(self, request):
+        """ChangeList.get_results, without exact counts of big tables."""
+        paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page
+        )
+        result_count = paginator.count
+
+        if self.model_admin.show_full_result_count:
+            if self.get_filters_params() or self.params.get(SEARCH_VAR):
+                full_result_count = count_rows(
+                    self.root_queryset,
+                    self.model_admin.count_estimate_threshold,
+                    self.model_admin.count_cache_timeout,
+                )[0]
+            else:
+                full_result_count = result_count
+        else:
+            full_result_count = None
+        can_show_all = result_count <= self.list_max_show_all
+        multi_page = result_count > self.list_per_page
+
+        if (self.show_all and can_show_all) or not multi_page:
+            result_list = self.queryset._clone()
+        else:
+            try:
+                result_list = paginator.page(self.page_num + 1).object_list
+            except InvalidPage:
+                raise IncorrectLookupParameters
+
+        self.result_count = result_count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.show_admin_actions = (
+            not self.show_full_result_count or bool(full_result_count)
+        )
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
+
+
+class EstimatedCountAdminMixin(object):
+    """
+    Counts changelist rows with planner estimates above
+    `count_estimate_threshold` rows (default COUNT_ESTIMATE_THRESHOLD, False
+    to always count exactly) and caches exact counts for
+    `count_cache_timeout` seconds (default COUNT_CACHE_TIMEOUT).
+    """
+    paginator = EstimatedCountPaginator
+    count_estimate_threshold = None
+    count_cache_timeout = None
+
+    def get_changelist(self, request, **kwargs):
+        return EstimatedCountChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            threshold=self.count_estimate_threshold,
+            timeout=self.count_cache_timeout,
+        )
+
+
+# FACET FILTERS
+class FacetCountsMixin(object):
+    """
+    Adds the number of matching rows to each choice of a field list filter.
+    Choices are matched to counts through the value of `lookup_kwarg` in
+    their query string.
+    """
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.request = request
+        super(FacetCountsMixin, self).__init__(
+            field, request, params, model, model_admin, field_path
+        )
+
+    def choices(self, cl):
+        counts = None
+        isnull_kwarg = getattr(
+            self, 'lookup_kwarg_isnull', getattr(self, 'lookup_kwarg2', None)
+        )
+        for choice in super(FacetCountsMixin, self).choices(cl):
+            if counts is None:
+                counts = self.facet_counts(cl)
+            params = QueryDict(choice['query_string'].lstrip('?'))
+            if self.lookup_kwarg in params:
+                count = counts.get(params[self.lookup_kwarg], 0)
+            elif isnull_kwarg in params:
+                count = counts.get(None, 0)
+            else:
+                count = sum(counts.values())
+            choice = dict(choice)
+            choice['display'] = '%s (%d)' % (choice['display'], count)
+            yield choice
+
+    def facet_queryset(self, cl):
+        """
+        The changelist's rows - its search, lookups and other filters -
+        without this filter's own selection.
+        """
+        facet_cl = copy.copy(cl)
+        facet_cl.params = dict(
+            (name, value) for name, value in cl.params.items()
+            if name not in self.expected_parameters()
+        )
+        return facet_cl.get_queryset(self.request)
+
+    def facet_counts(self, cl):
+        """Rows per value of the field, within the rest of `cl`."""
+        queryset = (
+            self.facet_queryset(cl).order_by()
+            .values_list(self.field_path)
+            .annotate(facet_count=Count('pk'))
+        )
+
+        timeout = getattr(settings, 'COUNT_CACHE_TIMEOUT', 60)
+        try:
+            key = query_cache_key('djeroku:facets', queryset)
+        except EmptyResultSet:
+            # nothing can match, eg, a search on an empty id list
+            return {}
+        counts = cache.get(key) if timeout else None
+        if counts is None:
+            counts = {}
+            for value, count in queryset:
+                counts[self.facet_key(value)] = count
+            if timeout:
+                cache.set(key, counts, timeout)
+        return counts
+
+    def facet_key(self, value):
+        """`value` as it appears in the choices' query strings."""
+        if value is None:
+            return None
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        return force_text(value)
+
+
+class FacetChoicesFieldListFilter(FacetCountsMixin,
+                                  filters.ChoicesFieldListFilter):
+    pass
+
+
+class FacetBooleanFieldListFilter(FacetCountsMixin,
+                                  filters.BooleanFieldListFilter):
+    pass
+
+
+class FacetRelatedFieldListFilter(FacetCountsMixin,
+                                  filters.RelatedFieldListFilter):
+    pass
+
+
+class FacetAllValuesFieldListFilter(FacetCountsMixin,
+                                    filters.AllValuesFieldListFilter):
+    pass
+# END FACET FILTERS
+
+
+# EXPORT ACTIONS
+def export_action(format):
+    """An admin action streaming the selected rows as `format`."""
+    def export(modeladmin, request, queryset):
+        return export_response(
+            queryset, getattr(modeladmin, 'export_fields', None), format
+        )
+    export.__name__ = str('export_as_%s' % format)
+    export.short_description = (
+        'Export selected %%(verbose_name_plural)s as %s' % format.upper()
+    )
+    return export
+
+
+export_as_csv = export_action('csv')
+export_as_json = export_action('json')
+# END EXPORT ACTIONS
@@ -0,0 +1,34 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+class DjerokuConfig(AppConfig):
+    name = 'djeroku'
+    verbose_name = 'Djeroku'
+
+    def ready(self):
+        from djeroku import instrumentation
+        instrumentation.install()
+
+        from djeroku import sqlite
+        connection_created.connect(sqlite.configure_connection)
+
+        if getattr(settings, 'LOCALE_CACHE_SIZE', 0):
+            from djeroku import l10n
+            l10n.install()
+
+        if getattr(settings, 'SLOW_QUERY_LOG_ENABLED', False):
+            from djeroku.slowquery import get_slow_query_log
+            instrumentation.register(get_slow_query_log())
+
+        if getattr(settings, 'QUERY_INSPECTION_ENABLED', False):
+            from djeroku import signals
+            signals.connect_task_query_inspection()
+
+        if getattr(settings, 'CELERY_LOCAL_BROKER', False):
+            from celery.signals import before_task_publish
+            from djeroku import localbroker
+            before_task_publish.connect(
+                localbroker.ensure_started, weak=False
+            )
@@ -0,0 +1,228 @@
+"""
+Fanning work over big tables out to celery.
+
+Slicing a queryset with OFFSET to hand it out to tasks gets slower the
+deeper it goes, and rows inserted or deleted while the work runs shift the
+slices so rows are skipped or done twice. `fan_out` walks the queryset by
+primary key instead, once, when the job starts: each chunk is the next
+`chunk_size` keys after the last chunk's, saved with the job.
+
+    def reindex(orders, full=False):
+        for order in orders:
+            ...
+
+    fan_out('reindex-orders', Order.objects.filter(active=True), reindex,
+            chunk_size=500, concurrency=8, full=True)
+
+`function` is called in a worker with a queryset of one chunk's rows (by
+primary key, so rows deleted since the job started are left out), plus
+the keyword arguments (which must be json serializable). At most
+`concurrency` chunks are in flight: the `run_batch_job` task dispatches
+pending chunks as a group, and every finished chunk runs it again to top
+the group back up. fan_out can't be called inside a transaction, since its
+tasks must not start before the job they read is committed.
+
+Jobs and chunks are saved in the database (BatchJob, BatchChunk), so
+`python manage.py batchjobs` can show progress. Chunk tasks are
+acknowledged late, so the broker redelivers a chunk that was running when
+its worker was killed; a chunk still in flight after BATCH_CHUNK_TIMEOUT
+seconds is taken to be lost and dispatched again, by the next
+`run_batch_job` or by the `watch_batch_job` task checking every
+BATCH_WATCH_INTERVAL seconds until the job is done. `python manage.py
+batchjobs --resume NAME` (or fan_out with the same name) does the same
+straight away.
+"""
+
+from __future__ import absolute_import
+
+from datetime import timedelta
+import json
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.transaction import TransactionManagementError
+from django.utils import six, timezone
+from django.utils.encoding import force_text
+from django.utils.module_loading import import_string
+
+from djeroku.models import BatchChunk, BatchJob
+from djeroku.pagination import keyset_pages
+
+
+def fan_out(name, queryset, function, chunk_size=None, concurrency=None,
+            **kwargs):
+    """
+    Start the job `name`, or resume it if an unfinished job has that name.
+    Returns the BatchJob.
+    """
+    from djeroku.tasks import run_batch_job
+
+    require_autocommit(queryset.db)
+    job = BatchJob.objects.filter(name=name).first()
+    if job is not None:
+        if job.status == BatchJob.DONE:
+            raise ValueError('Batch job %r already finished.' % name)
+        return resume(name)
+
+    job = create_job(name, queryset, function, chunk_size, concurrency,
+                     **kwargs)
+    run_batch_job.delay(job.pk)
+    watch(job)
+    return job
+
+
+def resume(name, stale_after=None):
+    """
+    Carry on with an unfinished job: dispatch again its chunks that have
+    been in flight longer than `stale_after` seconds (BATCH_CHUNK_TIMEOUT
+    by default, 0 for all of them) and dispatch pending ones.
+    """
+    from djeroku.tasks import run_batch_chunk
+
+    require_autocommit()
+    job = BatchJob.objects.get(name=name)
+    if job.status == BatchJob.DONE:
+        return job
+
+    for chunk in claim_chunks(job.pk, stale_after):
+        run_batch_chunk.delay(chunk.pk)
+    watch(job)
+    return job
+
+
+def watch(job):
+    """Check on `job` every BATCH_WATCH_INTERVAL seconds until it's done."""
+    from djeroku.tasks import watch_batch_job
+
+    watch_batch_job.apply_async(
+        (job.pk,), countdown=getattr(settings, 'BATCH_WATCH_INTERVAL', 60)
+    )
+
+
+def require_autocommit(using=None):
+    if transaction.get_connection(using).in_atomic_block:
+        raise TransactionManagementError(
+            'Batch jobs are dispatched once they are committed, so they '
+            "can't be started inside a transaction."
+        )
+
+
+# JOB STATE
+def create_job(name, queryset, function, chunk_size=None, concurrency=None,
+               **kwargs):
+    """
+    Save the job `name` with a pending chunk for every `chunk_size` primary
+    keys of `queryset`, in key order. Nothing is dispatched.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'BATCH_CHUNK_SIZE', 500)
+    if concurrency is None:
+        concurrency = getattr(settings, 'BATCH_CONCURRENCY', 4)
+    if isinstance(function, six.string_types):
+        function_path = function
+    else:
+        function_path = '%s.%s' % (function.__module__, function.__name__)
+
+    opts = queryset.model._meta
+
+    with transaction.atomic():
+        job = BatchJob.objects.create(
+            name=name,
+            function=function_path,
+            model='%s.%s' % (opts.app_label, opts.object_name),
+            kwargs=json.dumps(kwargs),
+            chunk_size=chunk_size,
+            concurrency=concurrency,
+            total=0,
+        )
+        chunks = []
+        for rows in keyset_pages(queryset.values_list('pk'), chunk_size):
+            keys = [force_text(row[0]) for row in rows]
+            chunks.append(BatchChunk(
+                job=job, first=keys[0], last=keys[-1], rows=len(keys),
+                keys=json.dumps(keys),
+            ))
+            job.total += len(keys)
+            if len(chunks) == 100:
+                BatchChunk.objects.bulk_create(chunks)
+                chunks = []
+        BatchChunk.objects.bulk_create(chunks)
+        if not job.total:
+            job.status = BatchJob.DONE
+        job.save()
+    return job
+
+
+def chunk_queryset(chunk):
+    """The rows of `chunk` that still exist."""
+    model = apps.get_model(chunk.job.model)
+    return model._default_manager.filter(pk__in=json.loads(chunk.keys))
+
+
+def claim_chunks(job_id, stale_after=None):
+    """
+    Claim the chunks of a job to dispatch: those in flight for longer than
+    `stale_after` seconds (BATCH_CHUNK_TIMEOUT by default), whose task was
+    lost, and pending ones up to its concurrency less the chunks already in
+    flight. Marks the job done when every chunk has finished. Returns the
+    claimed chunks, which the caller dispatches once they are committed.
+    """
+    if stale_after is None:
+        stale_after = getattr(settings, 'BATCH_CHUNK_TIMEOUT', 600)
+    now = timezone.now()
+    with transaction.atomic():
+        # one claimer at a time, so a chunk is never claimed twice
+        job = BatchJob.objects.select_for_update().get(pk=job_id)
+        if job.status == BatchJob.DONE:
+            return []
+
+        in_flight = job.chunks.filter(status=BatchChunk.DISPATCHED)
+        chunks = list(in_flight.filter(
+            dispatched__lte=now - timedelta(seconds=stale_after)
+        ))
+        room = job.concurrency - in_flight.count()
+        if room > 0:
+            chunks.extend(job.chunks.filter(
+                status=BatchChunk.PENDING
+            ).order_by('pk')[:room])
+
+        if chunks:
+            BatchChunk.objects.filter(
+                pk__in=[chunk.pk for chunk in chunks]
+            ).update(status=BatchChunk.DISPATCHED, dispatched=now)
+            for chunk in chunks:
+                chunk.status, chunk.dispatched = BatchChunk.DISPATCHED, now
+        elif not job.chunks.filter(status__in=(
+                BatchChunk.PENDING, BatchChunk.DISPATCHED)).exists():
+            job.status = BatchJob.DONE
+            job.save()
+    return chunks
+
+
+def finish_chunk(chunk, error=None):
+    """Record a chunk's outcome, once, and count it in the job's progress."""
+    status = BatchChunk.DONE if error is None else BatchChunk.FAILED
+    with transaction.atomic():
+        updated = BatchChunk.objects.filter(
+            pk=chunk.pk, status=BatchChunk.DISPATCHED
+        ).update(status=status, error=error or '', finished=timezone.now())
+        if not updated:
+            return False
+        progress = {'updated': timezone.now()}
+        if error is None:
+            progress['rows_done'] = F('rows_done') + chunk.rows
+            progress['chunks_done'] = F('chunks_done') + 1
+        else:
+            progress['chunks_failed'] = F('chunks_failed') + 1
+        BatchJob.objects.filter(pk=chunk.job_id).update(**progress)
+    return True
+
+
+def run_chunk(chunk):
+    """Call the job's function on the chunk's rows."""
+    job = chunk.job
+    function = import_string(job.function)
+    function(chunk_queryset(chunk), **json.loads(job.kwargs))
+# END JOB STATE
@@ -0,0 +1,389 @@
+"""
+Request benchmarks for the full WSGI stack.
+
+Drives the project's real WSGI application (settings.WSGI_APPLICATION - every
+middleware, sessions, auth and the dj-static wrapper) with concurrent
+clients, either in-process or over HTTP against a local gunicorn, and
+measures requests/sec, latency percentiles, queries per request and memory.
+Used by `python manage.py bench` (and `fab bench`), which runs on throwaway
+test databases (`test_databases`) so the superuser the logged in scenarios
+need never exists anywhere else.
+
+Results can be saved as a baseline and later runs compared against it: a
+drop in throughput, a rise in latency or memory beyond the tolerance, or
+any extra queries per request count as a regression.
+"""
+
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from time import sleep, time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import Client
+from django.utils.six.moves import http_client
+
+from djeroku import queries
+from djeroku.wsgi import local_host, wsgi_get
+
+
+BENCH_USERNAME = 'djeroku-bench'
+
+# alias: name of the test databases test_databases() created
+_test_databases = {}
+
+
+class Result(object):
+    """Measurements for one scenario in one mode."""
+
+    def __init__(self, mode, name, latencies, errors, seconds, queries=None,
+                 rss=None):
+        self.mode = mode
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.seconds = seconds
+        self.queries = queries
+        self.rss = rss
+
+    @property
+    def key(self):
+        return '%s|%s' % (self.mode, self.name)
+
+    @property
+    def rps(self):
+        return len(self.latencies) / self.seconds if self.seconds else 0.0
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return 0.0
+        index = int(round(percent / 100.0 * (len(self.latencies) - 1)))
+        return self.latencies[index]
+
+    def as_dict(self):
+        return dict(
+            rps=self.rps,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+            queries=self.queries,
+            rss=self.rss,
+        )
+
+
+def compare(results, baseline, tolerance):
+    """List the ways `results` regressed from the saved `baseline`."""
+    regressions = []
+    for result in results:
+        if result.errors:
+            regressions.append('%s: %d failed requests' % (
+                result.key, result.errors
+            ))
+        base = baseline.get(result.key)
+        if base is None:
+            continue
+
+        current = result.as_dict()
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append('%s: %.1f req/s, baseline %.1f' % (
+                result.key, current['rps'], base['rps']
+            ))
+        if current['p90'] > base['p90'] * (1 + tolerance):
+            regressions.append('%s: p90 %.1fms, baseline %.1fms' % (
+                result.key, current['p90'] * 1000, base['p90'] * 1000
+            ))
+        if (current['queries'] is not None and base['queries'] is not None and
+                current['queries'] > base['queries']):
+            regressions.append('%s: %.1f queries/request, baseline %.1f' % (
+                result.key, current['queries'], base['queries']
+            ))
+        if (current['rss'] and base['rss'] and
+                current['rss'] > base['rss'] * (1 + tolerance)):
+            regressions.append('%s: %.1fMB RSS, baseline %.1fMB' % (
+                result.key, current['rss'] / 1e6, base['rss'] / 1e6
+            ))
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump(
+            dict((r.key, r.as_dict()) for r in results), f,
+            indent=2, sort_keys=True
+        )
+
+
+# TEST DATABASES
+@contextmanager
+def test_databases():
+    """
+    Create and migrate a test database for each connection, used by this
+    process and the Gunicorn it starts, and destroy them on the way out.
+    sqlite ones go in a temporary directory, so gunicorn's workers can open
+    them.
+    """
+    temp_dir = tempfile.mkdtemp()
+    created = []
+    try:
+        for alias in connections:
+            connection = connections[alias]
+            if connection.vendor == 'sqlite':
+                connection.settings_dict['TEST']['NAME'] = os.path.join(
+                    temp_dir, '%s.db' % alias
+                )
+            old_name = connection.settings_dict['NAME']
+            _test_databases[alias] = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False
+            )
+            created.append((connection, old_name))
+        yield
+    finally:
+        _test_databases.clear()
+        for connection, old_name in reversed(created):
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+# END TEST DATABASES
+
+
+# CLIENTS
+def login_cookie():
+    """
+    A session cookie for a superuser created for the benchmarks, for the
+    scenarios that need a logged in user. Its password is random and
+    forgotten once it has logged in.
+    """
+    if not _test_databases:
+        raise RuntimeError(
+            'The benchmark superuser is only created in test databases - '
+            'call login_cookie() inside test_databases().'
+        )
+    User = get_user_model()
+    password = User.objects.make_random_password(32)
+    user = User(**{User.USERNAME_FIELD: BENCH_USERNAME})
+    user.is_staff = user.is_superuser = True
+    user.set_password(password)
+    user.save()
+
+    client = Client()
+    client.login(username=BENCH_USERNAME, password=password)
+    return '%s=%s' % (
+        settings.SESSION_COOKIE_NAME,
+        client.cookies[settings.SESSION_COOKIE_NAME].value
+    )
+
+
+def _drive(request, count, concurrency):
+    """
+    Call `request` `count` times from `concurrency` threads. `request`
+    returns (ok, queries) and is timed per call.
+    """
+    latencies = []
+    query_counts = []
+    errors = [0]
+    lock = threading.Lock()
+    per_thread = [count // concurrency] * concurrency
+    for i in range(count % concurrency):
+        per_thread[i] += 1
+
+    def worker(n):
+        state = {}
+        for _ in range(n):
+            start = time()
+            try:
+                ok, query_count = request(state)
+            except Exception:
+                ok, query_count = False, None
+            elapsed = time() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+                if query_count is not None:
+                    query_counts.append(query_count)
+
+    threads = [
+        threading.Thread(target=worker, args=(n,)) for n in per_thread if n
+    ]
+    start = time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time() - start
+
+    mean_queries = None
+    if query_counts:
+        mean_queries = sum(query_counts) / float(len(query_counts))
+    return latencies, errors[0], seconds, mean_queries
+
+
+def bench_wsgi(application, path, cookie, count, concurrency, warmup=0):
+    """Call the WSGI application directly, in this process."""
+
+    def request(state):
+        scope = queries.open_scope(path)
+        try:
+            status = wsgi_get(application, path, cookie)
+        finally:
+            scope.close()
+        return status is not None and status < 400, scope.count
+
+    _drive(request, warmup, 1)
+    return _drive(request, count, concurrency)
+
+
+def bench_http(port, path, cookie, count, concurrency, warmup=0):
+    """Make requests over HTTP, one keep-alive connection per thread."""
+    headers = {'Host': local_host()}
+    if cookie:
+        headers['Cookie'] = cookie
+
+    def request(state):
+        if 'connection' not in state:
+            state['connection'] = http_client.HTTPConnection(
+                '127.0.0.1', port, timeout=30
+            )
+        try:
+            state['connection'].request('GET', path, headers=headers)
+            response = state['connection'].getresponse()
+            response.read()
+        except Exception:
+            state.pop('connection').close()
+            raise
+        return response.status < 400, None
+
+    _drive(request, warmup, 1)
+    return _drive(request, count, concurrency)
+# END CLIENTS
+
+
+# GUNICORN
+class Gunicorn(object):
+    """
+    A local gunicorn serving settings.WSGI_APPLICATION, on the test
+    databases when it is started inside test_databases().
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.port = _free_port()
+        self.process = None
+
+    @staticmethod
+    def available():
+        try:
+            import gunicorn  # NOQA
+        except ImportError:
+            return False
+        return True
+
+    def start(self, timeout=30):
+        env = dict(os.environ)
+        if _test_databases:
+            # see djeroku.benchserver
+            application = 'djeroku.benchserver:application'
+            env['DJEROKU_BENCH_DATABASES'] = json.dumps(_test_databases)
+        else:
+            application = '%s:%s' % tuple(
+                settings.WSGI_APPLICATION.rsplit('.', 1)
+            )
+        self.process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn.app.wsgiapp',
+                '--bind', '127.0.0.1:%d' % self.port,
+                '--workers', str(self.workers),
+                '--log-level', 'warning',
+                '--pythonpath', settings.BASE_DIR,
+                application,
+            ],
+            cwd=settings.SITE_ROOT,
+            env=env,
+        )
+        deadline = time() + timeout
+        while time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn exited on startup')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), 1).close()
+                return
+            except socket.error:
+                sleep(0.1)
+        self.stop()
+        raise RuntimeError('gunicorn did not start in %ds' % timeout)
+
+    def rss(self):
+        return process_tree_rss(self.process.pid)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+# END GUNICORN
+
+
+# MEMORY
+def current_rss():
+    """Resident memory of this process in bytes."""
+    rss = _proc_rss('self')
+    if rss is None:
+        # peak rather than current, in KB on linux and bytes on OS X
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            rss *= 1024
+    return rss
+
+
+def process_tree_rss(pid):
+    """Resident memory of a process and its children, or None."""
+    total = _proc_rss(pid)
+    if total is None:
+        return None
+    for child in os.listdir('/proc'):
+        if child.isdigit() and _proc_ppid(child) == pid:
+            total += _proc_rss(child) or 0
+    return total
+
+
+def _proc_rss(pid):
+    try:
+        with open('/proc/%s/statm' % pid) as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError):
+        return None
+    return pages * resource.getpagesize()
+
+
+def _proc_ppid(pid):
+    try:
+        with open('/proc/%s/stat' % pid) as f:
+            # the command name is in parens and may contain spaces
+            return int(f.read().rsplit(')', 1)[1].split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+# END MEMORY
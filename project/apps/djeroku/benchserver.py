@@ -0,0 +1,21 @@
+"""
+The WSGI application `python manage.py bench` runs gunicorn with:
+settings.WSGI_APPLICATION, on the test databases the benchmarks created
+(djeroku.bench.test_databases), whose names are passed in the
+DJEROKU_BENCH_DATABASES environment variable.
+"""
+
+from __future__ import absolute_import
+
+import json
+import os
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+# before the first connection is made
+for alias, name in json.loads(os.environ['DJEROKU_BENCH_DATABASES']).items():
+    settings.DATABASES[alias]['NAME'] = name
+
+application = import_string(settings.WSGI_APPLICATION)
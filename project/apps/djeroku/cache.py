@@ -0,0 +1,87 @@
+"""
+Cache backends.
+
+`RecordingCache` wraps another configured cache and samples the keys read
+through it, and whether each read was a hit, for djeroku.warmup. LOCATION
+is the alias of the wrapped cache:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'djeroku.cache.RecordingCache',
+            'LOCATION': 'memcached',
+        },
+        'memcached': {...},
+    }
+
+Recording is off (every call goes straight through) unless
+CACHE_WARMUP_ENABLED is set.
+"""
+
+from __future__ import absolute_import
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from djeroku import warmup
+
+
+_missing = object()
+
+
+class RecordingCache(BaseCache):
+
+    def __init__(self, location, params):
+        super(RecordingCache, self).__init__(params)
+        self._alias = location
+        self._recording = getattr(settings, 'CACHE_WARMUP_ENABLED', False)
+
+    @property
+    def wrapped(self):
+        # caches[] is per thread, like the connections it holds
+        return caches[self._alias]
+
+    def get(self, key, default=None, version=None):
+        value = self.wrapped.get(key, _missing, version=version)
+        if self._recording:
+            warmup.get_recorder().record_key(key, value is not _missing)
+        return default if value is _missing else value
+
+    def get_many(self, keys, version=None):
+        values = self.wrapped.get_many(keys, version=version)
+        if self._recording:
+            recorder = warmup.get_recorder()
+            for key in keys:
+                recorder.record_key(key, key in values)
+        return values
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.wrapped.add(key, value, timeout, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.wrapped.set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.wrapped.set_many(data, timeout, version)
+
+    def delete(self, key, version=None):
+        return self.wrapped.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        return self.wrapped.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        return self.wrapped.has_key(key, version)  # NOQA
+
+    def incr(self, key, delta=1, version=None):
+        return self.wrapped.incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.wrapped.decr(key, delta, version)
+
+    def clear(self):
+        return self.wrapped.clear()
+
+    def close(self, **kwargs):
+        # the wrapped cache is closed by its own request_finished handler
+        pass
@@ -0,0 +1,160 @@
+"""
+Response compression and cheap validators.
+
+Used by `djeroku.middleware.CompressionMiddleware` and `WeakETagMiddleware`
+(see there), and `python manage.py compressbench`.
+
+Encoders compress a whole body (`compress`) or a stream chunk by chunk
+(`compress_chunks`), flushing after each chunk so a streaming response
+still goes out as it is produced. brotli is used when the `brotli` package
+is installed and the client accepts it, gzip otherwise.
+"""
+
+from __future__ import absolute_import
+
+import zlib
+
+from django.conf import settings
+from django.utils.encoding import force_bytes
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# gzip wrapper around deflate
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+# ENCODERS
+class GzipEncoder(object):
+    name = 'gzip'
+
+    def __init__(self, level=None):
+        if level is None:
+            level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+        self.level = level
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, GZIP_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def compress_chunks(self, chunks):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, GZIP_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(force_bytes(chunk))
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class BrotliEncoder(object):
+    name = 'br'
+
+    def __init__(self, quality=None):
+        if quality is None:
+            quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4)
+        self.quality = quality
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.quality)
+
+    def compress_chunks(self, chunks):
+        compressor = brotli.Compressor(quality=self.quality)
+        for chunk in chunks:
+            data = compressor.process(force_bytes(chunk)) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+def available_encoders():
+    """Encoders this process can use, preferred first."""
+    encoders = [GzipEncoder()]
+    if brotli is not None:
+        encoders.insert(0, BrotliEncoder())
+    return encoders
+
+
+def choose_encoder(accept_encoding, encoders=None):
+    """
+    The first of `encoders` the Accept-Encoding header allows, or None.
+    Codings with q=0 are refused; `*` stands for any coding not listed.
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    for encoder in encoders or available_encoders():
+        quality = accepted.get(encoder.name, accepted.get('*', 0))
+        if quality > 0:
+            return encoder
+    return None
+
+
+def parse_accept_encoding(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0
+        accepted[coding] = quality
+    return accepted
+# END ENCODERS
+
+
+# STREAMS
+def peek(chunks, size):
+    """
+    Read chunks until at least `size` bytes or the end. Returns (head, rest,
+    finished): the chunks read, an iterator over all the chunks (those read
+    first), and whether that was all of them.
+    """
+    iterator = iter(chunks)
+    head = []
+    length = 0
+    for chunk in iterator:
+        chunk = force_bytes(chunk)
+        head.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            return head, _chain(head, iterator), False
+    return head, iter(head), True
+
+
+def _chain(head, iterator):
+    for chunk in head:
+        yield chunk
+    for chunk in iterator:
+        yield chunk
+# END STREAMS
+
+
+# VALIDATORS
+def weak_etag(content):
+    """
+    A weak ETag for a body: its crc32 and length. Many times cheaper than
+    an md5 of it, and weak so it stays valid once the body is compressed.
+    """
+    return 'W/"%08x-%x"' % (zlib.crc32(content) & 0xffffffff, len(content))
+
+
+def etag_matches(etag, if_none_match):
+    """The weak comparison If-None-Match uses."""
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    if '*' in tags:
+        return True
+    return _opaque(etag) in [_opaque(tag) for tag in tags]
+
+
+def _opaque(tag):
+    return tag[2:] if tag.startswith('W/') else tag
+# END VALIDATORS
@@ -0,0 +1,173 @@
+"""
+Streaming CSV and JSON exports.
+
+`export_response` turns a queryset into a StreamingHttpResponse that reads
+rows a chunk at a time - through a server-side cursor on postgres, keyset
+pages (in primary key order) elsewhere - and writes each chunk out before
+reading the next, so a worker's memory stays flat however many rows are
+exported. Sliced querysets can't be paged by key, so off postgres they are
+read through an ordinary cursor in their own order. Use it from any view:
+
+    def orders_csv(request):
+        orders = Order.objects.filter(shipped__gte=last_month)
+        return export_response(orders, ['id', 'customer__email', 'total'])
+
+The admin actions in `djeroku.admin` (`export_as_csv`, `export_as_json`)
+use it too. `python manage.py exportbench` compares it with building the
+whole export in memory.
+"""
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import csv
+from itertools import islice
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.http import StreamingHttpResponse
+from django.utils import six
+
+from djeroku.pagination import keyset_pages
+
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+}
+
+
+def export_response(queryset, fields=None, format='csv', filename=None,
+                    chunk_size=None):
+    """
+    A streaming download of `fields` (every concrete field by default) of
+    each row in `queryset`, as 'csv' or 'json'.
+    """
+    if format not in CONTENT_TYPES:
+        raise ValueError('Unknown export format %r' % format)
+    fields = list(fields or export_fields(queryset.model))
+    chunks = iterate_rows(queryset, fields, chunk_size)
+    if format == 'csv':
+        content = csv_chunks(fields, chunks)
+    else:
+        content = json_chunks(fields, chunks)
+
+    response = StreamingHttpResponse(
+        content, content_type=CONTENT_TYPES[format]
+    )
+    response['Content-Disposition'] = 'attachment; filename="%s"' % (
+        filename or '%s.%s' % (queryset.model._meta.model_name, format)
+    )
+    return response
+
+
+def export_fields(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+# READING
+def iterate_rows(queryset, fields, chunk_size=None):
+    """
+    Yield lists of up to `chunk_size` tuples of the `fields` of the rows in
+    `queryset`. Nothing is read until the first list is asked for.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    if connections[queryset.db].vendor == 'postgresql':
+        return _server_side_chunks(queryset.values_list(*fields), chunk_size)
+    query = queryset.query
+    if query.low_mark or query.high_mark is not None:
+        # a slice can't be reordered or filtered into keyset pages
+        return cursor_chunks(queryset.values_list(*fields), chunk_size)
+    return _keyset_chunks(queryset, fields, chunk_size)
+
+
+def cursor_chunks(queryset, size):
+    """
+    Lists of up to `size` rows of `queryset` in its own order, through
+    iterator(). Drivers without chunked reads (sqlite) fetch every row at
+    the first chunk.
+    """
+    rows = queryset.iterator()
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _server_side_chunks(queryset, size):
+    connection = connections[queryset.db]
+    try:
+        sql, params = queryset.query.get_compiler(
+            using=queryset.db
+        ).as_sql()
+    except EmptyResultSet:
+        return
+
+    # named cursors only live inside a transaction
+    with transaction.atomic(using=queryset.db):
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(
+            name='djeroku_export_%s' % uuid4().hex
+        )
+        cursor.itersize = size
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+
+def _keyset_chunks(queryset, fields, size):
+    for rows in keyset_pages(queryset.values_list('pk', *fields), size):
+        yield [row[1:] for row in rows]
+# END READING
+
+
+# WRITING
+class Echo(object):
+    """A file for csv.writer whose write returns what was written."""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(fields, chunks):
+    writer = csv.writer(Echo())
+    yield writer.writerow([csv_cell(field) for field in fields])
+    for rows in chunks:
+        yield ''.join(
+            writer.writerow([csv_cell(value) for value in row])
+            for row in rows
+        )
+
+
+def csv_cell(value):
+    if value is None:
+        return ''
+    if six.PY2 and isinstance(value, six.text_type):
+        # the python 2 csv module only writes bytes
+        return value.encode('utf-8')
+    return value
+
+
+def json_chunks(fields, chunks):
+    """A json list of one object per row."""
+    encode = DjangoJSONEncoder().encode
+    separator = '\n'
+    yield '['
+    for rows in chunks:
+        yield separator + ',\n'.join(
+            encode(OrderedDict(zip(fields, row))) for row in rows
+        )
+        separator = ',\n'
+    yield '\n]\n'
+# END WRITING
@@ -0,0 +1,190 @@
+"""
+Database query instrumentation.
+
+Django 1.8 has no public hook for watching the queries a connection runs
+outside of DEBUG (connection.queries is only filled in by the debug cursor),
+so `install` wraps the cursor factory on every database backend. Each
+executed statement is timed and handed to the registered observers as a
+`QueryEvent`.
+
+Observers are plain callables:
+
+    def observer(event):
+        if event.duration > 0.5:
+            ...
+
+    instrumentation.register(observer)
+
+When no observers are registered, cursors are returned unwrapped so the
+instrumentation costs nothing.
+"""
+
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import hashlib
+import logging
+import re
+import threading
+from time import time
+
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.utils.encoding import force_bytes
+
+
+logger = logging.getLogger('djeroku.instrumentation')
+
+_observers = []
+_local = threading.local()
+_installed = False
+
+
+class QueryEvent(object):
+    """A single executed statement, as seen by the observers."""
+
+    __slots__ = ('alias', 'vendor', 'sql', 'params', 'duration', 'many')
+
+    def __init__(self, alias, vendor, sql, params, duration, many=False):
+        self.alias = alias
+        self.vendor = vendor
+        self.sql = sql
+        self.params = params
+        self.duration = duration
+        self.many = many
+
+
+class InstrumentedCursorWrapper(object):
+    """
+    Wraps the cursor returned by the backend (a CursorWrapper or, with DEBUG
+    on, a CursorDebugWrapper) and reports every statement to the observers.
+    """
+
+    def __init__(self, cursor, db):
+        self.cursor = cursor
+        self.db = db
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return self.cursor.__exit__(type, value, traceback)
+
+    def execute(self, sql, params=None):
+        start = time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            notify(self.db, sql, params, time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            # param_list may be a one-shot iterator, so observers only get
+            # it back when it can safely be read again
+            if not isinstance(param_list, (list, tuple)):
+                param_list = None
+            notify(self.db, sql, param_list, time() - start, many=True)
+
+
+def _instrumented(factory):
+    def make_cursor(self, cursor):
+        cursor = factory(self, cursor)
+        if _observers:
+            cursor = InstrumentedCursorWrapper(cursor, self)
+        return cursor
+    make_cursor.__doc__ = factory.__doc__
+    return make_cursor
+
+
+def install():
+    """Wrap the cursor factories of every database backend. Idempotent."""
+    global _installed
+    if _installed:
+        return
+    BaseDatabaseWrapper.make_cursor = _instrumented(
+        BaseDatabaseWrapper.make_cursor
+    )
+    BaseDatabaseWrapper.make_debug_cursor = _instrumented(
+        BaseDatabaseWrapper.make_debug_cursor
+    )
+    _installed = True
+
+
+def register(observer):
+    if observer not in _observers:
+        _observers.append(observer)
+
+
+def unregister(observer):
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+@contextmanager
+def observing(observer):
+    """Register `observer` for the duration of a with block."""
+    register(observer)
+    try:
+        yield observer
+    finally:
+        unregister(observer)
+
+
+@contextmanager
+def suppressed():
+    """
+    Hide the queries run by this thread from the observers. Used by
+    observers that query the database themselves (eg, to run an EXPLAIN) so
+    they don't end up observing their own work.
+    """
+    previous = getattr(_local, 'suppressed', False)
+    _local.suppressed = True
+    try:
+        yield
+    finally:
+        _local.suppressed = previous
+
+
+def notify(db, sql, params, duration, many=False):
+    if getattr(_local, 'suppressed', False):
+        return
+    event = QueryEvent(db.alias, db.vendor, sql, params, duration, many)
+    for observer in list(_observers):
+        try:
+            observer(event)
+        except Exception:
+            logger.exception('query observer %r failed', observer)
+
+
+# SQL FINGERPRINTS
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b-?\d+(?:\.\d+)?\b')
+_VALUE_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """
+    Reduce a statement to its shape: literals and placeholders become `?`
+    and IN lists of any length collapse to `(...)`, so the same ORM call
+    always normalizes to the same string whatever its parameters.
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _VALUE_LIST_RE.sub('(...)', sql)
+    return _WHITESPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    """Short stable identifier for the normalized form of `sql`."""
+    return hashlib.md5(force_bytes(normalize_sql(sql))).hexdigest()[:16]
+# END SQL FINGERPRINTS
@@ -0,0 +1,256 @@
+"""
+Streaming JSON responses for querysets.
+
+`JsonResponse(list(queryset.values(...)), safe=False)` holds every row as a
+dict, then the whole body as one string, before the first byte goes out,
+and DjangoJSONEncoder calls its `default` method in python for every date
+and decimal. StreamingJsonResponse writes the same JSON a chunk of rows at
+a time instead, read with djeroku.export's readers (a server-side cursor on
+postgres), so a worker's memory stays flat however many rows there are:
+
+    def orders(request):
+        return StreamingJsonResponse(
+            Order.objects.filter(customer=request.user)
+                 .values('id', 'total', 'shipped', 'customer__email')
+        )
+
+or with the `json_view` decorator, which streams a returned queryset and
+hands anything else to JsonResponse:
+
+    @json_view
+    def orders(request):
+        return Order.objects.values('id', 'total', 'shipped')
+
+Converters for the date, time, decimal and uuid columns are looked up once
+per response from the model fields, so each chunk is plain strings and
+numbers that the encoder serializes in one C call: ujson when it is
+installed (and JSON_STREAM_UJSON is on), the standard library's C encoder
+otherwise. The output matches DjangoJSONEncoder's, except that key order
+isn't kept and ujson writes floats with at most 15 decimal places.
+
+Without an order_by(), rows come in primary key order on databases other
+than postgres (read in keyset pages, as exports are). Ordered, sliced and
+grouped querysets are read through the cursor in their own order; on
+sqlite, which has no chunked reads, that holds every row's tuple in memory.
+`python manage.py jsonbench` compares it with the JsonResponse way.
+"""
+
+from __future__ import absolute_import
+
+from functools import wraps
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import QuerySet, ValuesQuerySet
+from django.http import JsonResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.utils import six
+from django.utils.timezone import is_aware
+
+from djeroku import export
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """
+    A JSON list of an object per row of `queryset`: the keys of a values()
+    queryset, or `fields` (every concrete field by default) of another.
+    """
+
+    def __init__(self, queryset, fields=None, chunk_size=None, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        fields = list(fields or queryset_fields(queryset))
+        converters = field_converters(queryset, fields)
+        super(StreamingJsonResponse, self).__init__(
+            json_chunks(
+                fields, iterate_rows(queryset, fields, chunk_size),
+                converters
+            ),
+            **kwargs
+        )
+
+
+def json_view(view):
+    """
+    Decorate a view returning a queryset (streamed with
+    StreamingJsonResponse), a response, or anything JsonResponse takes.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        result = view(request, *args, **kwargs)
+        if isinstance(result, HttpResponseBase):
+            return result
+        if isinstance(result, QuerySet):
+            return StreamingJsonResponse(result)
+        return JsonResponse(result, safe=False)
+    return wrapper
+
+
+def queryset_fields(queryset):
+    """The keys of the objects a queryset is written as."""
+    if isinstance(queryset, ValuesQuerySet):
+        return (
+            list(queryset.query.extra_select) + list(queryset.field_names) +
+            list(queryset.query.annotation_select)
+        )
+    return export.export_fields(queryset.model)
+
+
+# READING
+def iterate_rows(queryset, fields, chunk_size=None):
+    """Lists of up to `chunk_size` tuples of the `fields` of each row."""
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'JSON_STREAM_CHUNK_SIZE', 1000)
+    query = queryset.query
+    own_order = (
+        query.order_by or query.low_mark or query.high_mark is not None or
+        query.group_by is not None or query.distinct
+    )
+    if own_order and connections[queryset.db].vendor != 'postgresql':
+        # keyset pages would lose the ordering, slice or grouping
+        return export.cursor_chunks(queryset.values_list(*fields),
+                                    chunk_size)
+    return export.iterate_rows(queryset, fields, chunk_size)
+# END READING
+
+
+# ENCODING
+def json_chunks(fields, chunks, converters=None):
+    """
+    A JSON list of an object per row, a chunk of rows at a time.
+    `converters` has a function (or None) per field turning its non-null
+    values into something the encoder takes.
+    """
+    encode = get_encoder()
+    converted = [
+        (index, converter)
+        for index, converter in enumerate(converters or ())
+        if converter is not None
+    ]
+    separator = ''
+    yield '['
+    for rows in chunks:
+        if converted:
+            rows = [list(row) for row in rows]
+            for row in rows:
+                for index, converter in converted:
+                    value = row[index]
+                    if value is not None:
+                        row[index] = converter(value)
+        if rows:
+            # one encoder call per chunk, without its brackets
+            yield separator + encode(
+                [dict(zip(fields, row)) for row in rows]
+            )[1:-1]
+            separator = ','
+    yield ']'
+
+
+def get_encoder():
+    if ujson is not None and getattr(settings, 'JSON_STREAM_UJSON', True):
+        return _ujson_encode
+    return _encoder.encode
+
+
+def _ujson_encode(value):
+    return ujson.dumps(
+        value, ensure_ascii=False, double_precision=15,
+        escape_forward_slashes=False
+    )
+
+
+# without `default`, and escaping non-ASCII characters, the standard
+# library encodes with its C speedups
+_encoder = json.JSONEncoder(check_circular=False, separators=(',', ':'))
+
+
+def field_converters(queryset, fields):
+    """A converter (or None, for values the encoder takes) per field."""
+    converters = []
+    for field in fields:
+        kind = internal_type(queryset, field)
+        converters.append(
+            convert_any if kind is None else CONVERTERS.get(kind)
+        )
+    return converters
+
+
+def internal_type(queryset, name):
+    """
+    The internal type of the model field `name` (a values() lookup)
+    stands for, or None for an annotation or extra column.
+    """
+    if name in queryset.query.annotation_select or \
+            name in queryset.query.extra_select:
+        return None
+    opts = queryset.model._meta
+    field = None
+    for part in name.split(LOOKUP_SEP):
+        if part == 'pk':
+            field = opts.pk
+        else:
+            try:
+                field = opts.get_field(part)
+            except FieldDoesNotExist:
+                return None
+        if field.is_relation:
+            opts = field.related_model._meta
+            # a relation's value is the related row's key
+            field = opts.pk
+    return field.get_internal_type()
+
+
+# See DjangoJSONEncoder.default, whose output these match.
+def convert_datetime(value):
+    text = value.isoformat()
+    if value.microsecond:
+        text = text[:23] + text[26:]
+    if text.endswith('+00:00'):
+        text = text[:-6] + 'Z'
+    return text
+
+
+def convert_date(value):
+    return value.isoformat()
+
+
+def convert_time(value):
+    if is_aware(value):
+        raise ValueError("JSON can't represent timezone-aware times.")
+    text = value.isoformat()
+    if value.microsecond:
+        text = text[:12]
+    return text
+
+
+def convert_any(value):
+    """For columns without a model field, checked value by value."""
+    if isinstance(value, (six.string_types, six.integer_types, float)):
+        return value
+    converter = TYPE_CONVERTERS.get(type(value).__name__)
+    return converter(value) if converter else value
+
+
+CONVERTERS = {
+    'DateTimeField': convert_datetime,
+    'DateField': convert_date,
+    'TimeField': convert_time,
+    'DecimalField': str,
+    'UUIDField': str,
+}
+
+TYPE_CONVERTERS = {
+    'datetime': convert_datetime,
+    'date': convert_date,
+    'time': convert_time,
+    'Decimal': str,
+    'UUID': str,
+}
+# END ENCODING
@@ -0,0 +1,284 @@
+"""
+Cheaper language selection and localization.
+
+With USE_I18N and USE_L10N on, each number a template prints looks up three
+formats for the active language (`formats.number_format`), each date splits
+its format string with a regex, each {% trans %} goes through the active
+translation's chain of catalogs, and picking a request's language parses
+its Accept-Language header and checks the catalogs for every language
+listed. Most requests repeat the same few of each, so `install` (run at
+startup unless LOCALE_CACHE_SIZE is 0) puts bounded LRUs in front of them:
+
+- the decimal and thousand separators and grouping of each language
+- each date format, split into its directives and literal text once
+- each translated string, per active translation
+
+and `language_from_header` resolves each distinct Accept-Language header
+once. The output doesn't change; `python manage.py localebench` checks
+that, and times template rendering with and without the caches. The caches
+are cleared whenever a setting changes (override_settings in tests).
+
+`djeroku.middleware.LocaleMiddleware` uses `get_request_language` and
+only activates a translation for languages other than LANGUAGE_CODE's,
+which is the one in effect when none is. The `LocaleUpdateCacheMiddleware` and
+`LocaleFetchFromCacheMiddleware` pair caches whole pages like Django's
+cache middleware, but keyed by the language each Accept-Language header
+resolves to rather than the header itself, so the endless variations of
+"en-US,en;q=0.8" share one entry per language.
+"""
+
+from __future__ import absolute_import
+
+import copy
+from functools import wraps
+from itertools import count
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils import dateformat, formats, numberformat
+from django.utils.encoding import force_text
+from django.utils.translation import get_language, trans_real
+
+
+CACHE_SIZE = getattr(settings, 'LOCALE_CACHE_SIZE', 1000)
+
+_originals = {}
+
+
+class LRUCache(object):
+    """
+    A dict of at most `size` entries, dropping the least recently used
+    quarter of them when it is full. Reads take no lock, unlike
+    django.utils.lru_cache, whose bookkeeping costs as much as the lookups
+    cached here.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        # key: [value, when it was last used]
+        self._entries = {}
+        self._clock = count()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        entry[1] = next(self._clock)
+        return entry[0]
+
+    def set(self, key, value):
+        if len(self._entries) >= self.size:
+            self._evict()
+        self._entries[key] = [value, next(self._clock)]
+
+    def clear(self):
+        self._entries.clear()
+
+    def _evict(self):
+        with self._lock:
+            if len(self._entries) < self.size:
+                return
+            used = sorted(
+                self._entries.items(), key=lambda item: item[1][1]
+            )
+            for key, _ in used[:max(1, len(used) // 4)]:
+                self._entries.pop(key, None)
+
+
+def lru_cache(function):
+    """Cache `function` by its positional arguments in an LRUCache."""
+    if not CACHE_SIZE:
+        function.cache_clear = lambda: None
+        return function
+    cache = LRUCache(CACHE_SIZE)
+    missing = object()
+
+    @wraps(function)
+    def wrapper(*args):
+        value = cache.get(args, missing)
+        if value is missing:
+            value = function(*args)
+            cache.set(args, value)
+        return value
+    wrapper.cache_clear = cache.clear
+    return wrapper
+
+
+def install():
+    """Put the caches in front of Django's localization functions."""
+    if _originals:
+        return
+    for module, name, function in (
+            (formats, 'number_format', number_format),
+            (formats, 'date_format', date_format),
+            (formats, 'time_format', time_format),
+            (trans_real, 'do_translate', do_translate)):
+        _originals[module, name] = getattr(module, name)
+        setattr(module, name, function)
+    setting_changed.connect(clear_caches)
+
+
+def uninstall():
+    for (module, name), function in _originals.items():
+        setattr(module, name, function)
+    _originals.clear()
+    setting_changed.disconnect(clear_caches)
+    clear_caches()
+
+
+def clear_caches(**kwargs):
+    for function in (number_formats, compiled_format, _translate,
+                     language_from_header):
+        function.cache_clear()
+
+
+# LANGUAGE SELECTION
+def get_request_language(request):
+    """
+    The language `request` asks for, as Django's LocaleMiddleware picks it
+    (session, then language cookie, then Accept-Language), without
+    i18n_patterns url prefixes.
+    """
+    if hasattr(request, 'session'):
+        language = request.session.get(trans_real.LANGUAGE_SESSION_KEY)
+        if language is not None and language in trans_real.get_languages() \
+                and trans_real.check_for_language(language):
+            return language
+
+    language = request.COOKIES.get(settings.LANGUAGE_COOKIE_NAME)
+    if language is not None:
+        try:
+            return trans_real.get_supported_language_variant(language)
+        except LookupError:
+            pass
+
+    return language_from_header(request.META.get('HTTP_ACCEPT_LANGUAGE', ''))
+
+
+@lru_cache
+def language_from_header(accept_language):
+    for language, _ in trans_real.parse_accept_lang_header(accept_language):
+        if language == '*':
+            break
+        if not trans_real.language_code_re.search(language):
+            continue
+        try:
+            return trans_real.get_supported_language_variant(language)
+        except LookupError:
+            continue
+    try:
+        return trans_real.get_supported_language_variant(
+            settings.LANGUAGE_CODE
+        )
+    except LookupError:
+        return settings.LANGUAGE_CODE
+
+
+def default_language():
+    """LANGUAGE_CODE, as get_request_language resolves it."""
+    return language_from_header('')
+
+
+def cache_request(request):
+    """
+    A copy of `request` whose Accept-Language is the language it resolves
+    to, for the page cache key.
+    """
+    language = getattr(request, 'LANGUAGE_CODE', None)
+    if language is None:
+        language = get_request_language(request)
+    keyed = copy.copy(request)
+    keyed.META = dict(request.META, HTTP_ACCEPT_LANGUAGE=language)
+    return keyed
+# END LANGUAGE SELECTION
+
+
+# FORMATS
+def number_format(value, decimal_pos=None, use_l10n=None,
+                  force_grouping=False):
+    """formats.number_format, with the language's formats cached."""
+    separator, grouping, thousand_separator = number_formats(
+        _format_language(use_l10n), use_l10n
+    )
+    return numberformat.format(
+        value, separator, decimal_pos, grouping, thousand_separator,
+        force_grouping=force_grouping
+    )
+
+
+def date_format(value, format=None, use_l10n=None):
+    """formats.date_format, with the format compiled once."""
+    return _format(dateformat.DateFormat(value), compiled_format(
+        format or 'DATE_FORMAT', _format_language(use_l10n), use_l10n
+    ))
+
+
+def time_format(value, format=None, use_l10n=None):
+    """formats.time_format, with the format compiled once."""
+    return _format(dateformat.TimeFormat(value), compiled_format(
+        format or 'TIME_FORMAT', _format_language(use_l10n), use_l10n
+    ))
+
+
+@lru_cache
+def number_formats(language, use_l10n):
+    """(decimal separator, grouping, thousand separator) of a language."""
+    return tuple(
+        formats.get_format(name, language, use_l10n=use_l10n)
+        for name in ('DECIMAL_SEPARATOR', 'NUMBER_GROUPING',
+                     'THOUSAND_SEPARATOR')
+    )
+
+
+@lru_cache
+def compiled_format(format, language, use_l10n):
+    """
+    A date format (a format name like 'DATE_FORMAT', or a format string)
+    as (is directive, text) pairs, split as dateformat.Formatter splits it.
+    """
+    pieces = []
+    format_string = force_text(
+        formats.get_format(format, language, use_l10n=use_l10n)
+    )
+    for index, piece in enumerate(
+            dateformat.re_formatchars.split(format_string)):
+        if index % 2:
+            pieces.append((True, piece))
+        elif piece:
+            pieces.append((False, dateformat.re_escaped.sub(r'\1', piece)))
+    return tuple(pieces)
+
+
+def _format(formatter, pieces):
+    return ''.join([
+        force_text(getattr(formatter, piece)()) if directive else piece
+        for directive, piece in pieces
+    ])
+
+
+def _format_language(use_l10n):
+    if use_l10n or (use_l10n is None and settings.USE_L10N):
+        return get_language()
+    return None
+# END FORMATS
+
+
+# TRANSLATIONS
+def do_translate(message, translation_function):
+    """trans_real.do_translate, cached per active translation."""
+    return _translate(
+        getattr(trans_real._active, 'value', None), translation_function,
+        message, type(message)
+    )
+
+
+@lru_cache
+def _translate(translation, translation_function, message, message_type):
+    # `translation` is the one do_translate uses; `message_type` tells safe
+    # and byte strings apart from equal text
+    return _originals[trans_real, 'do_translate'](
+        message, translation_function
+    )
+# END TRANSLATIONS
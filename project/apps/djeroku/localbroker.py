@@ -0,0 +1,186 @@
+"""
+An in-process celery broker for development.
+
+CELERY_ALWAYS_EAGER runs each task inline, in the request that queued it,
+so queueing delay, tasks running alongside each other and the request, and
+arguments that don't serialize only show up on staging - and turning it
+off needs a redis server. With CELERY_LOCAL_BROKER (settings/dev.py) tasks
+go through kombu's in-memory transport instead, serialized with
+CELERY_TASK_SERIALIZER just as they are for redis, and CELERY_LOCAL_WORKERS
+threads in the same process (`manage.py runserver`, `fab web`, `manage.py
+shell`) run them the way a worker does:
+
+- not eagerly, so `self.request.is_eager` is False and retries, countdowns
+  and etas are queued again
+- CELERY_LOCAL_LATENCY seconds after they were queued, standing in for the
+  round trip to the broker
+- with the prerun/postrun signals and result backend of a real worker
+
+Each task's wait in the queue and run time are logged to
+`djeroku.localbroker`. The threads start when the first task is published,
+so processes that never queue a task never start them.
+"""
+
+from __future__ import absolute_import
+
+import atexit
+from datetime import datetime
+from heapq import heappop, heappush
+from itertools import count
+import logging
+import socket
+import threading
+from time import time
+
+from celery import current_app
+from celery.app.trace import build_tracer
+from celery.utils.timeutils import maybe_iso8601
+from django.conf import settings
+from django.db import close_old_connections
+
+
+logger = logging.getLogger('djeroku.localbroker')
+
+HOSTNAME = 'localbroker@%s' % socket.gethostname()
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def ensure_started(sender=None, **kwargs):
+    """before_task_publish receiver starting the broker's threads."""
+    global _broker
+    if _broker is not None:
+        return
+    with _broker_lock:
+        if _broker is None:
+            broker = LocalBroker(current_app._get_current_object())
+            broker.start()
+            _broker = broker
+
+
+class LocalBroker(object):
+    """
+    One thread consuming the in-memory queues, and `workers` threads running
+    the tasks it receives once they are due.
+    """
+
+    def __init__(self, app, workers=None, latency=None):
+        if workers is None:
+            workers = getattr(settings, 'CELERY_LOCAL_WORKERS', 2)
+        if latency is None:
+            latency = getattr(settings, 'CELERY_LOCAL_LATENCY', 0.005)
+        self.app = app
+        self.workers = workers
+        self.latency = latency
+        # (due, sequence, received, body, message), soonest first
+        self._due = []
+        self._sequence = count()
+        self._ready = threading.Condition()
+        self._tracers = {}
+        self._stopped = threading.Event()
+        self._consumer = None
+
+    def start(self):
+        queues = list(self.app.amqp.queues.consume_from.values())
+        self._consumer = threading.Thread(
+            target=self._consume, args=(queues,), name='localbroker'
+        )
+        threads = [self._consumer]
+        threads.extend(
+            threading.Thread(
+                target=self._work, name='localbroker-worker-%d' % (i + 1)
+            )
+            for i in range(self.workers)
+        )
+        for thread in threads:
+            # like an eager task, a queued one dies with the process
+            thread.daemon = True
+            thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop consuming, so the connection closes before exit."""
+        self._stopped.set()
+        if self._consumer is not None:
+            self._consumer.join(1)
+
+    # CONSUMING
+    def _consume(self, queues):
+        with self.app.connection() as connection:
+            consumer = connection.Consumer(
+                queues,
+                callbacks=[self._receive],
+                accept=self.app.conf.CELERY_ACCEPT_CONTENT,
+            )
+            with consumer:
+                while not self._stopped.is_set():
+                    try:
+                        connection.drain_events(timeout=0.2)
+                    except socket.timeout:
+                        pass
+
+    def _receive(self, body, message):
+        received = time()
+        due = received + self.latency
+        eta = maybe_iso8601(body.get('eta'))
+        if eta is not None:
+            wait = eta - datetime.now(eta.tzinfo)
+            due = max(due, received + wait.total_seconds())
+        with self._ready:
+            heappush(self._due, (
+                due, next(self._sequence), received, body, message
+            ))
+            self._ready.notify()
+    # END CONSUMING
+
+    # RUNNING
+    def _work(self):
+        while True:
+            with self._ready:
+                while not self._due or self._due[0][0] > time():
+                    self._ready.wait(
+                        self._due[0][0] - time() if self._due else None
+                    )
+                due, _, received, body, message = heappop(self._due)
+            self._run(received, body, message)
+
+    def _run(self, received, body, message):
+        name = body['task']
+        started = time()
+        task = self.app.tasks.get(name)
+        if task is None:
+            logger.error('Received unregistered task %s.', name)
+            message.ack()
+            return
+
+        request = dict(
+            body,
+            hostname=HOSTNAME,
+            is_eager=False,
+            delivery_info=message.delivery_info,
+        )
+        try:
+            result, info = self._tracer(name, task)(
+                body['id'], body.get('args', ()), body.get('kwargs', {}),
+                request
+            )
+        finally:
+            message.ack()
+            # what the worker's django fixup does after each task
+            close_old_connections()
+
+        logger.info(
+            '%s[%s] %s: waited %.1fms, ran %.1fms',
+            name, body['id'], info.state if info else 'SUCCESS',
+            (started - received) * 1000, (time() - started) * 1000
+        )
+
+    def _tracer(self, name, task):
+        if name not in self._tracers:
+            self._tracers[name] = build_tracer(
+                name, task,
+                loader=self.app.loader, hostname=HOSTNAME, app=self.app,
+            )
+        return self._tracers[name]
+    # END RUNNING
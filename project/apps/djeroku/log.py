@@ -0,0 +1,232 @@
+"""
+Logging handlers.
+
+`ErrorDigestHandler` replaces django's AdminEmailHandler, which sends mail
+synchronously inside the failing request - an error storm ties up every
+worker talking to the mail server. Instead:
+
+- `emit` only prepares the record and puts it on a bounded queue. When the
+  queue is full the record is dropped and counted.
+- a background listener thread de-duplicates records by fingerprint
+  (logger, exception type, where it was raised, message template) and
+  counts repeats.
+- every `interval` seconds the listener hands the aggregated errors to the
+  `djeroku.tasks.send_error_digest` celery task, which mails the admins a
+  single digest.
+- digests are throttled across every process sharing the `cache` (every
+  gunicorn worker on every dyno): a process only sends one after claiming
+  the interval with `cache.add`. A process that finds the interval taken
+  keeps aggregating and tries again an interval later.
+- at exit (a gunicorn worker recycled after max-requests, a management
+  command ending) the listener is stopped and whatever it has aggregated
+  is sent in a last digest - delayed by an interval when another process
+  holds the current one.
+
+Configure it in LOGGING like any other handler (see settings/common.py).
+"""
+
+from __future__ import absolute_import
+
+import atexit
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import threading
+import traceback
+from time import time
+import weakref
+
+from django.utils.encoding import force_bytes, force_text
+from django.utils.six.moves import queue
+
+from djeroku.utils import BackgroundThread
+
+
+logger = logging.getLogger('djeroku.log')
+
+DIGEST_LOCK_KEY = 'djeroku:error-digest'
+
+_handlers = weakref.WeakSet()
+
+
+def _stop_handlers():
+    for handler in list(_handlers):
+        handler.stop()
+
+
+# registered on import, so it runs before logging's own atexit shutdown and
+# before the interpreter tears down the modules the listeners use
+atexit.register(_stop_handlers)
+
+
+class ErrorDigestHandler(logging.Handler):
+
+    def __init__(self, level=logging.NOTSET, interval=60, buffer_size=1000,
+                 max_fingerprints=100, cache='default'):
+        logging.Handler.__init__(self, level)
+        self.interval = interval
+        self.max_fingerprints = max_fingerprints
+        self.cache = cache
+        self.buffer = queue.Queue(maxsize=buffer_size)
+        self.dropped = 0
+        self._pending = OrderedDict()
+        self._stopped = threading.Event()
+        self._listener = BackgroundThread(
+            self._run, 'djeroku-error-digest'
+        )
+        _handlers.add(self)
+
+    def emit(self, record):
+        try:
+            self.buffer.put_nowait(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+            return
+        self._listener.ensure_started()
+
+    def prepare(self, record):
+        """
+        Reduce a record to a plain, JSON serializable dict. Done in the
+        emitting thread so the queue never holds on to tracebacks (and the
+        frames and requests they reference).
+        """
+        exc_type = ''
+        location = '%s:%s' % (record.pathname, record.lineno)
+        formatted_traceback = ''
+        if record.exc_info and record.exc_info[0] is not None:
+            exc_type = record.exc_info[0].__name__
+            frames = traceback.extract_tb(record.exc_info[2])
+            if frames:
+                location = '%s:%s' % (frames[-1][0], frames[-1][1])
+            formatted_traceback = ''.join(
+                traceback.format_exception(*record.exc_info)
+            )
+
+        request = getattr(record, 'request', None)
+        request_line = ''
+        if hasattr(request, 'get_full_path'):
+            request_line = '%s %s' % (request.method, request.get_full_path())
+
+        key = '|'.join(
+            [record.name, exc_type, location, force_text(record.msg)]
+        )
+        return dict(
+            fingerprint=hashlib.md5(force_bytes(key)).hexdigest()[:16],
+            logger=record.name,
+            level=record.levelname,
+            message=force_text(record.getMessage()),
+            exception=exc_type,
+            location=location,
+            request=request_line,
+            traceback=force_text(formatted_traceback, errors='replace'),
+            count=1,
+            first_seen=record.created,
+            last_seen=record.created,
+        )
+
+    def aggregate(self, entry):
+        pending = self._pending.get(entry['fingerprint'])
+        if pending is not None:
+            pending['count'] += 1
+            pending['last_seen'] = entry['last_seen']
+        elif len(self._pending) < self.max_fingerprints:
+            self._pending[entry['fingerprint']] = entry
+        else:
+            self.dropped += 1
+
+    def stop(self, timeout=5):
+        """Stop the listener and send what it has aggregated."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._listener.is_running():
+            try:
+                # wake the listener up
+                self.buffer.put_nowait(None)
+            except queue.Full:
+                pass
+            self._listener.join(timeout)
+            if self._listener.is_running():
+                # still sending - the aggregated errors are its to touch
+                logger.warning(
+                    'error digest listener did not stop within %ss', timeout
+                )
+                return
+        while True:
+            try:
+                entry = self.buffer.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                self.aggregate(entry)
+        self.send_digest(final=True)
+
+    def close(self):
+        self.stop()
+        logging.Handler.close(self)
+
+    def claim_interval(self):
+        """
+        Claim the current interval's digest across every process sharing
+        the cache. True without a cache, or when it can't be reached.
+        """
+        if self.cache is None:
+            return True
+        from django.core.cache import caches
+        try:
+            return caches[self.cache].add(
+                DIGEST_LOCK_KEY, os.getpid(), self.interval
+            )
+        except Exception as e:
+            logger.warning('could not claim the error digest interval: %s', e)
+            return True
+
+    def send_digest(self, final=False):
+        """
+        Queue a digest of the aggregated errors. When another process has
+        sent one this interval they are kept for the next try, except for
+        the `final` digest, which is queued to go out an interval later.
+        """
+        if not self._pending and not self.dropped:
+            return
+        countdown = None
+        if not self.claim_interval():
+            if not final:
+                return
+            countdown = self.interval
+
+        entries = list(self._pending.values())
+        dropped, self.dropped = self.dropped, 0
+        self._pending = OrderedDict()
+
+        from djeroku.tasks import send_error_digest
+        try:
+            send_error_digest.apply_async(
+                (entries, dropped), countdown=countdown
+            )
+        except Exception:
+            # the broker is down too - nothing left to tell but the log
+            logger.exception(
+                'could not queue error digest (%d errors)', len(entries)
+            )
+
+    def _run(self):
+        next_digest = time() + self.interval
+        while not self._stopped.is_set():
+            try:
+                entry = self.buffer.get(
+                    timeout=max(0.0, next_digest - time())
+                )
+            except queue.Empty:
+                pass
+            else:
+                if entry is None:
+                    break
+                self.aggregate(entry)
+
+            if time() >= next_digest:
+                self.send_digest()
+                next_digest = time() + self.interval
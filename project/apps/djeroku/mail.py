@@ -0,0 +1,213 @@
+"""
+Celery email backend.
+
+With EMAIL_BACKEND = 'djeroku.mail.CeleryEmailBackend', `send_mail` and
+friends return as soon as the messages are queued. Messages are grouped
+into batches of EMAIL_QUEUE_BATCH_SIZE and sent by the
+`djeroku.tasks.send_emails` task, which delivers each batch through
+EMAIL_QUEUE_BACKEND (the real backend, eg SMTP) over a connection borrowed
+from a per-process pool. Pooled connections stay open between batches, so
+a busy worker does one TLS handshake and login every
+EMAIL_QUEUE_CONNECTION_MAX_AGE seconds rather than one per message.
+
+Messages travel through the broker as plain dicts, so they work with the
+json task serializer.
+"""
+
+from __future__ import absolute_import
+
+import base64
+from contextlib import contextmanager
+from email import message_from_string
+from email.message import Message
+from email.mime.base import MIMEBase
+import threading
+from time import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils import six
+
+
+class CeleryEmailBackend(BaseEmailBackend):
+
+    def send_messages(self, email_messages):
+        from djeroku.tasks import send_emails
+
+        if not email_messages:
+            return 0
+
+        batch_size = getattr(settings, 'EMAIL_QUEUE_BATCH_SIZE', 50)
+        messages = [serialize_message(m) for m in email_messages]
+        try:
+            for start in range(0, len(messages), batch_size):
+                send_emails.delay(messages[start:start + batch_size])
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(messages)
+
+
+# SERIALIZATION
+def serialize_message(message):
+    """An EmailMessage as a json serializable dict."""
+    attachments = []
+    for attachment in message.attachments:
+        if isinstance(attachment, MIMEBase):
+            attachments.append({'mime': attachment.as_string()})
+            continue
+        filename, content, mimetype = attachment
+        if isinstance(content, six.text_type):
+            attachments.append(
+                {'filename': filename, 'text': content, 'mimetype': mimetype}
+            )
+        else:
+            attachments.append({
+                'filename': filename,
+                'base64': base64.b64encode(content).decode('ascii'),
+                'mimetype': mimetype,
+            })
+
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': list(message.to),
+        'cc': list(message.cc),
+        'bcc': list(message.bcc),
+        'reply_to': list(message.reply_to),
+        'headers': dict(message.extra_headers),
+        'alternatives': [
+            list(alternative)
+            for alternative in getattr(message, 'alternatives', [])
+        ],
+        'attachments': attachments,
+        'content_subtype': message.content_subtype,
+        'mixed_subtype': message.mixed_subtype,
+        'encoding': message.encoding,
+    }
+
+
+def deserialize_message(data):
+    """Rebuild the message serialized by `serialize_message`."""
+    message = EmailMultiAlternatives(
+        subject=data['subject'],
+        body=data['body'],
+        from_email=data['from_email'],
+        to=data['to'],
+        cc=data['cc'],
+        bcc=data['bcc'],
+        reply_to=data['reply_to'],
+        headers=data['headers'],
+        alternatives=[tuple(a) for a in data['alternatives']],
+    )
+    message.content_subtype = data['content_subtype']
+    message.mixed_subtype = data['mixed_subtype']
+    message.encoding = data['encoding']
+
+    for attachment in data['attachments']:
+        if 'mime' in attachment:
+            # EmailMessage.attach only takes MIMEBase instances
+            message.attach(message_from_string(
+                attachment['mime'], _class=ParsedMIMEBase
+            ))
+        elif 'text' in attachment:
+            message.attach(
+                attachment['filename'], attachment['text'],
+                attachment['mimetype']
+            )
+        else:
+            message.attach(
+                attachment['filename'],
+                base64.b64decode(attachment['base64']),
+                attachment['mimetype']
+            )
+    return message
+
+
+class ParsedMIMEBase(MIMEBase):
+    """A MIMEBase the email parser can build, part by part."""
+
+    def __init__(self, *args, **kwargs):
+        Message.__init__(self, *args, **kwargs)
+# END SERIALIZATION
+
+
+# CONNECTION POOL
+class ConnectionPool(object):
+    """
+    Keeps open email backend connections for reuse between batches.
+    Connections older than `max_age` seconds are closed and replaced, so
+    idle connections the server has timed out don't linger.
+    """
+
+    def __init__(self, backend=None, max_age=300, **kwargs):
+        self.backend = backend
+        self.max_age = max_age
+        self.kwargs = kwargs
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        connection, opened = self._acquire()
+        try:
+            yield connection
+        finally:
+            with self._lock:
+                self._idle.append((connection, opened))
+
+    def _acquire(self):
+        now = time()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, opened = self._idle.pop()
+            if now - opened < self.max_age:
+                return connection, opened
+            close_quietly(connection)
+
+        connection = get_connection(self.backend, **self.kwargs)
+        return connection, now
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, opened in idle:
+            close_quietly(connection)
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+_pool = None
+
+
+def get_connection_pool():
+    """The process wide pool of EMAIL_QUEUE_BACKEND connections."""
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(
+            backend=getattr(
+                settings, 'EMAIL_QUEUE_BACKEND',
+                'django.core.mail.backends.smtp.EmailBackend'
+            ),
+            max_age=getattr(settings, 'EMAIL_QUEUE_CONNECTION_MAX_AGE', 300),
+        )
+    return _pool
+
+
+def close_connection_pool():
+    """Close every pooled connection. The next batch builds a new pool."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+# END CONNECTION POOL
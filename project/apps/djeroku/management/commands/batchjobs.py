@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from djeroku.batches import resume
+from djeroku.models import BatchChunk, BatchJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Show the progress of djeroku.batches jobs, or resume an unfinished '
+        'one after its workers were restarted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--resume', metavar='NAME',
+            help='Resume the named job, dispatching its lost chunks again.'
+        )
+        parser.add_argument(
+            '--stale-after', type=int, default=None,
+            help='With --resume, dispatch again the chunks in flight for '
+                 'longer than this many seconds (default '
+                 'settings.BATCH_CHUNK_TIMEOUT, 0 for all of them).'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help='Number of jobs to show, newest first (default 20).'
+        )
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                job = resume(options['resume'], options['stale_after'])
+            except BatchJob.DoesNotExist:
+                raise CommandError('No batch job named %r.' % (
+                    options['resume']))
+            self.stdout.write('Resumed %s.' % job.name)
+            return
+
+        jobs = BatchJob.objects.all()[:options['limit']]
+        if not jobs:
+            self.stdout.write('No batch jobs.')
+            return
+        for job in jobs:
+            in_flight = job.chunks.filter(
+                status=BatchChunk.DISPATCHED
+            ).count()
+            pending = job.chunks.filter(status=BatchChunk.PENDING).count()
+            percent = ''
+            if job.total:
+                percent = ' (%.0f%%)' % (100.0 * job.rows_done / job.total)
+            self.stdout.write(
+                '%s  %s  %d of %s rows%s  chunks: %d done, %d failed, '
+                '%d in flight, %d pending  updated %s' % (
+                    job.name, job.status, job.rows_done, job.total, percent,
+                    job.chunks_done, job.chunks_failed, in_flight, pending,
+                    job.updated.strftime('%Y-%m-%d %H:%M:%S')
+                )
+            )
@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from djeroku.bench import (
+    Gunicorn, Result, bench_http, bench_wsgi, compare, current_rss,
+    load_baseline, login_cookie, save_baseline, test_databases
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the WSGI stack with the urls in BENCHMARK_URLS, '
+        'in-process and through a local gunicorn, on throwaway test '
+        'databases, and compare the results with the saved baseline. Exits '
+        'with an error on a regression.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Requests per url and mode (default 200).'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Concurrent clients (default 4).'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Unmeasured requests per url before each run (default 10).'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Gunicorn worker processes (default 2).'
+        )
+        parser.add_argument(
+            '--no-gunicorn', action='store_true', default=False,
+            help='Only run the in-process benchmarks.'
+        )
+        parser.add_argument(
+            '--baseline', default=settings.BENCHMARK_BASELINE,
+            help='Baseline file (default settings.BENCHMARK_BASELINE).'
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true', default=False,
+            help='Save these results as the new baseline.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=settings.BENCHMARK_TOLERANCE,
+            help='Allowed fractional slowdown before a run fails.'
+        )
+
+    def handle(self, *args, **options):
+        with test_databases():
+            results = self.measure(options)
+        self.report(results)
+
+        if options['save_baseline']:
+            save_baseline(options['baseline'], results)
+            self.stdout.write('Saved baseline to %s' % options['baseline'])
+            return
+
+        regressions = compare(
+            results, load_baseline(options['baseline']), options['tolerance']
+        )
+        if regressions:
+            raise CommandError(
+                'Benchmark regressions:\n  ' + '\n  '.join(regressions)
+            )
+
+    def measure(self, options):
+        scenarios = settings.BENCHMARK_URLS
+        cookie = None
+        if any(login for name, path, login in scenarios):
+            cookie = login_cookie()
+
+        run = dict(
+            count=options['requests'],
+            concurrency=options['concurrency'],
+            warmup=options['warmup'],
+        )
+        results = []
+
+        application = import_string(settings.WSGI_APPLICATION)
+        for name, path, login in scenarios:
+            latencies, errors, seconds, queries = bench_wsgi(
+                application, path, cookie if login else None, **run
+            )
+            results.append(Result(
+                'wsgi', name, latencies, errors, seconds, queries,
+                current_rss()
+            ))
+
+        if options['no_gunicorn']:
+            pass
+        elif not Gunicorn.available():
+            self.stdout.write(
+                'gunicorn is not installed - skipping the gunicorn '
+                'benchmarks (pip install -r reqs/prod.txt)'
+            )
+        else:
+            server = Gunicorn(options['workers'])
+            server.start()
+            try:
+                for name, path, login in scenarios:
+                    latencies, errors, seconds, queries = bench_http(
+                        server.port, path, cookie if login else None, **run
+                    )
+                    results.append(Result(
+                        'gunicorn', name, latencies, errors, seconds,
+                        rss=server.rss()
+                    ))
+            finally:
+                server.stop()
+        return results
+
+    def report(self, results):
+        row = '%-9s %-24s %9s %8s %8s %8s %8s %8s'
+        self.stdout.write(row % (
+            'mode', 'url', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'queries',
+            'RSS MB'
+        ))
+        for result in results:
+            self.stdout.write(row % (
+                result.mode,
+                result.name[:24],
+                '%.1f' % result.rps,
+                '%.1f' % (result.percentile(50) * 1000),
+                '%.1f' % (result.percentile(90) * 1000),
+                '%.1f' % (result.percentile(99) * 1000),
+                '-' if result.queries is None else '%.1f' % result.queries,
+                '-' if result.rss is None else '%.1f' % (result.rss / 1e6),
+            ))
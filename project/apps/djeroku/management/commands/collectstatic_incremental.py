@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from djeroku.staticfiles import IncrementalCollector, default_ignore_patterns
+
+
+class Command(BaseCommand):
+    help = (
+        'Collect static files into STATIC_ROOT, copying and post processing '
+        'only the files whose content changed since the last run, in '
+        'parallel, and removing files whose source is gone.'
+    )
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Worker processes (default one per CPU).'
+        )
+        parser.add_argument(
+            '--no-post-process', action='store_false', dest='post_process',
+            default=True,
+            help='Skip the content-hashed and gzipped copies.'
+        )
+        parser.add_argument(
+            '-i', '--ignore', action='append', default=[],
+            dest='ignore_patterns', metavar='PATTERN',
+            help='Also ignore files matching this glob-style pattern.'
+        )
+
+    def handle(self, *args, **options):
+        collector = IncrementalCollector(
+            workers=options['workers'],
+            post_process=options['post_process'],
+            ignore_patterns=(
+                default_ignore_patterns() + options['ignore_patterns']
+            ),
+        )
+        result = collector.collect()
+
+        if options['verbosity'] > 1:
+            for path in result['processed']:
+                self.stdout.write('Processed %s' % path)
+            for path in result['removed']:
+                self.stdout.write('Removed %s' % path)
+
+        if options['verbosity'] < 1:
+            return
+        self.stdout.write(
+            '%d processed, %d skipped, %d removed in %.2fs (%s)' % (
+                len(result['processed']),
+                len(result['skipped']),
+                len(result['removed']),
+                sum(collector.timings.values()),
+                ', '.join(
+                    '%s %.2fs' % item for item in collector.timings.items()
+                ),
+            )
+        )
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import random
+import resource
+
+from django.core.management.base import BaseCommand
+from django.utils.html import escape
+
+from djeroku.compression import (
+    BrotliEncoder, GzipEncoder, brotli, weak_etag
+)
+
+
+SIZES = (1024, 10 * 1024, 100 * 1024, 1024 * 1024)
+
+# read by the streaming measurement, like a streaming export's chunks
+CHUNK_SIZE = 8 * 1024
+
+WORDS = (
+    'order customer invoice shipped pending refunded total discount line '
+    'item product warehouse address street city priority express standard'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the bytes saved and CPU time per response of the '
+        'compression and ETags used by djeroku.middleware, for HTML and '
+        'JSON bodies of several sizes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seconds', type=float, default=0.2,
+            help='Minimum CPU seconds to spend on each measurement.'
+        )
+
+    def handle(self, *args, **options):
+        self.seconds = options['seconds']
+        encoders = [GzipEncoder(level) for level in (1, 6, 9)]
+        if brotli is not None:
+            encoders.extend(BrotliEncoder(quality) for quality in (1, 4, 11))
+        else:
+            self.stdout.write('brotli is not installed, measuring gzip only')
+
+        self.stdout.write('%-5s %7s  %-10s %9s %7s %10s %9s' % (
+            'body', 'size', 'encoding', 'bytes', 'saved', 'cpu/resp',
+            'MB/s'
+        ))
+        for kind, make_body in (('html', html_body), ('json', json_body)):
+            for size in SIZES:
+                body = make_body(size)
+                for encoder in encoders:
+                    self.measure(kind, body, encoder)
+                self.measure_streaming(kind, body, encoders[1])
+                self.measure_etags(kind, body)
+
+    def measure(self, kind, body, encoder):
+        compressed = encoder.compress(body)
+        seconds = self.cpu_per_call(lambda: encoder.compress(body))
+        self.row(kind, body, self.label(encoder), len(compressed), seconds)
+
+    def measure_streaming(self, kind, body, encoder):
+        """The cost of flushing after every chunk of a streaming body."""
+        chunks = [
+            body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)
+        ]
+
+        def compress():
+            return b''.join(encoder.compress_chunks(chunks))
+        compressed = compress()
+        seconds = self.cpu_per_call(compress)
+        self.row(kind, body, self.label(encoder) + '/8K', len(compressed),
+                 seconds)
+
+    def measure_etags(self, kind, body):
+        for label, function in (
+                ('etag crc32', lambda: weak_etag(body)),
+                ('etag md5', lambda: hashlib.md5(body).hexdigest())):
+            seconds = self.cpu_per_call(function)
+            self.row(kind, body, label, None, seconds)
+
+    def cpu_per_call(self, function):
+        calls = 0
+        start = cpu_time()
+        while True:
+            function()
+            calls += 1
+            elapsed = cpu_time() - start
+            if elapsed >= self.seconds:
+                return elapsed / calls
+
+    def label(self, encoder):
+        if encoder.name == 'gzip':
+            return 'gzip-%d' % encoder.level
+        return 'br-%d' % encoder.quality
+
+    def row(self, kind, body, label, size, seconds):
+        self.stdout.write('%-5s %6.0fK  %-10s %9s %7s %8.3fms %9.1f' % (
+            kind,
+            len(body) / 1024.0,
+            label,
+            size if size is not None else '',
+            '%.0f%%' % (100.0 - 100.0 * size / len(body))
+            if size is not None else '',
+            seconds * 1000,
+            len(body) / seconds / 1e6,
+        ))
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def html_body(size):
+    """A changelist-like page of about `size` bytes."""
+    rng = random.Random(size)
+    rows = []
+    length = 0
+    while length < size:
+        row = (
+            '<tr class="row%d"><td><a href="/admin/shop/order/%d/">%s</a>'
+            '</td><td>%s</td><td class="num">%d.%02d</td><td>%s</td></tr>\n'
+        ) % (
+            len(rows) % 2 + 1, rng.randint(1, 10 ** 6),
+            escape(' '.join(rng.sample(WORDS, 3))),
+            '%s@example.com' % rng.choice(WORDS),
+            rng.randint(0, 9999), rng.randint(0, 99),
+            '2015-%02d-%02d' % (rng.randint(1, 12), rng.randint(1, 28)),
+        )
+        rows.append(row)
+        length += len(row)
+    body = (
+        '<!DOCTYPE html><html><head><title>Orders</title></head><body>'
+        '<table id="result_list">\n%s</table></body></html>'
+    ) % ''.join(rows)
+    return body[:size].encode('utf-8')
+
+
+def json_body(size):
+    """An api-like list of objects of about `size` bytes."""
+    rng = random.Random(size)
+    objects = []
+    length = 0
+    while length < size:
+        obj = {
+            'id': rng.randint(1, 10 ** 6),
+            'customer': '%s@example.com' % rng.choice(WORDS),
+            'status': rng.choice(WORDS),
+            'total': '%d.%02d' % (rng.randint(0, 9999), rng.randint(0, 99)),
+            'items': [rng.randint(1, 5000) for _ in range(rng.randint(1, 4))],
+        }
+        objects.append(obj)
+        length += len(json.dumps(obj)) + 2
+    return json.dumps(objects)[:size].encode('utf-8')
@@ -0,0 +1,129 @@
+import csv
+import gc
+import os
+import shutil
+import tempfile
+from time import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+from django.utils import timezone
+
+from djeroku.bench import current_rss
+from djeroku.export import Echo, csv_cell, export_response
+from djeroku.models import SlowQuery
+
+
+FIELDS = ['id', 'created', 'database', 'fingerprint', 'sql', 'duration']
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure memory and throughput of a streaming CSV export '
+        '(djeroku.export) versus building the whole export in memory, over '
+        'a throwaway test database filled with fixture rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1000000,
+            help='Fixture rows to export (default 1000000).'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Rows per chunk (default settings.EXPORT_CHUNK_SIZE).'
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database whose test database to use (default "default").'
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        temp_dir = None
+        if connection.vendor == 'sqlite':
+            # a file, so the rows aren't counted in this process's memory
+            temp_dir = tempfile.mkdtemp()
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                temp_dir, 'exportbench.db'
+            )
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            self.create_fixture(options['rows'])
+            self.run(SlowQuery.objects.using(connection.alias), options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if temp_dir is not None:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def create_fixture(self, count):
+        start = time()
+        now = timezone.now()
+        batch_size = 5000
+        for offset in range(0, count, batch_size):
+            SlowQuery.objects.bulk_create([
+                SlowQuery(
+                    created=now,
+                    database='default',
+                    fingerprint='%016x' % (i % 500),
+                    sql='SELECT * FROM "orders" WHERE "id" = %d' % i,
+                    duration=0.2 + (i % 1000) / 1000.0,
+                )
+                for i in range(offset, min(offset + batch_size, count))
+            ])
+        self.stdout.write('Created %d fixture rows in %.1fs' % (
+            count, time() - start
+        ))
+
+    def run(self, queryset, options):
+        self.report('streaming', *self.measure_streaming(
+            queryset, options['chunk_size']
+        ))
+        self.report('in memory', *self.measure_in_memory(queryset))
+
+    def measure_streaming(self, queryset, chunk_size):
+        gc.collect()
+        baseline = peak = current_rss()
+        start = time()
+        response = export_response(queryset, FIELDS, chunk_size=chunk_size)
+        size = 0
+        for index, chunk in enumerate(response.streaming_content):
+            size += len(chunk)
+            if index % 20 == 0:
+                peak = max(peak, current_rss())
+        seconds = time() - start
+        peak = max(peak, current_rss())
+        return queryset.count(), seconds, size, peak - baseline
+
+    def measure_in_memory(self, queryset):
+        """An HttpResponse built from every row, the usual way."""
+        gc.collect()
+        baseline = current_rss()
+        start = time()
+        writer = csv.writer(Echo())
+        rows = list(queryset.values_list(*FIELDS))
+        content = [writer.writerow(FIELDS)]
+        content.extend(
+            writer.writerow([csv_cell(value) for value in row])
+            for row in rows
+        )
+        response = HttpResponse(''.join(content), content_type='text/csv')
+        seconds = time() - start
+        peak = current_rss()
+        count, size = len(rows), len(response.content)
+        del rows, content, response
+        return count, seconds, size, peak - baseline
+
+    def report(self, label, rows, seconds, size, memory):
+        self.stdout.write(
+            '%-16s %d rows in %.2fs (%.0f rows/s), %.1fMB written, '
+            'memory +%.1fMB' % (
+                label, rows, seconds, rows / seconds if seconds else 0,
+                size / 1e6, memory / 1e6
+            )
+        )
@@ -0,0 +1,84 @@
+import gc
+from time import time
+
+from django.db import DEFAULT_DB_ALIAS
+from django.http import JsonResponse
+from django.test.utils import override_settings
+
+from djeroku import jsonstream
+from djeroku.bench import current_rss
+from djeroku.export import export_response
+from djeroku.jsonstream import StreamingJsonResponse
+from djeroku.management.commands import exportbench
+
+
+class Command(exportbench.Command):
+    help = (
+        'Measure memory and throughput of StreamingJsonResponse '
+        '(djeroku.jsonstream), with ujson when it is installed and the '
+        'standard library encoder, against a streaming JSON export and a '
+        'JsonResponse of the whole values() list, over a throwaway test '
+        'database filled with fixture rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=200000,
+            help='Fixture rows to serialize (default 200000).'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Rows per chunk (default settings.JSON_STREAM_CHUNK_SIZE).'
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database whose test database to use (default "default").'
+        )
+
+    def run(self, queryset, options):
+        queryset = queryset.values(*exportbench.FIELDS)
+        chunk_size = options['chunk_size']
+        rows = queryset.count()
+
+        def streaming():
+            return StreamingJsonResponse(queryset, chunk_size=chunk_size)
+
+        # least memory first, since memory isn't always given back
+        if jsonstream.ujson is not None:
+            with override_settings(JSON_STREAM_UJSON=True):
+                self.report('streaming ujson',
+                            rows, *self.measure(streaming))
+        else:
+            self.stdout.write('ujson is not installed, skipping it')
+        with override_settings(JSON_STREAM_UJSON=False):
+            self.report('streaming json', rows, *self.measure(streaming))
+        self.report('export json', rows, *self.measure(
+            lambda: export_response(
+                queryset, exportbench.FIELDS, format='json',
+                chunk_size=chunk_size
+            )
+        ))
+        self.report('JsonResponse', rows, *self.measure(
+            lambda: JsonResponse(list(queryset), safe=False)
+        ))
+
+    def measure(self, make_response):
+        """Seconds, bytes and memory to make and write out a response."""
+        gc.collect()
+        baseline = current_rss()
+        start = time()
+        response = make_response()
+        peak = current_rss()
+        if response.streaming:
+            content = response.streaming_content
+        else:
+            content = [response.content]
+        size = 0
+        for index, chunk in enumerate(content):
+            size += len(chunk)
+            if index % 20 == 0:
+                peak = max(peak, current_rss())
+        seconds = time() - start
+        peak = max(peak, current_rss())
+        del response, content
+        return seconds, size, peak - baseline
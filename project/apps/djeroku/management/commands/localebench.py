@@ -0,0 +1,139 @@
+import datetime
+from decimal import Decimal
+from time import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.test import RequestFactory
+from django.utils import timezone, translation
+
+from djeroku import l10n
+
+
+# a changelist-like table: numbers, dates and translated labels in each row
+TEMPLATE = '''{% load i18n %}<table>
+<tr><th>{% trans "Order" %}</th><th>{% trans "Date" %}</th>
+<th>{% trans "Total" %}</th><th>{% trans "Items" %}</th></tr>
+{% for row in rows %}<tr>
+<td>{% trans "Order" %} {{ row.id }}</td>
+<td>{{ row.created }}</td>
+<td>{{ row.created|date:"SHORT_DATE_FORMAT" }} {{ row.created|time }}</td>
+<td>{{ row.total }}</td>
+<td>{{ row.ratio|floatformat:2 }}</td>
+<td>{% blocktrans count items=row.items %}{{ items }} item{% plural %}\
+{{ items }} items{% endblocktrans %}</td>
+</tr>{% endfor %}</table>'''
+
+ACCEPT_LANGUAGES = (
+    'en-US,en;q=0.9',
+    'en-GB,en-US;q=0.9,en;q=0.8',
+    'en-us',
+    'de-DE,de;q=0.9,en-US;q=0.8,en;q=0.7',
+    'fr-FR,fr;q=0.9,en;q=0.5',
+    '',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Time template rendering with numbers, dates and translations, and '
+        'picking a request\'s language, with and without the caches of '
+        'djeroku.l10n, and check that the output is the same.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=200,
+            help='Table rows in the template (default 200).'
+        )
+        parser.add_argument(
+            '--seconds', type=float, default=1.0,
+            help='Minimum seconds to spend on each measurement.'
+        )
+        parser.add_argument(
+            '--languages', default='%s,de' % settings.LANGUAGE_CODE,
+            help='Comma separated languages to render in (default the '
+                 'LANGUAGE_CODE and de).'
+        )
+
+    def handle(self, *args, **options):
+        self.seconds = options['seconds']
+        template = engines['django'].from_string(TEMPLATE)
+        context = {'rows': rows(options['rows'])}
+        installed = bool(l10n._originals)
+
+        self.stdout.write('%-22s %12s %12s %7s  %s' % (
+            'measurement', 'without', 'with', 'saved', 'same output'
+        ))
+        try:
+            for language in options['languages'].split(','):
+                with translation.override(language):
+                    self.compare(
+                        'render %s (%d rows)' % (language, options['rows']),
+                        lambda: template.render(context), 'ms', 1000
+                    )
+
+            factory = RequestFactory()
+            requests = [
+                factory.get('/', HTTP_ACCEPT_LANGUAGE=header)
+                for header in ACCEPT_LANGUAGES
+            ]
+            for request in requests:
+                # as LocaleMiddleware sees them, after SessionMiddleware
+                request.session = {}
+            self.compare(
+                'pick language', lambda: [
+                    translation.get_language_from_request(request)
+                    for request in requests
+                ],
+                'us', 1e6 / len(requests),
+                cached=lambda: [
+                    l10n.get_request_language(request)
+                    for request in requests
+                ]
+            )
+        finally:
+            if installed:
+                l10n.install()
+            else:
+                l10n.uninstall()
+
+    def compare(self, label, function, unit, scale, cached=None):
+        """Time `function` without and with the caches."""
+        l10n.uninstall()
+        before = function()
+        without = self.per_call(function)
+        l10n.install()
+        cached = cached or function
+        after = cached()
+        with_caches = self.per_call(cached)
+        self.stdout.write('%-22s %10.2f%s %10.2f%s %6.0f%%  %s' % (
+            label, without * scale, unit, with_caches * scale, unit,
+            100.0 - 100.0 * with_caches / without,
+            'yes' if before == after else 'NO'
+        ))
+
+    def per_call(self, function):
+        calls = 0
+        start = time()
+        while True:
+            function()
+            calls += 1
+            elapsed = time() - start
+            if elapsed >= self.seconds:
+                return elapsed / calls
+
+
+def rows(count):
+    now = timezone.now()
+    return [
+        dict(
+            id=i,
+            created=now - datetime.timedelta(hours=i),
+            total=Decimal('12.50') * i,
+            ratio=i / 3.0,
+            items=i % 7,
+        )
+        for i in range(count)
+    ]
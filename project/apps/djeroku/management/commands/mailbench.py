@@ -0,0 +1,127 @@
+import asyncore
+import smtpd
+import threading
+from time import sleep, time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from djeroku.mail import close_connection_pool, serialize_message
+from djeroku.tasks import send_emails
+
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+
+class StandInSMTPServer(smtpd.SMTPServer):
+    """
+    Accepts and discards every message. Each new connection waits
+    `connect_latency` seconds first, standing in for the TCP + TLS + login
+    round trips of a real mail server.
+    """
+
+    def __init__(self, connect_latency):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None)
+        self.connect_latency = connect_latency
+        self.received = 0
+
+    @property
+    def port(self):
+        return self.socket.getsockname()[1]
+
+    def handle_accept(self):
+        sleep(self.connect_latency)
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        self.received += 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure email throughput against a local SMTP stand-in: one '
+        'connection per message (the plain SMTP backend, as send_mail does '
+        'in a view) versus pooled batches (djeroku.tasks.send_emails).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages', type=int, default=200,
+            help='Messages to send with each approach (default 200).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Messages per send_emails batch (default 50).'
+        )
+        parser.add_argument(
+            '--connect-latency', type=float, default=50,
+            help='Milliseconds the stand-in waits on each new connection '
+                 '(default 50).'
+        )
+
+    def handle(self, *args, **options):
+        server = StandInSMTPServer(options['connect_latency'] / 1000.0)
+        loop = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.1})
+        loop.daemon = True
+        loop.start()
+
+        count = options['messages']
+        batch_size = options['batch_size']
+        messages = [
+            EmailMessage(
+                'Benchmark message %d' % i, 'Hello from djeroku.',
+                'bench@example.com', ['someone@example.com']
+            )
+            for i in range(count)
+        ]
+        smtp_settings = override_settings(
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=server.port,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            EMAIL_QUEUE_BACKEND=SMTP_BACKEND,
+        )
+
+        with smtp_settings:
+            start = time()
+            for message in messages:
+                get_connection(SMTP_BACKEND).send_messages([message])
+            direct = time() - start
+
+            start = time()
+            serialized = [serialize_message(m) for m in messages]
+            serialize = time() - start
+
+            close_connection_pool()
+            start = time()
+            for i in range(0, count, batch_size):
+                send_emails.apply(args=(serialized[i:i + batch_size],)).get()
+            pooled = time() - start
+            close_connection_pool()
+
+        server.close()
+
+        self.stdout.write(
+            '%d messages, %.0fms connection latency' % (
+                count, options['connect_latency']
+            )
+        )
+        self.stdout.write(
+            'one connection per message: %7.2fs %9.1f messages/s' % (
+                direct, count / direct
+            )
+        )
+        self.stdout.write(
+            'pooled batches of %-9d %7.2fs %9.1f messages/s' % (
+                batch_size, pooled, count / pooled
+            )
+        )
+        self.stdout.write(
+            'queueing cost in the request: %.3fms per message' % (
+                serialize * 1000 / count
+            )
+        )
+        self.stdout.write('delivered to stand-in: %d' % server.received)
@@ -0,0 +1,132 @@
+import sys
+from time import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.six.moves import input
+
+from djeroku import warmup
+from djeroku.schema import MigrationState
+from djeroku.staticfiles import IncrementalCollector
+
+
+class Command(BaseCommand):
+    help = (
+        'Run every release step - migrate (skipped when the applied '
+        'migrations already match the code), collectstatic_incremental and '
+        'warming the cache - in one process, reporting how long each step '
+        'took.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--noinput', action='store_false', dest='interactive',
+            default=True,
+            help='Do not prompt to create a superuser.'
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to migrate (default "default").'
+        )
+        parser.add_argument(
+            '--force-migrate', action='store_true', default=False,
+            help='Run migrate even if the migrations are up to date.'
+        )
+        parser.add_argument(
+            '--skip-static', action='store_true', default=False,
+            help='Do not collect static files.'
+        )
+        parser.add_argument(
+            '--skip-warmup', action='store_true', default=False,
+            help='Do not warm the cache (see djeroku.warmup).'
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        start = time()
+
+        self.step('migrate', self.migrate, options)
+        if options['interactive']:
+            self.step('superuser', self.offer_superuser, options)
+        if not options['skip_static']:
+            self.step('collectstatic', self.collect_static, options)
+        if (getattr(settings, 'CACHE_WARMUP_ENABLED', False) and
+                not options['skip_warmup']):
+            self.step('warm cache', self.warm_cache, options)
+
+        self.stdout.write('release finished in %.2fs' % (time() - start))
+
+    def step(self, name, func, options):
+        start = time()
+        outcome = func(options)
+        self.stdout.write('%-14s %6.2fs  %s' % (name, time() - start, outcome))
+
+    def migrate(self, options):
+        state = MigrationState(connections[options['database']])
+        if state.up_to_date and not options['force_migrate']:
+            return 'skipped, up to date (%s)' % state.code_fingerprint
+
+        call_command(
+            'migrate',
+            database=options['database'],
+            interactive=False,
+            verbosity=max(self.verbosity - 1, 0),
+        )
+        return 'applied %d migrations, created %d tables (%s)' % (
+            len(state.code) - len(state.applied),
+            len(state.missing_tables),
+            state.code_fingerprint,
+        )
+
+    def offer_superuser(self, options):
+        """The prompt syncdb used to give on a database without users."""
+        try:
+            apps.get_model('auth', 'Permission')
+        except LookupError:
+            return 'skipped, auth not installed'
+
+        users = get_user_model()._default_manager.db_manager(
+            options['database']
+        )
+        if users.exists():
+            return 'skipped, users exist'
+        # eg, a heroku release phase
+        if not (hasattr(sys.stdin, 'isatty') and sys.stdin.isatty()):
+            return 'skipped, no terminal'
+
+        try:
+            confirm = input(
+                "\nYou don't have any superusers defined.\n"
+                "Would you like to create one now? (yes/no): "
+            )
+            while confirm not in ('yes', 'no'):
+                confirm = input('Please enter either "yes" or "no": ')
+        except EOFError:
+            confirm = 'no'
+        if confirm == 'yes':
+            call_command(
+                'createsuperuser',
+                interactive=True,
+                database=options['database']
+            )
+            return 'created'
+        return 'declined'
+
+    def collect_static(self, options):
+        result = IncrementalCollector().collect()
+        return '%d processed, %d skipped, %d removed' % (
+            len(result['processed']),
+            len(result['skipped']),
+            len(result['removed']),
+        )
+
+    def warm_cache(self, options):
+        result = warmup.warm()
+        return '%d/%d urls ok, %d keys present, %d rebuilt, %d missing' % (
+            result['urls_ok'], result['urls'], result['keys_present'],
+            result['keys_rebuilt'], result['keys_missing'],
+        )
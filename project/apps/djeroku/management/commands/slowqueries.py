@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+
+from djeroku.instrumentation import normalize_sql
+from djeroku.models import SlowQuery
+
+
+class Command(BaseCommand):
+    help = (
+        'Summarize the slow query log by normalized query fingerprint, '
+        'slowest total time first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=10,
+            help='Number of fingerprints to show (default 10).'
+        )
+        parser.add_argument(
+            '--hours', type=float, default=None,
+            help='Only include queries recorded in the last N hours.'
+        )
+        parser.add_argument(
+            '--plans', action='store_true', default=False,
+            help='Include the call site and query plan of each fingerprint.'
+        )
+        parser.add_argument(
+            '--clear', action='store_true', default=False,
+            help='Delete every recorded slow query.'
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            count = SlowQuery.objects.count()
+            SlowQuery.objects.all().delete()
+            self.stdout.write('Deleted %d slow queries.' % count)
+            return
+
+        queries = SlowQuery.objects.all()
+        if options['hours'] is not None:
+            since = timezone.now() - timedelta(hours=options['hours'])
+            queries = queries.filter(created__gte=since)
+
+        summary = (
+            queries.values('fingerprint')
+            .annotate(
+                count=Count('id'),
+                total=Sum('duration'),
+                mean=Avg('duration'),
+                worst=Max('duration'),
+            )
+            .order_by('-total')[:options['limit']]
+        )
+
+        if not summary:
+            self.stdout.write('No slow queries recorded.')
+            return
+
+        for row in summary:
+            # prefer an analyzed sample, then the slowest one
+            sample = (
+                queries.filter(fingerprint=row['fingerprint'])
+                .order_by('-analyzed', '-duration')
+                .first()
+            )
+            self.stdout.write(
+                '%s  count=%d  total=%.0fms  mean=%.0fms  max=%.0fms' % (
+                    row['fingerprint'], row['count'], row['total'] * 1000,
+                    row['mean'] * 1000, row['worst'] * 1000
+                )
+            )
+            self.stdout.write('    %s' % normalize_sql(sample.sql))
+
+            if options['plans']:
+                if sample.stack:
+                    self.stdout.write('  call site:')
+                    self.stdout.write(_indent(sample.stack))
+                if sample.explain:
+                    analyzed = ' (analyzed)' if sample.analyzed else ''
+                    self.stdout.write('  plan%s:' % analyzed)
+                    self.stdout.write(_indent(sample.explain))
+            self.stdout.write('')
+
+
+def _indent(text, prefix='    '):
+    return '\n'.join(prefix + line for line in text.rstrip().splitlines())
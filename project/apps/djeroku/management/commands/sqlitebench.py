@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+from time import time
+
+from django.conf import settings
+from django.core import serializers
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from djeroku.models import SlowQuery
+
+
+# what sqlite does without SQLITE_PRAGMAS
+DEFAULT_PRAGMAS = (
+    ('journal_mode', 'DELETE'),
+    ('synchronous', 'FULL'),
+    ('mmap_size', 0),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Time migrate and a fixture load on a sqlite test database with the '
+        'default journaling, with settings.SQLITE_PRAGMAS and in memory.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=10000,
+            help='Objects in the fixture (default 10000).'
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Sqlite database whose test database to use (default '
+                 '"default").'
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('%s is not a sqlite database.' % (
+                connection.alias))
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            fixture = os.path.join(temp_dir, 'fixture.json')
+            self.write_fixture(fixture, options['rows'])
+            for label, pragmas, name in (
+                    ('default journal', DEFAULT_PRAGMAS, 'default.db'),
+                    ('SQLITE_PRAGMAS', settings.SQLITE_PRAGMAS, 'tuned.db'),
+                    ('in memory', settings.SQLITE_PRAGMAS, ':memory:')):
+                if name != ':memory:':
+                    name = os.path.join(temp_dir, name)
+                with override_settings(SQLITE_PRAGMAS=pragmas):
+                    self.report(label, *self.measure(
+                        connection, name, fixture
+                    ))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def write_fixture(self, path, count):
+        now = timezone.now()
+        rows = (
+            SlowQuery(
+                pk=i + 1,
+                created=now,
+                database='default',
+                fingerprint='%016x' % (i % 500),
+                sql='SELECT * FROM "orders" WHERE "id" = %d' % i,
+                duration=0.2 + (i % 1000) / 1000.0,
+            )
+            for i in range(count)
+        )
+        with open(path, 'w') as stream:
+            serializers.serialize('json', rows, stream=stream)
+
+    def measure(self, connection, name, fixture):
+        """Seconds to create and migrate a test database, and to load."""
+        old_name = connection.settings_dict['NAME']
+        old_test_name = connection.settings_dict['TEST']['NAME']
+        connection.settings_dict['TEST']['NAME'] = name
+        try:
+            start = time()
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False
+            )
+            migrated = time()
+            call_command(
+                'loaddata', fixture, database=connection.alias, verbosity=0
+            )
+            loaded = time()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            connection.settings_dict['TEST']['NAME'] = old_test_name
+        return migrated - start, loaded - migrated
+
+    def report(self, label, migrate, load):
+        self.stdout.write('%-16s migrate %6.2fs  fixture load %6.2fs' % (
+            label, migrate, load
+        ))
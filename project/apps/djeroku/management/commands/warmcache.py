@@ -0,0 +1,78 @@
+from datetime import datetime
+from time import sleep, time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from djeroku import warmup
+
+
+class Command(BaseCommand):
+    help = (
+        'Warm the cache with the hottest urls and keys sampled before the '
+        'release (djeroku.warmup), or report the sampled hit rate per '
+        'minute since the last warm up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--report', action='store_true', default=False,
+            help='Only report the hit rate since the last warm up.'
+        )
+        parser.add_argument(
+            '--minutes', type=int, default=15,
+            help='Minutes of hit rates to report (default 15).'
+        )
+        parser.add_argument(
+            '--watch', type=int, default=0, metavar='MINUTES',
+            help='After warming, report the hit rate of each minute as it '
+                 'ends, for this many minutes.'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Number of urls to request (default '
+                 'settings.CACHE_WARMUP_URLS).'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=None,
+            help='Requests and rebuilds at a time (default '
+                 'settings.CACHE_WARMUP_CONCURRENCY).'
+        )
+
+    def handle(self, *args, **options):
+        if options['report']:
+            self.report(warmup.hit_rates(options['minutes']))
+            return
+
+        result = warmup.warm(options['limit'], options['concurrency'])
+        self.stdout.write(
+            'Requested %d urls (%d ok), %d hot keys: %d present, %d rebuilt, '
+            '%d missing, in %.2fs' % (
+                result['urls'], result['urls_ok'], result['keys'],
+                result['keys_present'], result['keys_rebuilt'],
+                result['keys_missing'], result['seconds'],
+            )
+        )
+
+        # samples land when processes flush, so each minute is reported a
+        # flush interval after it ends
+        flush_interval = warmup.get_recorder().flush_interval
+        minute = int(time() // 60)
+        for _ in range(options['watch']):
+            sleep(max(0, (minute + 1) * 60 + flush_interval - time()))
+            self.report([
+                rate for rate in warmup.hit_rates(flush_interval // 60 + 2)
+                if rate[0] == minute * 60
+            ])
+            minute += 1
+
+    def report(self, rates):
+        for start, hits, misses in rates:
+            reads = hits + misses
+            self.stdout.write('%s  %6d sampled reads  %s' % (
+                timezone.localtime(
+                    datetime.fromtimestamp(start, timezone.utc)
+                ).strftime('%H:%M'),
+                reads,
+                '%5.1f%% hits' % (100.0 * hits / reads) if reads else '-',
+            ))
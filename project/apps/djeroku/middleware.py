@@ -0,0 +1,308 @@
+"""
+Djeroku middleware.
+
+Add these to MIDDLEWARE_CLASSES in settings. Each one checks its own
+setting when the server starts and removes itself (MiddlewareNotUsed) when
+it is turned off, so listing them costs nothing in environments that don't
+use them.
+"""
+
+from __future__ import absolute_import
+
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponseNotModified
+from django.middleware.cache import (
+    FetchFromCacheMiddleware, UpdateCacheMiddleware
+)
+from django.utils import translation
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+from djeroku import compression, l10n, queries, warmup
+
+
+logger = logging.getLogger('djeroku.queries')
+
+
+class QueryInspectionMiddleware(object):
+    """
+    Tracks the queries each request runs. Logs likely N+1 loops and
+    enforces view query budgets (see djeroku.queries). Exceeded budgets are
+    logged, or raised as QueryBudgetExceeded when QUERY_BUDGET_RAISE is set
+    (the djeroku test runner sets it).
+
+    Enabled by QUERY_INSPECTION_ENABLED.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'QUERY_INSPECTION_ENABLED', False):
+            raise MiddlewareNotUsed()
+
+    def process_request(self, request):
+        request._query_scope = queries.open_scope(request.path)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = getattr(request, 'resolver_match', None)
+        request._query_budget = queries.get_query_budget(
+            view_func, match.view_name if match else None
+        )
+
+    def process_response(self, request, response):
+        scope = getattr(request, '_query_scope', None)
+        if scope is None:
+            return response
+        scope.close()
+
+        n_plus_ones = scope.n_plus_ones()
+        for n_plus_one in n_plus_ones:
+            logger.warning('%s %s', request.path, n_plus_one)
+
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None and scope.count > budget:
+            message = '%s ran %d queries, over its budget of %d' % (
+                request.path, scope.count, budget
+            )
+            if n_plus_ones:
+                message += '\n' + '\n'.join(str(n) for n in n_plus_ones)
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise queries.QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+
+class CacheWarmupMiddleware(object):
+    """
+    Samples the paths of anonymous GET requests answered with a cacheable
+    200, for djeroku.warmup to request again after a release. Query strings
+    are left out, since they can carry tokens and personal data, and so are
+    responses that are private, not to be stored, or set a cookie.
+
+    Enabled by CACHE_WARMUP_ENABLED.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'CACHE_WARMUP_ENABLED', False):
+            raise MiddlewareNotUsed()
+
+    def process_response(self, request, response):
+        user = getattr(request, 'user', None)
+        if (request.method == 'GET' and response.status_code == 200 and
+                not response.streaming and not response.cookies and
+                (user is None or not user.is_authenticated()) and
+                self.cacheable(response)):
+            warmup.get_recorder().record_url(request.path)
+        return response
+
+    def cacheable(self, response):
+        cache_control = response.get('Cache-Control', '').lower()
+        return not ('private' in cache_control or 'no-store' in cache_control)
+
+
+class CompressionMiddleware(object):
+    """
+    Compresses textual responses (COMPRESSION_TYPES) of at least
+    COMPRESSION_MIN_SIZE bytes with brotli or gzip, whichever the client
+    accepts, brotli first when it is installed (see djeroku.compression).
+    Streaming responses are compressed chunk by chunk; just enough of their
+    first chunks is read ahead to tell whether they reach the minimum size.
+
+    Responses to requests that used the CSRF token (CSRF_COOKIE_USED, set
+    by {% csrf_token %} and get_token) are left alone: compressing a page
+    with a secret in it and input echoed back leaks the secret (BREACH).
+
+    List it first in MIDDLEWARE_CLASSES, so it compresses the response the
+    other middleware have finished with.
+
+    Enabled by COMPRESSION_ENABLED.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'COMPRESSION_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.types = tuple(getattr(settings, 'COMPRESSION_TYPES', ('text/',)))
+        self.encoders = compression.available_encoders()
+
+    def process_response(self, request, response):
+        if response.status_code == 304:
+            # for the 304s of WeakETagMiddleware, which has no Content-Type
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        if (response.has_header('Content-Encoding') or
+                not response.get('Content-Type', '').startswith(self.types) or
+                request.META.get('CSRF_COOKIE_USED')):
+            return response
+        # the same url may be compressed for the next client
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoder = compression.choose_encoder(
+            request.META.get('HTTP_ACCEPT_ENCODING'), self.encoders
+        )
+        if encoder is None:
+            return response
+
+        if response.streaming:
+            head, chunks, finished = compression.peek(
+                response.streaming_content, self.min_size
+            )
+            if finished and sum(len(chunk) for chunk in head) < self.min_size:
+                response.streaming_content = chunks
+                return response
+            response.streaming_content = encoder.compress_chunks(chunks)
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            if len(response.content) < self.min_size:
+                return response
+            compressed = encoder.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            # the compressed bytes are another representation of the body
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoder.name
+        return response
+
+
+class WeakETagMiddleware(object):
+    """
+    Gives GET and HEAD responses with a 200 a weak ETag - the body's crc32,
+    far cheaper than the md5 of USE_ETAGS - and answers a matching
+    If-None-Match, or an If-Modified-Since no older than the response's
+    Last-Modified, with a 304. Streaming bodies aren't read to make an
+    ETag, so a streaming response only gets a 304 from an ETag or
+    Last-Modified its view set (eg with django.views.decorators.http.
+    condition).
+
+    List it after CompressionMiddleware, so it sees the uncompressed body.
+
+    Enabled by ETAGS_ENABLED.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'ETAGS_ENABLED', False):
+            raise MiddlewareNotUsed()
+
+    def process_response(self, request, response):
+        if (request.method not in ('GET', 'HEAD') or
+                response.status_code != 200):
+            return response
+        if not response.has_header('ETag') and not response.streaming:
+            response['ETag'] = compression.weak_etag(response.content)
+        if not self.not_modified(request, response):
+            return response
+
+        not_modified = HttpResponseNotModified()
+        for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Expires',
+                       'Vary', 'Content-Location'):
+            if response.has_header(header):
+                not_modified[header] = response[header]
+        not_modified.cookies = response.cookies
+        # an unread streaming body is closed when it is garbage collected
+        # (response.close() would also send request_finished early)
+        return not_modified
+
+    def not_modified(self, request, response):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            # takes precedence over If-Modified-Since
+            etag = response.get('ETag')
+            return bool(etag) and compression.etag_matches(
+                etag, if_none_match
+            )
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE')
+        )
+        last_modified = parse_http_date_safe(response.get('Last-Modified'))
+        return bool(if_modified_since and last_modified and
+                    last_modified <= if_modified_since)
+
+
+class LocaleMiddleware(object):
+    """
+    Activates the language each request asks for, by its session, language
+    cookie or Accept-Language header (djeroku.l10n.get_request_language),
+    like django.middleware.locale.LocaleMiddleware without i18n_patterns
+    redirects. The LANGUAGE_CODE translation is in effect when none is
+    active, so requests in that language activate nothing.
+
+    List it after SessionMiddleware.
+
+    Enabled by LOCALE_MIDDLEWARE_ENABLED.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'LOCALE_MIDDLEWARE_ENABLED', False):
+            raise MiddlewareNotUsed()
+
+    def process_request(self, request):
+        language = l10n.get_request_language(request)
+        if language == l10n.default_language():
+            # drop whatever an earlier request on this thread activated
+            translation.deactivate()
+        else:
+            translation.activate(language)
+        request.LANGUAGE_CODE = language
+
+    def process_response(self, request, response):
+        patch_vary_headers(response, ('Accept-Language',))
+        if 'Content-Language' not in response:
+            response['Content-Language'] = getattr(
+                request, 'LANGUAGE_CODE', translation.get_language()
+            )
+        return response
+
+
+class LocaleUpdateCacheMiddleware(UpdateCacheMiddleware):
+    """
+    Django's UpdateCacheMiddleware, saving pages under the language their
+    Accept-Language header resolves to rather than the header itself, to
+    be found by LocaleFetchFromCacheMiddleware. Cached for
+    CACHE_MIDDLEWARE_SECONDS in the CACHE_MIDDLEWARE_ALIAS cache.
+
+    List it after the compression and ETag middleware, so what it saves has
+    been through every other middleware.
+
+    Enabled by LOCALE_PAGE_CACHE_ENABLED.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'LOCALE_PAGE_CACHE_ENABLED', False):
+            raise MiddlewareNotUsed()
+        super(LocaleUpdateCacheMiddleware, self).__init__()
+
+    def process_response(self, request, response):
+        return super(LocaleUpdateCacheMiddleware, self).process_response(
+            l10n.cache_request(request), response
+        )
+
+
+class LocaleFetchFromCacheMiddleware(FetchFromCacheMiddleware):
+    """
+    Django's FetchFromCacheMiddleware, finding pages saved by
+    LocaleUpdateCacheMiddleware.
+
+    List it last, after LocaleMiddleware.
+
+    Enabled by LOCALE_PAGE_CACHE_ENABLED.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'LOCALE_PAGE_CACHE_ENABLED', False):
+            raise MiddlewareNotUsed()
+        super(LocaleFetchFromCacheMiddleware, self).__init__()
+
+    def process_request(self, request):
+        keyed = l10n.cache_request(request)
+        response = super(LocaleFetchFromCacheMiddleware, self).process_request(
+            keyed
+        )
+        request._cache_update_cache = keyed._cache_update_cache
+        return response
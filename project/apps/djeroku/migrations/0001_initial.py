@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('database', models.CharField(max_length=100)),
+                ('fingerprint', models.CharField(max_length=32, db_index=True)),
+                ('sql', models.TextField()),
+                ('duration', models.FloatField(help_text='Seconds')),
+                ('stack', models.TextField(blank=True)),
+                ('explain', models.TextField(blank=True)),
+                ('analyzed', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ('-created',),
+                'verbose_name_plural': 'slow queries',
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djeroku', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchChunk',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('first', models.CharField(max_length=255)),
+                ('last', models.CharField(max_length=255)),
+                ('rows', models.PositiveIntegerField()),
+                ('status', models.CharField(default='dispatched', max_length=20, choices=[('dispatched', 'Dispatched'), ('done', 'Done'), ('failed', 'Failed')])),
+                ('error', models.TextField(blank=True)),
+                ('dispatched', models.DateTimeField(db_index=True)),
+                ('finished', models.DateTimeField(null=True)),
+            ],
+            options={
+                'ordering': ('job', 'id'),
+            },
+        ),
+        migrations.CreateModel(
+            name='BatchJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(unique=True, max_length=200)),
+                ('function', models.CharField(max_length=200)),
+                ('model', models.CharField(max_length=200)),
+                ('query', models.TextField(help_text='Pickled query, base64 encoded')),
+                ('kwargs', models.TextField(default='{}', help_text='JSON')),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('concurrency', models.PositiveIntegerField()),
+                ('status', models.CharField(default='running', max_length=20, choices=[('running', 'Running'), ('done', 'Done')])),
+                ('cursor', models.CharField(help_text='Primary key of the last row handed to a chunk', max_length=255, blank=True)),
+                ('exhausted', models.BooleanField(default=False)),
+                ('total', models.PositiveIntegerField(help_text='Rows in the queryset when the job started', null=True)),
+                ('rows_done', models.PositiveIntegerField(default=0)),
+                ('chunks_done', models.PositiveIntegerField(default=0)),
+                ('chunks_failed', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.AddField(
+            model_name='batchchunk',
+            name='job',
+            field=models.ForeignKey(related_name='chunks', to='djeroku.BatchJob'),
+        ),
+    ]
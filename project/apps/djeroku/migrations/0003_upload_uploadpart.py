@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('djeroku', '0002_batchjob_batchchunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, serialize=False, editable=False, primary_key=True)),
+                ('filename', models.CharField(max_length=255)),
+                ('content_type', models.CharField(max_length=100, blank=True)),
+                ('size', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0, help_text='Bytes received')),
+                ('status', models.CharField(default='uploading', max_length=20, choices=[('uploading', 'Uploading'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')])),
+                ('name', models.CharField(help_text='Name in the upload storage', max_length=255, blank=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64, blank=True)),
+                ('md5', models.CharField(max_length=32, blank=True)),
+                ('derivatives', models.TextField(default='{}', help_text='JSON, label to name in the upload storage')),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(related_name='uploads', blank=True, to=settings.AUTH_USER_MODEL, null=True)),
+            ],
+            options={
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadPart',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('offset', models.BigIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('upload', models.ForeignKey(related_name='parts', to='djeroku.Upload')),
+            ],
+            options={
+                'ordering': ('upload', 'offset'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='uploadpart',
+            unique_together=set([('upload', 'offset')]),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djeroku', '0003_upload_uploadpart'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='batchjob',
+            name='cursor',
+        ),
+        migrations.RemoveField(
+            model_name='batchjob',
+            name='exhausted',
+        ),
+        migrations.RemoveField(
+            model_name='batchjob',
+            name='query',
+        ),
+        migrations.AddField(
+            model_name='batchchunk',
+            name='keys',
+            field=models.TextField(default='[]', help_text='Primary keys, JSON'),
+        ),
+        migrations.AlterField(
+            model_name='batchchunk',
+            name='dispatched',
+            field=models.DateTimeField(null=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='batchchunk',
+            name='status',
+            field=models.CharField(default='pending', max_length=20, choices=[('pending', 'Pending'), ('dispatched', 'Dispatched'), ('done', 'Done'), ('failed', 'Failed')]),
+        ),
+        migrations.AlterField(
+            model_name='batchjob',
+            name='model',
+            field=models.CharField(help_text='app_label.Model', max_length=200),
+        ),
+    ]
@@ -0,0 +1,168 @@
+from __future__ import unicode_literals
+
+import uuid
+
+from django.conf import settings
+from django.db import models
+from django.utils.encoding import python_2_unicode_compatible
+
+
+@python_2_unicode_compatible
+class SlowQuery(models.Model):
+    """A sampled slow statement recorded by the slow query log."""
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    database = models.CharField(max_length=100)
+    fingerprint = models.CharField(max_length=32, db_index=True)
+    sql = models.TextField()
+    duration = models.FloatField(help_text='Seconds')
+    stack = models.TextField(blank=True)
+    explain = models.TextField(blank=True)
+    analyzed = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name_plural = 'slow queries'
+
+    def __str__(self):
+        return '%s (%.0fms)' % (self.fingerprint, self.duration * 1000)
+
+
+@python_2_unicode_compatible
+class BatchJob(models.Model):
+    """
+    A queryset processed in chunks of primary keys by celery tasks, started
+    by djeroku.batches.fan_out. Progress is kept here so a job can pick up
+    where it left off after a worker restart.
+    """
+    RUNNING = 'running'
+    DONE = 'done'
+    STATUS_CHOICES = (
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+    )
+
+    name = models.CharField(max_length=200, unique=True)
+    function = models.CharField(max_length=200)
+    model = models.CharField(max_length=200, help_text='app_label.Model')
+    kwargs = models.TextField(default='{}', help_text='JSON')
+    chunk_size = models.PositiveIntegerField()
+    concurrency = models.PositiveIntegerField()
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=RUNNING
+    )
+    total = models.PositiveIntegerField(
+        null=True, help_text='Rows in the queryset when the job started'
+    )
+    rows_done = models.PositiveIntegerField(default=0)
+    chunks_done = models.PositiveIntegerField(default=0)
+    chunks_failed = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-created',)
+
+    def __str__(self):
+        return '%s (%s)' % (self.name, self.status)
+
+
+@python_2_unicode_compatible
+class BatchChunk(models.Model):
+    """Up to chunk_size rows of a BatchJob, handled by one task."""
+    PENDING = 'pending'
+    DISPATCHED = 'dispatched'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (DISPATCHED, 'Dispatched'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    job = models.ForeignKey(BatchJob, related_name='chunks')
+    first = models.CharField(max_length=255)
+    last = models.CharField(max_length=255)
+    rows = models.PositiveIntegerField()
+    keys = models.TextField(default='[]', help_text='Primary keys, JSON')
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=PENDING
+    )
+    error = models.TextField(blank=True)
+    dispatched = models.DateTimeField(null=True, db_index=True)
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ('job', 'id')
+
+    def __str__(self):
+        return '%s %s-%s (%s)' % (
+            self.job.name, self.first, self.last, self.status
+        )
+
+
+@python_2_unicode_compatible
+class Upload(models.Model):
+    """
+    A file sent in chunks through djeroku.uploads. Each chunk is stored as
+    it arrives (UploadPart); once all `size` bytes are in, a celery task
+    joins them under a content hashed name and makes its derivatives.
+    """
+    UPLOADING = 'uploading'
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (UPLOADING, 'Uploading'),
+        (PROCESSING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True,
+                             blank=True, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0, help_text='Bytes received')
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=UPLOADING
+    )
+    name = models.CharField(max_length=255, blank=True,
+                            help_text='Name in the upload storage')
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    md5 = models.CharField(max_length=32, blank=True)
+    derivatives = models.TextField(
+        default='{}', help_text='JSON, label to name in the upload storage'
+    )
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-created',)
+
+    def __str__(self):
+        return '%s (%s)' % (self.filename, self.status)
+
+
+@python_2_unicode_compatible
+class UploadPart(models.Model):
+    """One chunk of an Upload, stored until the upload is joined."""
+
+    upload = models.ForeignKey(Upload, related_name='parts')
+    offset = models.BigIntegerField()
+    size = models.PositiveIntegerField()
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        ordering = ('upload', 'offset')
+        unique_together = ('upload', 'offset')
+
+    def __str__(self):
+        return '%s %d-%d' % (
+            self.upload.filename, self.offset, self.offset + self.size
+        )
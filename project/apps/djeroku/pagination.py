@@ -0,0 +1,184 @@
+"""
+Counting and paging large tables.
+
+`COUNT(*)` on postgres reads every visible row, so on a big table it costs
+about as much as the query it counts. `count_rows` asks the planner instead
+when its estimate is above a threshold - `pg_class.reltuples` for a whole
+table, the EXPLAIN row estimate for a filtered queryset - and otherwise
+runs the exact count, caching it for a short time. Other databases always
+get the cached exact count.
+
+`EstimatedCountPaginator` uses it, and `djeroku.admin.EstimatedCountAdmin`
+puts it under admin changelists.
+
+`keyset_pages` walks a whole queryset a page at a time without OFFSET, for
+exports and batch jobs.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils.encoding import force_bytes
+
+
+def estimated_count(queryset):
+    """
+    The planner's estimate of the number of rows in `queryset`, or None if
+    the database can't estimate it. 0 for querysets that can't match
+    anything (eg, `filter(pk__in=[])`), which have no SQL to estimate.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    query = queryset.query
+    with connection.cursor() as cursor:
+        if not query.where and not query.distinct and not (
+                query.low_mark or query.high_mark is not None):
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            # never analyzed tables have -1 (or 0 before postgres 14)
+            return int(row[0]) if row and row[0] > 0 else None
+
+        try:
+            sql, params = queryset.order_by().query.get_compiler(
+                using=queryset.db
+            ).as_sql()
+        except EmptyResultSet:
+            return 0
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def cached_count(queryset, timeout=None):
+    """`queryset.count()`, cached for `timeout` seconds."""
+    if timeout is None:
+        timeout = getattr(settings, 'COUNT_CACHE_TIMEOUT', 60)
+    if not timeout:
+        return queryset.count()
+
+    try:
+        key = query_cache_key('djeroku:count', queryset.order_by())
+    except EmptyResultSet:
+        return 0
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+def query_cache_key(prefix, queryset):
+    """
+    A cache key for the SQL of `queryset`. Raises EmptyResultSet for
+    querysets that can't match anything, which have no SQL.
+    """
+    return '%s:%s' % (prefix, hashlib.md5(force_bytes('%s|%s' % (
+        queryset.db, queryset.query
+    ))).hexdigest())
+
+
+def count_rows(queryset, threshold=None, timeout=None):
+    """
+    The number of rows in `queryset`, as (count, estimated). The planner's
+    estimate is used when it is at least `threshold` rows.
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'COUNT_ESTIMATE_THRESHOLD', 100000)
+    if threshold is not False:
+        estimate = estimated_count(queryset)
+        if estimate is not None and estimate >= threshold:
+            return estimate, True
+    return cached_count(queryset, timeout), False
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator counting with `count_rows`. When the count is an estimate,
+    `estimated` is True and pages past the estimated last page can still be
+    requested, since the real table may be bigger.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, threshold=None, timeout=None):
+        super(EstimatedCountPaginator, self).__init__(
+            object_list, per_page, orphans, allow_empty_first_page
+        )
+        self.threshold = threshold
+        self.timeout = timeout
+        self.estimated = False
+
+    def _get_count(self):
+        if self._count is None:
+            if hasattr(self.object_list, 'query'):
+                self._count, self.estimated = count_rows(
+                    self.object_list, self.threshold, self.timeout
+                )
+            else:
+                self._count = len(self.object_list)
+        return self._count
+    count = property(_get_count)
+
+    def validate_number(self, number):
+        try:
+            return super(EstimatedCountPaginator, self).validate_number(
+                number
+            )
+        except EmptyPage:
+            if self.estimated and int(number) >= 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.estimated:
+            return super(EstimatedCountPaginator, self).page(number)
+        # an estimate must not cut the page short
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
+
+def keyset_pages(queryset, size=1000, key='pk'):
+    """
+    Yield every row of `queryset` ordered by `key`, as lists of up to `size`
+    rows. Each page is a query for the rows after the previous page's last
+    key, so late pages cost as little as the first (OFFSET reads and throws
+    away every row before the page). values_list() rows must have the key
+    as their first column, and values() rows must include it.
+    """
+    queryset = queryset.order_by(key)
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(**{'%s__gt' % key: last})
+        rows = list(page[:size])
+        if not rows:
+            return
+        yield rows
+        if len(rows) < size:
+            return
+        last = _row_key(rows[-1], key)
+
+
+def _row_key(row, key):
+    if isinstance(row, tuple):
+        return row[0]
+    if isinstance(row, dict):
+        return row[key]
+    return getattr(row, key)
@@ -0,0 +1,221 @@
+"""
+Per-request and per-task query tracking: N+1 detection and query budgets.
+
+A `QueryScope` collects the queries one thread runs while it is open (a
+request, a celery task, a block of test code). When it closes, statements
+that ran N_PLUS_ONE_THRESHOLD or more times with the same fingerprint but
+different parameters are reported as likely N+1 loops, along with the
+`select_related` / `prefetch_related` call that would probably remove them.
+
+Views can declare how many queries they are allowed to run:
+
+    from djeroku.queries import query_budget
+
+    @query_budget(5)
+    def article_list(request):
+        ...
+
+or by url name in settings.QUERY_BUDGETS. `djeroku.middleware.
+QueryInspectionMiddleware` checks both on every request and the djeroku
+test runner turns an exceeded budget into a test failure.
+"""
+
+from __future__ import absolute_import
+
+from collections import defaultdict
+import re
+import threading
+
+from django.apps import apps
+from django.conf import settings
+
+from djeroku import instrumentation
+
+
+_local = threading.local()
+_tracking = False
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class NPlusOne(object):
+    """A statement repeated inside a single scope."""
+
+    def __init__(self, fingerprint, count, sql, suggestion=None):
+        self.fingerprint = fingerprint
+        self.count = count
+        self.sql = sql
+        self.suggestion = suggestion
+
+    def __str__(self):
+        message = 'N+1: %d x %s' % (
+            self.count, instrumentation.normalize_sql(self.sql)
+        )
+        if self.suggestion:
+            message += '\n  hint: %s' % self.suggestion
+        return message
+
+
+class QueryScope(object):
+    """The queries run by one thread between `open_scope` and `close`."""
+
+    def __init__(self, name, threshold=None):
+        if threshold is None:
+            threshold = getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+        self.name = name
+        self.threshold = threshold
+        self.count = 0
+        self.duration = 0.0
+        self._counts = defaultdict(int)
+        self._params = defaultdict(set)
+        self._samples = {}
+
+    def record(self, event):
+        self.count += 1
+        self.duration += event.duration
+        if event.many:
+            return
+
+        key = instrumentation.fingerprint(event.sql)
+        self._counts[key] += 1
+        if key not in self._samples:
+            self._samples[key] = event.sql
+        # only enough distinct parameter sets to tell a loop from a repeat
+        seen = self._params[key]
+        if len(seen) < 2:
+            seen.add(repr(event.params))
+
+    def close(self):
+        close_scope(self)
+
+    def n_plus_ones(self):
+        """Repeated statements, most repeated first."""
+        found = []
+        for key, count in self._counts.items():
+            if count >= self.threshold and len(self._params[key]) > 1:
+                sql = self._samples[key]
+                found.append(NPlusOne(key, count, sql, suggest(sql)))
+        return sorted(found, key=lambda n: -n.count)
+
+
+def _track(event):
+    for scope in getattr(_local, 'scopes', ()):
+        scope.record(event)
+
+
+def open_scope(name, threshold=None):
+    """Start collecting the queries this thread runs into a new scope."""
+    global _tracking
+    if not _tracking:
+        instrumentation.register(_track)
+        _tracking = True
+
+    scope = QueryScope(name, threshold)
+    if not hasattr(_local, 'scopes'):
+        _local.scopes = []
+    _local.scopes.append(scope)
+    return scope
+
+
+def close_scope(scope):
+    scopes = getattr(_local, 'scopes', [])
+    if scope in scopes:
+        scopes.remove(scope)
+
+
+def query_budget(max_queries):
+    """View decorator declaring the most queries the view may run."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def get_query_budget(view, url_name=None):
+    budget = getattr(view, 'query_budget', None)
+    if budget is None and url_name:
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+    return budget
+
+
+# SUGGESTIONS
+_FROM_RE = re.compile(r'\bFROM\s+[`"]?(\w+)[`"]?', re.IGNORECASE)
+_WHERE_RE = re.compile(
+    r'\bWHERE\s+(?:[`"]?(\w+)[`"]?\.)?[`"]?(\w+)[`"]?\s*(?:=|IN\b)',
+    re.IGNORECASE
+)
+
+
+def suggest(sql):
+    """
+    Guess which select_related / prefetch_related call would fold a repeated
+    statement into its parent query, from the table and column it filters
+    on. Returns None when the statement doesn't look like a relation lookup.
+    """
+    where = _WHERE_RE.search(sql)
+    table_match = _FROM_RE.search(sql)
+    if where is None or table_match is None:
+        return None
+
+    table, column = where.groups()
+    model = _models_by_table().get(table or table_match.group(1))
+    if model is None:
+        return None
+    field = _field_for_column(model, column)
+    if field is None:
+        return None
+
+    if field.primary_key:
+        # rows fetched one at a time by pk - a foreign key to this model is
+        # being followed for each parent row
+        sources = [
+            '%s.%s' % (m.__name__, f.name)
+            for m in apps.get_models()
+            for f in m._meta.concrete_fields
+            if f.is_relation and f.related_model is model and
+            not m._meta.auto_created
+        ]
+        if sources:
+            return 'select_related() the foreign key to %s (%s)' % (
+                model.__name__, ', '.join(sorted(sources))
+            )
+        return None
+
+    if not field.is_relation:
+        return None
+
+    if model._meta.auto_created:
+        # many to many through table, filtered on one side of the relation
+        owner = model._meta.auto_created
+        for m2m in owner._meta.many_to_many:
+            if m2m.rel.through is not model:
+                continue
+            if field.related_model is owner:
+                return "prefetch_related('%s') on %s querysets" % (
+                    m2m.name, owner.__name__
+                )
+            return "prefetch_related('%s') on %s querysets" % (
+                m2m.rel.get_accessor_name(), field.related_model.__name__
+            )
+        return None
+
+    return "prefetch_related('%s') on %s querysets" % (
+        field.rel.get_accessor_name(), field.related_model.__name__
+    )
+
+
+def _models_by_table():
+    return dict(
+        (model._meta.db_table, model)
+        for model in apps.get_models(include_auto_created=True)
+    )
+
+
+def _field_for_column(model, column):
+    for field in model._meta.concrete_fields:
+        if field.column == column:
+            return field
+    return None
+# END SUGGESTIONS
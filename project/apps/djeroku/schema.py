@@ -0,0 +1,116 @@
+"""
+Cheap checks of whether a database schema matches the code.
+
+Used to skip `migrate` entirely - its migration planning and post_migrate
+handlers (content types, permissions) are most of the time it takes - when
+there is nothing to do, both on release (MigrationState) and when reusing a
+test database (schema_fingerprint).
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import os
+import sys
+
+from django.apps import apps
+from django.db import router
+from django.db.migrations.loader import MigrationLoader
+from django.utils.encoding import force_bytes
+
+
+class MigrationState(object):
+    """
+    The migrations on disk compared with the ones applied to `connection`,
+    plus the tables of apps without migrations (created by migrate's
+    syncdb step) that don't exist yet.
+
+    The migrations are the nodes of the loader's graph, as migrate plans
+    them: a squashed migration in place of the ones it replaces (counted as
+    applied once they all are), or the replaced ones while the squash can't
+    be used.
+    """
+
+    def __init__(self, connection):
+        loader = MigrationLoader(connection)
+        self.code = sorted(loader.graph.nodes)
+        self.applied = sorted(
+            key for key in self.code if key in loader.applied_migrations
+        )
+
+        existing = set(connection.introspection.table_names())
+        self.missing_tables = sorted(
+            table
+            for table in unmigrated_tables(connection, loader.unmigrated_apps)
+            if table not in existing
+        )
+
+    @property
+    def code_fingerprint(self):
+        return fingerprint(self.code)
+
+    @property
+    def applied_fingerprint(self):
+        return fingerprint(self.applied)
+
+    @property
+    def up_to_date(self):
+        return (
+            self.code_fingerprint == self.applied_fingerprint and
+            not self.missing_tables
+        )
+
+
+def unmigrated_tables(connection, app_labels):
+    tables = set()
+    for app_config in apps.get_app_configs():
+        if app_config.label not in app_labels:
+            continue
+        for model in router.get_migratable_models(
+                app_config, connection.alias, include_auto_created=True):
+            if model._meta.managed and not model._meta.proxy:
+                tables.add(model._meta.db_table)
+    return tables
+
+
+def fingerprint(keys):
+    return hashlib.sha1(
+        force_bytes('\n'.join('%s.%s' % key for key in keys))
+    ).hexdigest()[:12]
+
+
+def schema_fingerprint(connection):
+    """
+    Hash of everything that decides the schema `migrate` builds: the source
+    of every migration on disk and the column definitions of the apps
+    without migrations. Unlike MigrationState it notices a migration that
+    was edited in place, so it is safe for deciding to reuse a test
+    database.
+    """
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    digest = hashlib.sha1()
+    for key in sorted(loader.disk_migrations):
+        module = sys.modules[type(loader.disk_migrations[key]).__module__]
+        digest.update(force_bytes('%s.%s\n' % key))
+        digest.update(_module_source(module))
+
+    for app_config in apps.get_app_configs():
+        if app_config.label not in loader.unmigrated_apps:
+            continue
+        for model in router.get_migratable_models(
+                app_config, connection.alias, include_auto_created=True):
+            digest.update(force_bytes(model._meta.db_table))
+            for field in model._meta.local_fields:
+                digest.update(force_bytes(repr((
+                    field.column, field.db_type(connection), field.null,
+                    field.unique, field.db_index
+                ))))
+    return digest.hexdigest()[:12]
+
+
+def _module_source(module):
+    path = module.__file__
+    if path.endswith(('.pyc', '.pyo')) and os.path.exists(path[:-1]):
+        path = path[:-1]
+    with open(path, 'rb') as f:
+        return f.read()
@@ -0,0 +1,35 @@
+"""
+Celery signal receivers used by the djeroku app.
+"""
+
+from __future__ import absolute_import
+
+import logging
+
+from celery.signals import task_postrun, task_prerun
+
+from djeroku import queries
+
+
+logger = logging.getLogger('djeroku.queries')
+
+_task_scopes = {}
+
+
+def _open_task_scope(task_id=None, task=None, **kwargs):
+    _task_scopes[task_id] = queries.open_scope(task.name)
+
+
+def _close_task_scope(task_id=None, task=None, **kwargs):
+    scope = _task_scopes.pop(task_id, None)
+    if scope is None:
+        return
+    scope.close()
+    for n_plus_one in scope.n_plus_ones():
+        logger.warning('task %s %s', task.name, n_plus_one)
+
+
+def connect_task_query_inspection():
+    """Look for N+1 queries in every celery task this process runs."""
+    task_prerun.connect(_open_task_scope, weak=False)
+    task_postrun.connect(_close_task_scope, weak=False)
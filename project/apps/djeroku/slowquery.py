@@ -0,0 +1,201 @@
+"""
+Sampled slow query log.
+
+Watches every query through `djeroku.instrumentation` and keeps the ones
+slower than SLOW_QUERY_THRESHOLD_MS, along with the call site that issued
+them and the database's query plan. Recording never happens in the request:
+slow queries are pushed onto a bounded in-memory buffer and a background
+thread runs the EXPLAIN (EXPLAIN ANALYZE for a SLOW_QUERY_ANALYZE_RATE
+fraction of them) and saves them as `djeroku.models.SlowQuery` rows. When
+the buffer is full new entries are dropped and counted rather than blocking
+the caller.
+
+Summarize what has been recorded with `python manage.py slowqueries`.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import os
+import random
+import re
+import traceback
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils.encoding import force_text
+from django.utils.six.moves import queue
+
+from djeroku import instrumentation
+from djeroku.utils import BackgroundThread
+
+
+logger = logging.getLogger('djeroku.slowquery')
+
+# vendor: (plan prefix, analyze prefix or None when unsupported)
+EXPLAIN_PREFIXES = {
+    'postgresql': ('EXPLAIN ', 'EXPLAIN ANALYZE '),
+    'mysql': ('EXPLAIN ', None),
+    'sqlite': ('EXPLAIN QUERY PLAN ', None),
+}
+
+# only read queries are explained - EXPLAIN ANALYZE runs the statement
+_EXPLAINABLE_RE = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+# frames from these folders are left out of the recorded call site
+_SKIP_PATHS = (
+    os.path.dirname(django.__file__),
+    os.path.dirname(os.path.abspath(__file__)),
+)
+
+
+class SlowQueryLog(object):
+    """
+    Query observer that samples slow statements into a bounded buffer and
+    writes them to the database from a background thread.
+    """
+
+    def __init__(self, threshold_ms=200, sample_rate=1.0, analyze_rate=0.0,
+                 buffer_size=500, max_rows=10000, stack_depth=8,
+                 batch_size=50):
+        self.threshold = threshold_ms / 1000.0
+        self.sample_rate = sample_rate
+        self.analyze_rate = analyze_rate
+        self.max_rows = max_rows
+        self.stack_depth = stack_depth
+        self.batch_size = batch_size
+        self.buffer = queue.Queue(maxsize=buffer_size)
+        self.dropped = 0
+        self._writer = BackgroundThread(
+            self._run, 'djeroku-slowquery-writer'
+        )
+
+    def __call__(self, event):
+        if event.many or event.duration < self.threshold:
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+
+        entry = dict(
+            alias=event.alias,
+            vendor=event.vendor,
+            sql=event.sql,
+            params=event.params,
+            duration=event.duration,
+            stack=format_stack(self.stack_depth),
+        )
+        try:
+            self.buffer.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._writer.ensure_started()
+
+    def flush(self):
+        """Block until everything buffered so far has been written."""
+        if self.buffer.unfinished_tasks:
+            self._writer.ensure_started()
+            self.buffer.join()
+
+    def _run(self):
+        with instrumentation.suppressed():
+            while True:
+                batch = [self.buffer.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.buffer.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    self.write(batch)
+                except Exception:
+                    logger.exception(
+                        'failed to record %d slow queries', len(batch)
+                    )
+                finally:
+                    close_old_connections()
+                    for _ in batch:
+                        self.buffer.task_done()
+
+    def write(self, batch):
+        from djeroku.models import SlowQuery
+
+        records = []
+        for entry in batch:
+            plan, analyzed = self.explain(entry)
+            records.append(SlowQuery(
+                database=entry['alias'],
+                fingerprint=instrumentation.fingerprint(entry['sql']),
+                sql=entry['sql'],
+                duration=entry['duration'],
+                stack=entry['stack'],
+                explain=plan,
+                analyzed=analyzed,
+            ))
+        SlowQuery.objects.bulk_create(records)
+        self.trim()
+
+    def explain(self, entry):
+        """Return (plan text, analyzed) for a buffered entry."""
+        prefixes = EXPLAIN_PREFIXES.get(entry['vendor'])
+        if prefixes is None or not _EXPLAINABLE_RE.match(entry['sql']):
+            return '', False
+
+        prefix, analyze_prefix = prefixes
+        analyzed = (
+            analyze_prefix is not None and
+            random.random() < self.analyze_rate
+        )
+        if analyzed:
+            prefix = analyze_prefix
+
+        try:
+            with connections[entry['alias']].cursor() as cursor:
+                cursor.execute(prefix + entry['sql'], entry['params'])
+                rows = cursor.fetchall()
+        except Exception as e:
+            logger.warning('could not explain slow query: %s', e)
+            return '', False
+
+        return '\n'.join(
+            ' '.join(force_text(column) for column in row) for row in rows
+        ), analyzed
+
+    def trim(self):
+        """Delete the oldest rows beyond `max_rows`."""
+        from djeroku.models import SlowQuery
+
+        cutoff = list(
+            SlowQuery.objects.order_by('-pk')
+            .values_list('pk', flat=True)[self.max_rows:self.max_rows + 1]
+        )
+        if cutoff:
+            SlowQuery.objects.filter(pk__lte=cutoff[0]).delete()
+
+
+def format_stack(depth):
+    """The innermost `depth` frames of the current stack outside django."""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-1]
+        if not frame[0].startswith(_SKIP_PATHS)
+    ]
+    return ''.join(traceback.format_list(frames[-depth:]))
+
+
+_slow_query_log = None
+
+
+def get_slow_query_log():
+    """The process wide SlowQueryLog, configured from settings."""
+    global _slow_query_log
+    if _slow_query_log is None:
+        _slow_query_log = SlowQueryLog(
+            threshold_ms=getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200),
+            sample_rate=getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0),
+            analyze_rate=getattr(settings, 'SLOW_QUERY_ANALYZE_RATE', 0.0),
+            buffer_size=getattr(settings, 'SLOW_QUERY_BUFFER_SIZE', 500),
+            max_rows=getattr(settings, 'SLOW_QUERY_MAX_ROWS', 10000),
+            stack_depth=getattr(settings, 'SLOW_QUERY_STACK_DEPTH', 8),
+        )
+    return _slow_query_log
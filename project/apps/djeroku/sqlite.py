@@ -0,0 +1,70 @@
+"""
+SQLite tuning for development and tests.
+
+With its default rollback journal, SQLite locks the whole file for every
+write, and readers wait for writers, so a web process and a celery worker
+sharing `default.db` stall each other with "database is locked". Every
+sqlite connection is set up with SQLITE_PRAGMAS when it opens:
+
+- journal_mode=WAL lets readers carry on while one writer writes
+- synchronous=NORMAL only syncs the log at checkpoints, not every commit
+- mmap_size reads the database through memory-mapped I/O
+- busy_timeout waits that many milliseconds for a lock before giving up
+
+and `atomic` blocks start with BEGIN SQLITE_TRANSACTION_MODE. The default
+(deferred) transaction reads, then fails at once with "database is
+locked" if it tries to write after another connection already did, however
+long the busy timeout; an IMMEDIATE transaction takes the write lock up
+front and waits for it instead.
+
+runserver handles each request in a thread of its own, with a connection
+of its own, and celery closes connections after each task, so the setup
+runs once per request or task: a few PRAGMA statements, cheap next to the
+work itself.
+
+`python manage.py sqlitebench` times migrate and a fixture load with the
+default journaling, with SQLITE_PRAGMAS and in memory.
+"""
+
+from __future__ import absolute_import
+
+import types
+
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver applying SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    # the DB-API cursor, so setup isn't counted as the request's queries
+    cursor = connection.connection.cursor()
+    try:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', ()):
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+    finally:
+        cursor.close()
+
+    mode = getattr(settings, 'SQLITE_TRANSACTION_MODE', None)
+    if mode:
+        connection._start_transaction_under_autocommit = types.MethodType(
+            _begin(mode), connection
+        )
+
+
+def _begin(mode):
+    def start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN %s' % mode)
+    return start_transaction_under_autocommit
+
+
+def checkpoint(connection):
+    """
+    Move everything in a WAL database's log into the database file, so the
+    file can be copied on its own.
+    """
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        cursor.close()
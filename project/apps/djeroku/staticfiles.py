@@ -0,0 +1,398 @@
+"""
+Incremental, parallel static file collection.
+
+`collectstatic` copies every file from every finder into STATIC_ROOT, one at
+a time, on every run. `IncrementalCollector` (used by `python manage.py
+collectstatic_incremental`) keeps a manifest of what it collected last time
+- source path, size, mtime and md5 of every file - and:
+
+- skips files whose size and mtime are unchanged without reading them
+- hashes the rest in a pool of worker processes, and only copies and post
+  processes the ones whose content actually changed
+- post processes changed files by writing a content-hashed copy
+  (img/logo.png -> img/logo.<md5>.png) and, for text types, a gzipped copy
+- writes the hashed copy of a stylesheet with its url()s and @imports
+  pointing at the hashed names, hashed after rewriting - like
+  ManifestStaticFilesStorage - and writes it again whenever a file it
+  references gets a new hashed name
+- removes files it collected before whose source no longer exists
+
+The manifest is kept at STATICFILES_MANIFEST, outside STATIC_ROOT, so it is
+never served. `FingerprintedStaticFilesStorage` serves the hashed names from
+it so they can be cached forever; set it as STATICFILES_STORAGE to use them.
+"""
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import gzip
+import hashlib
+import json
+from multiprocessing import Pool, cpu_count
+import os
+import posixpath
+import re
+import shutil
+from time import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.contrib.staticfiles.storage import StaticFilesStorage
+from django.utils.six.moves.urllib.parse import urlsplit
+
+
+MANIFEST_VERSION = 2
+
+# extensions worth a gzipped copy, and the smallest file worth compressing
+COMPRESS_EXTENSIONS = (
+    '.css', '.js', '.json', '.svg', '.txt', '.html', '.xml', '.map', '.eot',
+    '.ttf',
+)
+COMPRESS_MIN_SIZE = 256
+
+# the references rewritten in the hashed copies of stylesheets
+STYLESHEET_EXTENSION = '.css'
+_CSS_URL_RE = re.compile(
+    br"""(url\(\s*['"]?\s*|@import\s*['"])([^'"\)\s]+)""", re.IGNORECASE
+)
+
+
+def default_ignore_patterns():
+    """
+    collectstatic's default ignore patterns: the staticfiles app config's
+    where it has them (Django 1.10+), the ones hard-coded in Django 1.8's
+    command otherwise.
+    """
+    config = apps.get_app_config('staticfiles')
+    return list(getattr(config, 'ignore_patterns', ['CVS', '.*', '*~']))
+
+
+def manifest_path():
+    return getattr(settings, 'STATICFILES_MANIFEST',
+                   os.path.join(settings.SITE_ROOT, 'staticfiles.json'))
+
+
+class IncrementalCollector(object):
+
+    def __init__(self, static_root=None, workers=None, post_process=True,
+                 ignore_patterns=None, manifest=None):
+        self.static_root = static_root or settings.STATIC_ROOT
+        self.workers = workers or cpu_count()
+        self.post_process = post_process
+        if ignore_patterns is None:
+            ignore_patterns = default_ignore_patterns()
+        self.ignore_patterns = list(ignore_patterns)
+        self.manifest_path = manifest or manifest_path()
+        self.timings = OrderedDict()
+
+    def collect(self):
+        """
+        Bring STATIC_ROOT up to date. Returns a dict of the collected paths
+        by outcome: processed, skipped (unchanged) and removed (orphans).
+        """
+        start = time()
+        previous = load_manifest(self.manifest_path)
+        found = self.find_files()
+        self.timings['scan'] = time() - start
+
+        start = time()
+        manifest = {}
+        skipped = []
+        jobs = []
+        for path, source in found.items():
+            entry = previous.get(path)
+            stat = os.stat(source)
+            if (entry is not None and entry['source'] == source and
+                    entry['size'] == stat.st_size and
+                    entry['mtime'] == stat.st_mtime and
+                    os.path.exists(os.path.join(self.static_root, path))):
+                manifest[path] = entry
+                skipped.append(path)
+                continue
+            jobs.append((path, source, self.static_root, entry,
+                         self.post_process))
+
+        processed = []
+        if jobs:
+            workers = min(self.workers, len(jobs))
+            if workers > 1:
+                pool = Pool(workers)
+                try:
+                    results = pool.map(process_file, jobs, chunksize=8)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                # no pool for one worker (which a daemon process can't have)
+                results = [process_file(job) for job in jobs]
+            for path, entry, copied in results:
+                manifest[path] = entry
+                if not copied:
+                    skipped.append(path)
+                    continue
+                processed.append(path)
+                # the content changed, so the old hashed copy is stale
+                old = previous.get(path)
+                if old and old.get('hashed') not in (None, entry['hashed']):
+                    remove_collected(
+                        self.static_root, old['hashed'], {}
+                    )
+        self.timings['process'] = time() - start
+
+        start = time()
+        removed = []
+        for path in set(previous) - set(found):
+            remove_collected(self.static_root, path, previous[path])
+            removed.append(path)
+        self.timings['orphans'] = time() - start
+
+        if self.post_process:
+            start = time()
+            processed.extend(
+                path for path in self.rewrite_stylesheets(manifest)
+                if path not in processed
+            )
+            self.timings['stylesheets'] = time() - start
+
+        save_manifest(self.manifest_path, manifest)
+        return {'processed': processed, 'skipped': skipped, 'removed': removed}
+
+    def find_files(self):
+        """Map each static path to its source file, first finder wins."""
+        found = OrderedDict()
+        for finder in get_finders():
+            for path, storage in finder.list(self.ignore_patterns):
+                prefixed_path = path
+                if getattr(storage, 'prefix', None):
+                    prefixed_path = os.path.join(storage.prefix, path)
+                if prefixed_path not in found:
+                    found[prefixed_path] = storage.path(path)
+        return found
+
+    def rewrite_stylesheets(self, manifest):
+        """
+        Write the hashed copies of the stylesheets that changed, or that
+        reference a file whose hashed name changed (stylesheets they
+        @import first). Returns the paths of the stylesheets written.
+        """
+        checked = set()
+        written = []
+
+        def current(path, stack=()):
+            entry = manifest.get(path)
+            if entry is None:
+                return None
+            if (path.endswith(STYLESHEET_EXTENSION) and
+                    path not in checked and path not in stack):
+                checked.add(path)
+                stack += (path,)
+                references = entry.get('references') or {}
+                if entry['hashed'] is None or any(
+                        current(name, stack) != hashed
+                        for name, hashed in references.items()):
+                    self.rewrite_stylesheet(
+                        path, entry, lambda name: current(name, stack)
+                    )
+                    written.append(path)
+            return entry['hashed']
+
+        for path in list(manifest):
+            current(path)
+        return written
+
+    def rewrite_stylesheet(self, path, entry, hashed):
+        """
+        Write the hashed copy of one stylesheet, its references pointing at
+        the names `hashed(name)` returns.
+        """
+        with open(os.path.join(self.static_root, path), 'rb') as f:
+            content = f.read()
+
+        references = {}
+
+        def relink(match):
+            url = match.group(2).decode('utf-8')
+            name, relative = static_name(path, url)
+            if name is None:
+                return match.group(0)
+            target = references[name] = hashed(name)
+            if target is None:
+                return match.group(0)
+            parts = urlsplit(url)
+            if relative:
+                new = posixpath.join(posixpath.dirname(parts.path),
+                                     posixpath.basename(target))
+            else:
+                new = settings.STATIC_URL + target
+            new += url[len(parts.path):]
+            return match.group(1) + new.encode('utf-8')
+
+        content = _CSS_URL_RE.sub(relink, content)
+        name = hashed_name(path, hashlib.md5(content).hexdigest())
+        if entry.get('hashed') not in (None, name):
+            remove_collected(self.static_root, entry['hashed'], {})
+        with open(os.path.join(self.static_root, name), 'wb') as f:
+            f.write(content)
+        entry['hashed'] = name
+        entry['references'] = references
+
+
+def static_name(stylesheet, url):
+    """
+    The static path a url in `stylesheet` refers to, and whether the url
+    is relative - (None, False) for urls outside the static files.
+    """
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc or not parts.path:
+        return None, False
+    if parts.path.startswith('/'):
+        if not parts.path.startswith(settings.STATIC_URL):
+            return None, False
+        return parts.path[len(settings.STATIC_URL):], False
+    return posixpath.normpath(posixpath.join(
+        posixpath.dirname(stylesheet), parts.path
+    )), True
+
+
+# WORKER
+def process_file(job):
+    """
+    Hash one source file and, if its content changed, copy and post process
+    it into the static root. Runs in the worker processes, so it only uses
+    the standard library. Returns (path, manifest entry, copied).
+    """
+    path, source, static_root, previous, post_process = job
+
+    digest = hashlib.md5()
+    with open(source, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    md5 = digest.hexdigest()
+
+    stat = os.stat(source)
+    entry = {
+        'source': source,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'md5': md5,
+        'hashed': None,
+        'gzipped': False,
+    }
+    stylesheet = path.endswith(STYLESHEET_EXTENSION)
+    if post_process and not stylesheet:
+        entry['hashed'] = hashed_name(path, md5)
+    target = os.path.join(static_root, path)
+    if (previous is not None and previous['md5'] == md5 and
+            os.path.exists(target) and
+            bool(previous.get('hashed')) == post_process):
+        entry['hashed'] = previous.get('hashed')
+        entry['gzipped'] = previous.get('gzipped', False)
+        if 'references' in previous:
+            entry['references'] = previous['references']
+        return path, entry, False
+
+    _copy(source, target)
+    # a stylesheet's hashed copy is written once every file it references
+    # has been hashed (IncrementalCollector.rewrite_stylesheets)
+    if post_process and not stylesheet:
+        _copy(source, os.path.join(static_root, entry['hashed']))
+    if (post_process and path.endswith(COMPRESS_EXTENSIONS) and
+            stat.st_size >= COMPRESS_MIN_SIZE):
+        _gzip(source, target + '.gz')
+        entry['gzipped'] = True
+    elif os.path.exists(target + '.gz'):
+        # from an older, bigger version - it would be served instead
+        os.remove(target + '.gz')
+    return path, entry, True
+
+
+def hashed_name(path, md5):
+    root, ext = os.path.splitext(path)
+    return '%s.%s%s' % (root, md5[:12], ext)
+
+
+def _copy(source, target):
+    directory = os.path.dirname(target)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # another worker made it first
+            if not os.path.isdir(directory):
+                raise
+    shutil.copy2(source, target)
+
+
+def _gzip(source, target):
+    with open(source, 'rb') as f_in:
+        out = gzip.GzipFile(target, 'wb', 9)
+        try:
+            shutil.copyfileobj(f_in, out)
+        finally:
+            out.close()
+# END WORKER
+
+
+# MANIFEST
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest['files']
+
+
+def save_manifest(path, files):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'files': files}, f)
+    os.rename(temp_path, path)
+
+
+def remove_collected(static_root, path, entry):
+    """Delete a collected file and its post processed copies."""
+    names = [path]
+    if entry.get('hashed'):
+        names.append(entry['hashed'])
+    if entry.get('gzipped'):
+        names.append(path + '.gz')
+    for name in names:
+        try:
+            os.remove(os.path.join(static_root, name))
+        except OSError:
+            pass
+# END MANIFEST
+
+
+class FingerprintedStaticFilesStorage(StaticFilesStorage):
+    """
+    Static files storage that links to the content-hashed copies written by
+    `collectstatic_incremental`, so they can be served with far future
+    cache headers. Files missing from the manifest (or everything, when it
+    hasn't been built) are served under their plain names.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(FingerprintedStaticFilesStorage, self).__init__(*args, **kwargs)
+        self._hashed_names = None
+
+    @property
+    def hashed_names(self):
+        if self._hashed_names is None:
+            files = load_manifest(manifest_path())
+            self._hashed_names = dict(
+                (path, entry['hashed'])
+                for path, entry in files.items() if entry.get('hashed')
+            )
+        return self._hashed_names
+
+    def url(self, name):
+        name = self.hashed_names.get(name, name)
+        return super(FingerprintedStaticFilesStorage, self).url(name)
@@ -0,0 +1,245 @@
+"""
+Celery tasks for the djeroku app. Found by the celery app's autodiscovery.
+"""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+import logging
+from time import time
+import traceback
+
+from celery import group, shared_task
+from django.conf import settings
+from django.core.mail import mail_admins
+
+from djeroku import batches, uploads, warmup
+from djeroku.mail import (
+    close_quietly, deserialize_message, get_connection_pool
+)
+from djeroku.models import BatchChunk, BatchJob, Upload
+
+
+logger = logging.getLogger('djeroku.tasks')
+
+
+@shared_task(
+    bind=True,
+    ignore_result=True,
+    max_retries=3,
+    default_retry_delay=60,
+)
+def send_error_digest(self, entries, dropped=0):
+    """Mail the admins one message covering every aggregated error."""
+    entries = sorted(entries, key=lambda entry: -entry['count'])
+    occurrences = sum(entry['count'] for entry in entries)
+
+    sections = []
+    if dropped:
+        sections.append(
+            '%d more errors were dropped because the buffer was full.' %
+            dropped
+        )
+    for entry in entries:
+        lines = [
+            '%(count)dx %(level)s %(logger)s: %(message)s' % entry,
+            'first seen %s, last seen %s' % (
+                _format_timestamp(entry['first_seen']),
+                _format_timestamp(entry['last_seen'])
+            ),
+        ]
+        if entry['request']:
+            lines.append(entry['request'])
+        if entry['traceback']:
+            lines.extend(['', entry['traceback']])
+        sections.append('\n'.join(lines))
+
+    subject = '%d errors (%d occurrences)' % (len(entries), occurrences)
+    try:
+        mail_admins(subject, '\n\n\n'.join(sections))
+    except Exception as e:
+        raise self.retry(exc=e)
+
+
+def _format_timestamp(timestamp):
+    return datetime.utcfromtimestamp(timestamp).strftime(
+        '%Y-%m-%d %H:%M:%S UTC'
+    )
+
+
+@shared_task(
+    bind=True,
+    ignore_result=True,
+    max_retries=getattr(settings, 'EMAIL_QUEUE_MAX_RETRIES', 5),
+)
+def send_emails(self, messages):
+    """
+    Send a batch of messages queued by djeroku.mail.CeleryEmailBackend over
+    a pooled connection. Messages that fail are retried as a smaller batch
+    with exponential backoff.
+    """
+    start = time()
+    sent = 0
+    failed = []
+    error = None
+    with get_connection_pool().connection() as connection:
+        for data in messages:
+            try:
+                connection.open()
+                if connection.send_messages([deserialize_message(data)]):
+                    sent += 1
+            except Exception as e:
+                # the connection may be broken, so the next message gets a
+                # fresh one
+                close_quietly(connection)
+                failed.append(data)
+                error = e
+
+    elapsed = time() - start
+    logger.info(
+        'email batch: %d sent, %d failed in %.3fs (%.1f messages/s)',
+        sent, len(failed), elapsed, sent / elapsed if elapsed else 0
+    )
+
+    if failed:
+        delay = getattr(settings, 'EMAIL_QUEUE_RETRY_DELAY', 30)
+        raise self.retry(
+            args=(failed,), exc=error,
+            countdown=delay * 2 ** self.request.retries
+        )
+    return dict(sent=sent, failed=len(failed), seconds=elapsed)
+
+
+@shared_task(bind=True, ignore_result=True)
+def run_batch_job(self, job_id):
+    """
+    Top a djeroku.batches job's in-flight chunks back up to its concurrency.
+    Eager (CELERY_ALWAYS_EAGER) runs keep going until the job is done, since
+    their chunks finish before this returns.
+    """
+    while True:
+        chunks = batches.claim_chunks(job_id)
+        if chunks:
+            group(run_batch_chunk.s(chunk.pk) for chunk in chunks).delay()
+        if not chunks or not self.request.is_eager:
+            break
+
+    job = BatchJob.objects.get(pk=job_id)
+    logger.info(
+        'batch job %s: %d of %s rows, %d chunks done, %d failed',
+        job.name, job.rows_done, job.total, job.chunks_done,
+        job.chunks_failed
+    )
+
+
+@shared_task(
+    bind=True,
+    ignore_result=True,
+    acks_late=True,
+    max_retries=3,
+    default_retry_delay=30,
+)
+def run_batch_chunk(self, chunk_id):
+    """Process one chunk of a djeroku.batches job."""
+    chunk = BatchChunk.objects.select_related('job').get(pk=chunk_id)
+    if chunk.status != BatchChunk.DISPATCHED:
+        # redelivered after it finished
+        return
+
+    try:
+        batches.run_chunk(chunk)
+    except Exception as e:
+        retry = self.request.retries < self.max_retries
+        if retry and not self.request.is_eager:
+            raise self.retry(exc=e)
+        logger.exception('batch job %s: chunk %s-%s failed',
+                         chunk.job.name, chunk.first, chunk.last)
+        batches.finish_chunk(chunk, error=traceback.format_exc())
+    else:
+        batches.finish_chunk(chunk)
+
+    if not self.request.is_eager:
+        run_batch_job.delay(chunk.job_id)
+
+
+@shared_task(bind=True, ignore_result=True)
+def watch_batch_job(self, job_id):
+    """
+    Dispatch again the chunks of a djeroku.batches job whose tasks were
+    lost, and check again in BATCH_WATCH_INTERVAL seconds until it's done.
+    """
+    run_batch_job.delay(job_id)
+    job = BatchJob.objects.get(pk=job_id)
+    if job.status != BatchJob.DONE and not self.request.is_eager:
+        batches.watch(job)
+
+
+@shared_task(ignore_result=True)
+def warm_cache(report_after=15):
+    """
+    Warm the cache after a release (see djeroku.warmup), and log the
+    sampled hit rate `report_after` minutes later.
+    """
+    result = warmup.warm()
+    logger.info(
+        'cache warm up: %d/%d urls ok, %d keys present, %d rebuilt, '
+        '%d missing in %.2fs',
+        result['urls_ok'], result['urls'], result['keys_present'],
+        result['keys_rebuilt'], result['keys_missing'], result['seconds']
+    )
+    if report_after:
+        report_cache_hit_rate.apply_async(
+            (report_after,), countdown=report_after * 60
+        )
+
+
+@shared_task(ignore_result=True)
+def report_cache_hit_rate(minutes=15):
+    """Log the sampled hit rate of each minute since the last warm up."""
+    for start, hits, misses in warmup.hit_rates(minutes):
+        reads = hits + misses
+        logger.info(
+            'cache hit rate %s: %s of %d sampled reads',
+            datetime.utcfromtimestamp(start).strftime('%H:%M'),
+            '%.1f%%' % (100.0 * hits / reads) if reads else '-', reads
+        )
+
+
+@shared_task(
+    bind=True,
+    ignore_result=True,
+    acks_late=True,
+    max_retries=3,
+    default_retry_delay=30,
+)
+def process_upload(self, upload_id):
+    """
+    Join the parts of a djeroku.uploads upload under its content hashed
+    name, then queue its derivatives.
+    """
+    upload = Upload.objects.get(pk=upload_id)
+    if upload.status != Upload.PROCESSING:
+        # redelivered after it finished
+        return
+
+    start = time()
+    try:
+        uploads.process(upload)
+    except Exception as e:
+        retry = self.request.retries < self.max_retries
+        if retry and not self.request.is_eager:
+            raise self.retry(exc=e)
+        logger.exception('upload %s: processing failed', upload_id)
+        uploads.fail(upload, traceback.format_exc())
+        return
+
+    logger.info('upload %s: %d bytes, sha256 %s in %.2fs', upload_id,
+                upload.size, upload.sha256 or '-', time() - start)
+    if upload.status == Upload.READY:
+        make_upload_derivatives.delay(upload_id)
+
+
+@shared_task(ignore_result=True, acks_late=True)
+def make_upload_derivatives(upload_id):
+    """Make the UPLOAD_DERIVATIVES of an uploaded image."""
+    uploads.make_derivatives(Upload.objects.get(pk=upload_id))
@@ -0,0 +1,639 @@
+"""
+Test helpers.
+
+`DjerokuTestRunner` is the project's TEST_RUNNER (so `fab test` uses it). It
+turns on query inspection for the test run and makes an exceeded view query
+budget fail the test that made the request, and:
+
+- keeps the test database between runs (TEST_REUSE_DB) and reuses it as long
+  as the schema fingerprint stored in it matches the migrations and models on
+  disk, so `migrate` only runs when the schema actually changed
+- shards the suite across TEST_PARALLEL worker processes (0 for one per
+  CPU), each with its own copy of the test database, keeping the tests of a
+  TestCase class together so setUpClass runs once
+- prints the slowest tests and the time spent in each app's tests
+- keeps sqlite test databases in a file (with the SQLITE_PRAGMAS tuning),
+  unless TEST_SQLITE_IN_MEMORY is set: an in-memory database skips the disk
+  entirely, but is rebuilt every run and can't be shared by workers
+
+`python manage.py test --parallel=1 --no-reuse-db --in-memory` runs the suite
+the plain Django way.
+
+`QueryBudgetMixin` adds query assertions to any TestCase:
+
+    class ArticleTests(QueryBudgetMixin, TestCase):
+        def test_list(self):
+            with self.assertMaxQueries(4):
+                self.client.get('/articles/')
+
+        def test_feed(self):
+            with self.assertNoNPlusOne():
+                build_feed()
+"""
+
+from __future__ import absolute_import
+
+from collections import defaultdict
+from contextlib import contextmanager
+from multiprocessing import Pool, cpu_count
+import os
+import shutil
+import sys
+from time import time
+import unittest
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.runner import (
+    DebugSQLTextTestResult, DiscoverRunner, dependency_ordered
+)
+from django.test.utils import override_settings
+
+from djeroku import queries, sqlite
+from djeroku.schema import schema_fingerprint
+
+
+# a raw table, so flushes between tests leave it alone
+FINGERPRINT_TABLE = 'djeroku_test_fingerprint'
+
+SLOWEST_TESTS = 10
+
+# vendors whose test databases can be copied for the worker processes
+CLONEABLE_VENDORS = ('sqlite', 'postgresql')
+
+
+class DjerokuTestRunner(DiscoverRunner):
+
+    def __init__(self, parallel=None, reuse_db=None, in_memory=None,
+                 **kwargs):
+        super(DjerokuTestRunner, self).__init__(**kwargs)
+        if parallel is None:
+            parallel = getattr(settings, 'TEST_PARALLEL', 0)
+        if reuse_db is None:
+            reuse_db = getattr(settings, 'TEST_REUSE_DB', True)
+        if in_memory is None:
+            in_memory = getattr(settings, 'TEST_SQLITE_IN_MEMORY', False)
+        self.parallel = parallel or cpu_count()
+        # an in-memory database is gone when the run ends
+        self.reuse_db = reuse_db and not in_memory
+        self.in_memory = in_memory
+        self.clones = []
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super(DjerokuTestRunner, cls).add_arguments(parser)
+        parser.add_argument(
+            '--parallel', type=int, default=None,
+            help='Number of worker processes, 0 for one per CPU (default '
+                 'settings.TEST_PARALLEL).'
+        )
+        parser.add_argument(
+            '--no-reuse-db', action='store_false', dest='reuse_db',
+            default=None,
+            help='Build the test database from scratch and destroy it '
+                 'afterwards.'
+        )
+        parser.add_argument(
+            '--in-memory', action='store_true', dest='in_memory',
+            default=None,
+            help='Keep sqlite test databases in memory (rebuilt every run, '
+                 'tests run in one process).'
+        )
+
+    def setup_test_environment(self, **kwargs):
+        super(DjerokuTestRunner, self).setup_test_environment(**kwargs)
+        self._query_settings = override_settings(
+            QUERY_INSPECTION_ENABLED=True,
+            QUERY_BUDGET_RAISE=True,
+        )
+        self._query_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._query_settings.disable()
+        super(DjerokuTestRunner, self).teardown_test_environment(**kwargs)
+
+    # DATABASES
+    def setup_databases(self, **kwargs):
+        start = time()
+        if not self.in_memory:
+            for alias in connections:
+                if connections[alias].vendor != 'sqlite':
+                    continue
+                name = _use_test_database_file(connections[alias])
+                if name and not self.reuse_db:
+                    # the copy a reusing run left behind, ours to replace
+                    _remove_sqlite_files(name)
+        if self.reuse_db:
+            old_config = self._setup_reused_databases()
+        else:
+            old_config = super(DjerokuTestRunner, self).setup_databases(
+                **kwargs
+            )
+        if self.verbosity >= 1:
+            print('Test databases ready in %.2fs' % (time() - start))
+        return old_config
+
+    def _setup_reused_databases(self):
+        """
+        DiscoverRunner.setup_databases, creating each test database only
+        when there isn't one with the current schema to reuse.
+        """
+        mirrored_aliases = {}
+        test_databases = {}
+        dependencies = {}
+        default_sig = (
+            connections[DEFAULT_DB_ALIAS].creation.test_db_signature()
+        )
+        for alias in connections:
+            connection = connections[alias]
+            test_settings = connection.settings_dict['TEST']
+            if test_settings['MIRROR']:
+                mirrored_aliases[alias] = test_settings['MIRROR']
+                continue
+
+            item = test_databases.setdefault(
+                connection.creation.test_db_signature(),
+                (connection.settings_dict['NAME'], set())
+            )
+            item[1].add(alias)
+            if 'DEPENDENCIES' in test_settings:
+                dependencies[alias] = test_settings['DEPENDENCIES']
+            elif (alias != DEFAULT_DB_ALIAS and
+                    connection.creation.test_db_signature() != default_sig):
+                dependencies[alias] = [DEFAULT_DB_ALIAS]
+
+        old_names = []
+        mirrors = []
+        for signature, (db_name, aliases) in dependency_ordered(
+                test_databases.items(), dependencies):
+            test_db_name = None
+            for alias in aliases:
+                connection = connections[alias]
+                if test_db_name is None:
+                    test_db_name = self._create_or_reuse(connection)
+                    destroy = True
+                else:
+                    connection.settings_dict['NAME'] = test_db_name
+                    destroy = False
+                old_names.append((connection, db_name, destroy))
+
+        for alias, mirror_alias in mirrored_aliases.items():
+            mirrors.append((alias, connections[alias].settings_dict['NAME']))
+            connections[alias].settings_dict['NAME'] = (
+                connections[mirror_alias].settings_dict['NAME'])
+
+        if self.debug_sql:
+            for alias in connections:
+                connections[alias].force_debug_cursor = True
+        return old_names, mirrors
+
+    def _create_or_reuse(self, connection):
+        creation = connection.creation
+        test_name = creation._get_test_db_name()
+        fingerprint = schema_fingerprint(connection)
+        stored = _stored_fingerprint(connection, test_name)
+        serialize = connection.settings_dict['TEST'].get('SERIALIZE', True)
+
+        if stored != fingerprint:
+            if self.verbosity >= 1 and stored is not None:
+                print("Schema of test database for alias '%s' changed "
+                      "(%s -> %s)." % (connection.alias, stored, fingerprint))
+            # a stale copy of our own test database can go without asking
+            creation.create_test_db(
+                self.verbosity,
+                autoclobber=stored is not None or not self.interactive,
+                serialize=serialize,
+            )
+            _store_fingerprint(connection, fingerprint)
+            return test_name
+
+        # what create_test_db does, less creating and migrating
+        if self.verbosity >= 1:
+            print("Reusing test database for alias '%s' (schema %s)..." % (
+                connection.alias, fingerprint))
+        connection.close()
+        settings.DATABASES[connection.alias]['NAME'] = test_name
+        connection.settings_dict['NAME'] = test_name
+        if serialize:
+            connection._test_serialized_contents = (
+                creation.serialize_db_to_string()
+            )
+        connection.ensure_connection()
+        return test_name
+
+    def teardown_databases(self, old_config, **kwargs):
+        old_names, mirrors = old_config
+        for connection, old_name, destroy in old_names:
+            if destroy:
+                connection.creation.destroy_test_db(
+                    old_name, self.verbosity, self.keepdb or self.reuse_db
+                )
+
+    def _clone_databases(self, old_names, count):
+        """
+        Copy every test database `count` times, one copy for each worker.
+        Returns {alias: [clone name, ...]}, or None if a database can't be
+        copied.
+        """
+        created = [c for c, old_name, destroy in old_names if destroy]
+        if any(c.vendor not in CLONEABLE_VENDORS for c in created):
+            return None
+
+        names = {}
+        for connection in created:
+            source = connection.settings_dict['NAME']
+            if (connection.vendor == 'sqlite' and
+                    connection.is_in_memory_db(source)):
+                return None
+            if connection.vendor == 'sqlite':
+                connection.ensure_connection()
+                sqlite.checkpoint(connection)
+            connection.close()
+            names[connection.alias] = []
+            for index in range(count):
+                clone = _clone_name(connection, source, index)
+                if connection.vendor == 'sqlite':
+                    shutil.copyfile(source, clone)
+                else:
+                    _clone_postgresql(connection, source, clone)
+                names[connection.alias].append(clone)
+                self.clones.append((connection, clone))
+
+        for connection, old_name, destroy in old_names:
+            if not destroy:
+                # a duplicate alias of a database copied above
+                for other in created:
+                    if (other.settings_dict['NAME'] ==
+                            connection.settings_dict['NAME']):
+                        names[connection.alias] = names[other.alias]
+        return names
+
+    def _destroy_clones(self):
+        for connection, clone in self.clones:
+            try:
+                if connection.vendor == 'sqlite':
+                    _remove_sqlite_files(clone)
+                else:
+                    with connection._nodb_connection.cursor() as cursor:
+                        cursor.execute('DROP DATABASE IF EXISTS %s' % (
+                            connection.ops.quote_name(clone)))
+            except Exception as e:
+                sys.stderr.write('Could not remove test database copy %s: '
+                                 '%s\n' % (clone, e))
+        self.clones = []
+    # END DATABASES
+
+    # RUNNING
+    def get_resultclass(self):
+        base = DebugSQLTextTestResult if self.debug_sql else (
+            unittest.TextTestResult
+        )
+        return type(str('TimedTestResult'), (TimingMixin, base), {})
+
+    def run_tests(self, test_labels, extra_tests=None, **kwargs):
+        self.setup_test_environment()
+        suite = self.build_suite(test_labels, extra_tests)
+        old_config = self.setup_databases()
+        try:
+            result = self.run_suite(suite, old_config=old_config)
+        finally:
+            self._destroy_clones()
+            self.teardown_databases(old_config)
+            self.teardown_test_environment()
+        self.report_timings(result.timings)
+        return self.suite_result(suite, result)
+
+    def run_suite(self, suite, old_config=None, **kwargs):
+        shards = []
+        if self.parallel > 1 and old_config is not None:
+            shards = partition(suite, self.parallel)
+        clones = None
+        if len(shards) > 1:
+            clones = self._clone_databases(old_config[0], len(shards))
+            if clones is None:
+                sys.stderr.write(
+                    'Running the tests serially, the test databases can\'t '
+                    'be copied for the workers.\n'
+                )
+
+        if clones is None:
+            return self.test_runner(
+                verbosity=self.verbosity,
+                failfast=self.failfast,
+                resultclass=self.get_resultclass(),
+            ).run(suite)
+        return self._run_parallel(shards, clones)
+
+    def _run_parallel(self, shards, clones):
+        global _worker_state
+        _worker_state = dict(
+            shards=shards,
+            clones=clones,
+            resultclass=self.get_resultclass(),
+            verbosity=self.verbosity,
+            failfast=self.failfast,
+        )
+        if self.verbosity >= 1:
+            print('Running %d tests in %d processes...' % (
+                sum(shard.countTestCases() for shard in shards),
+                len(shards)))
+
+        # the workers are forked, and mustn't share the open connections
+        connections.close_all()
+        start = time()
+        pool = Pool(len(shards))
+        try:
+            summaries = pool.map(run_shard, range(len(shards)), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            _worker_state = None
+
+        result = CombinedResult(summaries)
+        result.print_summary(sys.stderr, time() - start)
+        return result
+
+    def report_timings(self, timings):
+        if self.verbosity < 1 or not timings:
+            return
+        print('\nSlowest tests:')
+        for test_id, seconds in sorted(
+                timings, key=lambda timing: -timing[1])[:SLOWEST_TESTS]:
+            print('  %7.3fs  %s' % (seconds, test_id))
+
+        by_app = defaultdict(lambda: [0, 0.0])
+        for test_id, seconds in timings:
+            app = by_app[_app_label(test_id)]
+            app[0] += 1
+            app[1] += seconds
+        print('\nTime by app:')
+        for label, (count, seconds) in sorted(
+                by_app.items(), key=lambda item: -item[1][1]):
+            print('  %7.3fs  %s (%d tests)' % (seconds, label, count))
+    # END RUNNING
+
+
+# DATABASE HELPERS
+def _use_test_database_file(connection):
+    """
+    Point a sqlite connection's in-memory test database at a file next to
+    its database instead, so it survives between runs and can be copied.
+    Returns the file's name, or None if the test database is left alone.
+    """
+    test_settings = connection.settings_dict['TEST']
+    name = connection.settings_dict['NAME']
+    if (not connection.is_in_memory_db(test_settings['NAME'] or ':memory:') or
+            not name or connection.is_in_memory_db(name)):
+        return None
+    directory, filename = os.path.split(name)
+    test_settings['NAME'] = os.path.join(directory, 'test_' + filename)
+    return test_settings['NAME']
+
+
+def _remove_sqlite_files(name):
+    """Remove a sqlite database file and its WAL files."""
+    for path in (name, name + '-wal', name + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _stored_fingerprint(connection, test_name):
+    """The schema fingerprint saved in an existing test database, if any."""
+    if connection.vendor == 'sqlite' and (
+            connection.is_in_memory_db(test_name) or
+            not os.path.exists(test_name)):
+        return None
+
+    old_name = connection.settings_dict['NAME']
+    connection.close()
+    connection.settings_dict['NAME'] = test_name
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT fingerprint FROM %s' % FINGERPRINT_TABLE)
+            row = cursor.fetchone()
+        return row[0] if row else None
+    except Exception:
+        # no such database, or no fingerprint in it
+        return None
+    finally:
+        connection.close()
+        connection.settings_dict['NAME'] = old_name
+
+
+def _store_fingerprint(connection, fingerprint):
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TABLE %s (fingerprint varchar(40))' %
+                       FINGERPRINT_TABLE)
+        cursor.execute('INSERT INTO %s (fingerprint) VALUES (%%s)' %
+                       FINGERPRINT_TABLE, [fingerprint])
+    if not connection.get_autocommit():
+        connection.commit()
+
+
+def _clone_name(connection, source, index):
+    if connection.vendor == 'sqlite':
+        root, ext = os.path.splitext(source)
+        return '%s_%d%s' % (root, index + 1, ext)
+    return '%s_%d' % (source, index + 1)
+
+
+def _clone_postgresql(connection, source, clone):
+    qn = connection.ops.quote_name
+    with connection._nodb_connection.cursor() as cursor:
+        cursor.execute('DROP DATABASE IF EXISTS %s' % qn(clone))
+        cursor.execute('CREATE DATABASE %s WITH TEMPLATE %s' % (
+            qn(clone), qn(source)))
+# END DATABASE HELPERS
+
+
+# SHARDS
+def partition(suite, count):
+    """
+    Split a suite into up to `count` suites of about the same number of
+    tests. The tests of a TestCase class stay together and in their
+    original order, so class fixtures and the runner's ordering hold.
+    """
+    groups = defaultdict(list)
+    for index, test in enumerate(_flatten(suite)):
+        groups[type(test)].append((index, test))
+
+    shards = [[] for _ in range(min(count, len(groups)))]
+    for tests in sorted(groups.values(), key=len, reverse=True):
+        min(shards, key=len).extend(tests)
+    return [
+        unittest.TestSuite(test for index, test in sorted(
+            shard, key=lambda item: item[0]))
+        for shard in shards if shard
+    ]
+
+
+def _flatten(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for inner in _flatten(test):
+                yield inner
+        else:
+            yield test
+
+
+def _app_label(test_id):
+    module = test_id.rsplit('.', 2)[0]
+    app_config = apps.get_containing_app_config(module)
+    if app_config is not None:
+        return app_config.label
+    return module.split('.', 1)[0]
+
+
+class TimingMixin(object):
+    """Records how long each test takes, setUp and tearDown included."""
+
+    def startTestRun(self):
+        super(TimingMixin, self).startTestRun()
+        self.timings = []
+
+    def startTest(self, test):
+        self._test_started = time()
+        super(TimingMixin, self).startTest(test)
+
+    def stopTest(self, test):
+        super(TimingMixin, self).stopTest(test)
+        self.timings.append((test.id(), time() - self._test_started))
+
+
+_worker_state = None
+
+
+def run_shard(index):
+    """
+    Run one shard against its own copy of the test databases. Runs in a
+    worker process; returns a picklable summary of the result.
+    """
+    state = _worker_state
+    for alias, names in state['clones'].items():
+        connection = connections[alias]
+        connection.close()
+        settings.DATABASES[alias]['NAME'] = names[index]
+        connection.settings_dict['NAME'] = names[index]
+
+    stream = unittest.runner._WritelnDecorator(sys.stderr)
+    result = state['resultclass'](stream, True, state['verbosity'])
+    result.failfast = state['failfast']
+    result.startTestRun()
+    try:
+        state['shards'][index].run(result)
+    finally:
+        result.stopTestRun()
+        connections.close_all()
+
+    return dict(
+        tests_run=result.testsRun,
+        failures=[_describe(failure) for failure in result.failures],
+        errors=[_describe(error) for error in result.errors],
+        skipped=len(result.skipped),
+        expected_failures=len(result.expectedFailures),
+        unexpected_successes=len(result.unexpectedSuccesses),
+        timings=result.timings,
+    )
+
+
+def _describe(failure):
+    # DebugSQLTextTestResult adds the test's queries as a third item
+    test, text = failure[0], failure[1]
+    if len(failure) > 2 and failure[2]:
+        text = '%s\n%s' % (text, failure[2])
+    return str(test), text
+
+
+class RemoteTest(object):
+    """Stands in for a test that ran in a worker when reporting it."""
+
+    def __init__(self, description):
+        self.description = description
+
+    def __str__(self):
+        return self.description
+
+    def shortDescription(self):
+        return None
+
+
+class CombinedResult(unittest.TextTestResult):
+    """The results of every shard, reported like a single run."""
+
+    def __init__(self, summaries):
+        super(CombinedResult, self).__init__(
+            unittest.runner._WritelnDecorator(sys.stderr), True, 1
+        )
+        self.timings = []
+        self.skipped_count = 0
+        self.expected_failure_count = 0
+        for summary in summaries:
+            self.testsRun += summary['tests_run']
+            self.failures.extend(
+                (RemoteTest(description), text)
+                for description, text in summary['failures'])
+            self.errors.extend(
+                (RemoteTest(description), text)
+                for description, text in summary['errors'])
+            self.unexpectedSuccesses.extend(
+                [None] * summary['unexpected_successes'])
+            self.skipped_count += summary['skipped']
+            self.expected_failure_count += summary['expected_failures']
+            self.timings.extend(summary['timings'])
+
+    def print_summary(self, stream, seconds):
+        """What unittest.TextTestRunner prints at the end of a run."""
+        stream.write('\n')
+        self.printErrors()
+        stream.write('%s\n' % self.separator2)
+        stream.write('Ran %d test%s in %.3fs\n\n' % (
+            self.testsRun, '' if self.testsRun == 1 else 's', seconds))
+
+        infos = []
+        if self.failures:
+            infos.append('failures=%d' % len(self.failures))
+        if self.errors:
+            infos.append('errors=%d' % len(self.errors))
+        if self.skipped_count:
+            infos.append('skipped=%d' % self.skipped_count)
+        if self.expected_failure_count:
+            infos.append('expected failures=%d' % self.expected_failure_count)
+        if self.unexpectedSuccesses:
+            infos.append(
+                'unexpected successes=%d' % len(self.unexpectedSuccesses))
+        stream.write('OK' if self.wasSuccessful() else 'FAILED')
+        stream.write(' (%s)\n' % ', '.join(infos) if infos else '\n')
+# END SHARDS
+
+
+class QueryBudgetMixin(object):
+
+    @contextmanager
+    def assertMaxQueries(self, max_queries):
+        """Fail if the block runs more than `max_queries` queries."""
+        scope = queries.open_scope(self.id())
+        try:
+            yield scope
+        finally:
+            scope.close()
+
+        if scope.count > max_queries:
+            lines = ['%d queries run, over the budget of %d' % (
+                scope.count, max_queries
+            )]
+            lines.extend(str(n) for n in scope.n_plus_ones())
+            self.fail('\n'.join(lines))
+
+    @contextmanager
+    def assertNoNPlusOne(self, threshold=None):
+        """Fail if the block repeats a query with different parameters."""
+        scope = queries.open_scope(self.id(), threshold)
+        try:
+            yield scope
+        finally:
+            scope.close()
+
+        n_plus_ones = scope.n_plus_ones()
+        if n_plus_ones:
+            self.fail('\n'.join(str(n) for n in n_plus_ones))
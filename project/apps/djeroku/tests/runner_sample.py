@@ -0,0 +1,39 @@
+"""
+A small suite for test_testing to run with the djeroku test runner in a
+subprocess. Not named test_*.py, so the project's own runs don't pick it
+up.
+"""
+
+from __future__ import absolute_import
+
+import os
+
+from django.test import TestCase
+
+from djeroku.models import BatchJob
+
+
+class First(TestCase):
+
+    def test_writes(self):
+        BatchJob.objects.create(
+            name='first %d' % os.getpid(), function='f', model='m',
+            chunk_size=1, concurrency=1
+        )
+        self.assertEqual(BatchJob.objects.count(), 1)
+
+    def test_empty(self):
+        self.assertEqual(BatchJob.objects.count(), 0)
+
+
+class Second(TestCase):
+
+    def test_writes(self):
+        BatchJob.objects.create(
+            name='second %d' % os.getpid(), function='f', model='m',
+            chunk_size=1, concurrency=1
+        )
+        self.assertEqual(BatchJob.objects.count(), 1)
+
+    def test_empty(self):
+        self.assertEqual(BatchJob.objects.count(), 0)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """The djeroku migrations after a squashmigrations, for test_release."""
+
+    replaces = [
+        ('djeroku', '0001_initial'),
+        ('djeroku', '0002_batchjob_batchchunk'),
+        ('djeroku', '0003_upload_uploadpart'),
+    ]
+
+    dependencies = [
+    ]
+
+    operations = [
+    ]
@@ -0,0 +1,201 @@
+from __future__ import absolute_import
+
+from datetime import timedelta
+import json
+
+from django.core.management import call_command
+from django.db import transaction
+from django.db.transaction import TransactionManagementError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from djeroku import batches
+from djeroku.models import BatchChunk, BatchJob, SlowQuery
+from djeroku.tasks import watch_batch_job
+
+
+processed = []
+
+
+def record_rows(queryset, tag=None):
+    processed.extend((tag, pk) for pk in queryset.values_list('pk', flat=True))
+
+
+def make_rows(count):
+    SlowQuery.objects.bulk_create([
+        SlowQuery(
+            created=timezone.now(), database='default', fingerprint='%d' % i,
+            sql='SELECT %d' % i, duration=1.0
+        )
+        for i in range(count)
+    ])
+    return list(SlowQuery.objects.order_by('pk').values_list('pk', flat=True))
+
+
+class BatchTests(TestCase):
+
+    def setUp(self):
+        del processed[:]
+        self.keys = make_rows(10)
+
+    def create_job(self, queryset=None, chunk_size=3, concurrency=2):
+        """A job as fan_out saves it, without dispatching anything."""
+        if queryset is None:
+            queryset = SlowQuery.objects.all()
+        return batches.create_job('test', queryset, record_rows, chunk_size,
+                                  concurrency)
+
+    def test_chunks_of_primary_keys(self):
+        job = self.create_job(SlowQuery.objects.filter(pk__in=self.keys[1:]))
+        self.assertEqual(job.model, 'djeroku.SlowQuery')
+        self.assertEqual(job.function, '%s.record_rows' % __name__)
+        self.assertEqual(job.total, 9)
+        chunks = job.chunks.all()
+        self.assertEqual(
+            [json.loads(chunk.keys) for chunk in chunks],
+            [[str(pk) for pk in self.keys[i:i + 3]] for i in (1, 4, 7)]
+        )
+        self.assertEqual(
+            set(chunk.status for chunk in chunks), set([BatchChunk.PENDING])
+        )
+
+        empty = batches.create_job('empty', SlowQuery.objects.none(),
+                                   record_rows)
+        self.assertEqual((empty.total, empty.status), (0, BatchJob.DONE))
+
+    def test_claims_up_to_concurrency(self):
+        job = self.create_job()
+
+        chunks = batches.claim_chunks(job.pk)
+        self.assertEqual(
+            [(c.first, c.last, c.rows) for c in chunks],
+            [(str(self.keys[0]), str(self.keys[2]), 3),
+             (str(self.keys[3]), str(self.keys[5]), 3)]
+        )
+        # both chunks are in flight
+        self.assertEqual(batches.claim_chunks(job.pk), [])
+
+        self.assertTrue(batches.finish_chunk(chunks[0]))
+        [chunk] = batches.claim_chunks(job.pk)
+        self.assertEqual((chunk.first, chunk.last),
+                         (str(self.keys[6]), str(self.keys[8])))
+        self.assertEqual(BatchChunk.objects.get(pk=chunk.pk).status,
+                         BatchChunk.DISPATCHED)
+
+    def test_finishes_when_every_chunk_is_done(self):
+        job = self.create_job(chunk_size=4, concurrency=10)
+        chunks = batches.claim_chunks(job.pk)
+        self.assertEqual([c.rows for c in chunks], [4, 4, 2])
+        self.assertEqual(BatchJob.objects.get(pk=job.pk).status,
+                         BatchJob.RUNNING)
+
+        for chunk in chunks:
+            batches.finish_chunk(chunk)
+        self.assertEqual(batches.claim_chunks(job.pk), [])
+        job = BatchJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, BatchJob.DONE)
+        self.assertEqual((job.rows_done, job.chunks_done), (10, 3))
+
+    def test_finish_chunk_counts_once(self):
+        job = self.create_job()
+        chunk = batches.claim_chunks(job.pk)[0]
+        self.assertTrue(batches.finish_chunk(chunk))
+        # a redelivered task finishing the chunk again
+        self.assertFalse(batches.finish_chunk(chunk, error='again'))
+        job = BatchJob.objects.get(pk=job.pk)
+        self.assertEqual((job.rows_done, job.chunks_done, job.chunks_failed),
+                         (3, 1, 0))
+
+    def test_rows_are_the_querysets_when_the_job_started(self):
+        job = self.create_job(chunk_size=5, concurrency=1)
+        make_rows(3)
+        SlowQuery.objects.filter(pk__in=self.keys[:2]).delete()
+        [chunk] = batches.claim_chunks(job.pk)
+        batches.run_chunk(chunk)
+        batches.finish_chunk(chunk)
+        [chunk] = batches.claim_chunks(job.pk)
+        batches.run_chunk(chunk)
+        batches.finish_chunk(chunk)
+
+        # deleted rows are skipped, new rows aren't part of the job
+        self.assertEqual(batches.claim_chunks(job.pk), [])
+        self.assertEqual(sorted(pk for tag, pk in processed), self.keys[2:])
+
+    def test_lost_chunks_are_claimed_again(self):
+        job = self.create_job(chunk_size=4, concurrency=1)
+        [chunk] = batches.claim_chunks(job.pk)
+        self.assertEqual(batches.claim_chunks(job.pk), [])
+
+        BatchChunk.objects.filter(pk=chunk.pk).update(
+            dispatched=timezone.now() - timedelta(hours=2)
+        )
+        [again] = batches.claim_chunks(job.pk, stale_after=3600)
+        self.assertEqual(again.pk, chunk.pk)
+        self.assertGreater(again.dispatched,
+                           timezone.now() - timedelta(minutes=1))
+        # and only once
+        self.assertEqual(batches.claim_chunks(job.pk, stale_after=3600), [])
+
+
+class FanOutTests(TransactionTestCase):
+    """Eager celery runs every chunk before fan_out returns."""
+
+    def setUp(self):
+        del processed[:]
+        self.keys = make_rows(10)
+
+    def test_fan_out_runs_every_row_once(self):
+        job = batches.fan_out(
+            'reindex', SlowQuery.objects.filter(pk__in=self.keys[1:]),
+            record_rows, chunk_size=2, concurrency=3, tag='x'
+        )
+        job = BatchJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, BatchJob.DONE)
+        self.assertEqual(job.total, 9)
+        self.assertEqual(sorted(processed),
+                         [('x', pk) for pk in self.keys[1:]])
+
+        with self.assertRaises(ValueError):
+            batches.fan_out('reindex', SlowQuery.objects.all(), record_rows)
+        # its tasks could run before the job is committed
+        with transaction.atomic():
+            with self.assertRaises(TransactionManagementError):
+                batches.fan_out('other', SlowQuery.objects.all(),
+                                record_rows)
+        self.assertFalse(BatchJob.objects.filter(name='other').exists())
+
+    def lose_a_chunk(self):
+        job = batches.create_job('test', SlowQuery.objects.all(),
+                                 record_rows, chunk_size=4, concurrency=1)
+        # a worker claimed the first chunk and died
+        chunk = batches.claim_chunks(job.pk)[0]
+        BatchChunk.objects.filter(pk=chunk.pk).update(
+            dispatched=timezone.now() - timedelta(hours=2)
+        )
+        return job
+
+    def test_resume_redispatches_stale_chunks(self):
+        job = self.lose_a_chunk()
+        out = StringIO()
+        call_command('batchjobs', resume='test', stale_after=3600,
+                     stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Resumed test.')
+
+        job = BatchJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, BatchJob.DONE)
+        self.assertEqual(sorted(pk for tag, pk in processed), self.keys)
+        self.assertEqual(job.rows_done, 10)
+
+    def test_watch_redispatches_lost_chunks(self):
+        job = self.lose_a_chunk()
+        watch_batch_job.delay(job.pk)
+
+        job = BatchJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, BatchJob.DONE)
+        self.assertEqual(sorted(pk for tag, pk in processed), self.keys)
+
+        out = StringIO()
+        call_command('batchjobs', stdout=out)
+        self.assertIn('test  done  10 of 10 rows (100%)  chunks: 3 done, '
+                      '0 failed, 0 in flight, 0 pending', out.getvalue())
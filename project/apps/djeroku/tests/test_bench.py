@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+
+from djeroku import bench
+from djeroku.wsgi import wsgi_get
+
+
+def result(rps=100.0, p90=0.01, queries=2.0, rss=50e6, errors=0):
+    # ten requests over 10 / rps seconds, the slowest nine at p90
+    latencies = [p90 / 2] + [p90] * 9
+    return bench.Result('wsgi', 'home', latencies, errors, 10.0 / rps,
+                        queries, rss)
+
+
+class ResultTests(SimpleTestCase):
+
+    def test_measurements(self):
+        measured = bench.Result('http', 'home', [0.3, 0.1, 0.2, 0.4], 0, 2.0)
+        self.assertEqual(measured.key, 'http|home')
+        self.assertEqual(measured.rps, 2.0)
+        self.assertEqual(measured.percentile(50), 0.3)
+        self.assertEqual(measured.percentile(99), 0.4)
+        self.assertEqual(bench.Result('http', 'x', [], 0, 0).rps, 0.0)
+        self.assertEqual(bench.Result('http', 'x', [], 0, 0).percentile(90),
+                         0.0)
+
+    def test_compare(self):
+        baseline = {'wsgi|home': result().as_dict()}
+        self.assertEqual(bench.compare([result()], baseline, 0.2), [])
+        # within the tolerance
+        self.assertEqual(
+            bench.compare([result(rps=85, p90=0.0115, rss=55e6)], baseline,
+                          0.2),
+            []
+        )
+
+        regressions = bench.compare(
+            [result(rps=50, p90=0.05, queries=3, rss=80e6, errors=1)],
+            baseline, 0.2
+        )
+        self.assertEqual(len(regressions), 5)
+        self.assertIn('wsgi|home: 1 failed requests', regressions)
+        self.assertIn('wsgi|home: 3.0 queries/request, baseline 2.0',
+                      regressions)
+
+        # no baseline for it yet: only failures count
+        self.assertEqual(bench.compare([result(rps=1)], {}, 0.2), [])
+
+    def test_baseline_round_trip(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'benchmarks.json')
+        self.assertEqual(bench.load_baseline(path), {})
+
+        bench.save_baseline(path, [result()])
+        self.assertEqual(bench.load_baseline(path),
+                         {'wsgi|home': result().as_dict()})
+
+    def test_drive_spreads_requests_over_threads(self):
+        calls = []
+
+        def request(state):
+            state['n'] = state.get('n', 0) + 1
+            calls.append(state['n'])
+            return len(calls) != 3, 2
+
+        latencies, errors, seconds, queries = bench._drive(request, 7, 3)
+        self.assertEqual(len(latencies), 7)
+        self.assertEqual(errors, 1)
+        self.assertEqual(queries, 2.0)
+        # per thread state, 3 + 2 + 2 calls
+        self.assertEqual(sorted(calls), [1, 1, 1, 2, 2, 2, 3])
+
+    def test_no_superuser_outside_test_databases(self):
+        with self.assertRaises(RuntimeError):
+            bench.login_cookie()
+
+
+class WSGIBenchTests(TransactionTestCase):
+    """The real WSGI application, on this test run's database."""
+
+    def setUp(self):
+        if (connection.vendor == 'sqlite' and
+                connection.is_in_memory_db(connection.settings_dict['NAME'])):
+            # the request threads' connections would get databases of their
+            # own
+            self.skipTest('in-memory test database')
+        # as if inside bench.test_databases()
+        bench._test_databases['default'] = 'test'
+        self.addCleanup(bench._test_databases.clear)
+        self.application = get_wsgi_application()
+
+    def test_logged_in_requests(self):
+        self.assertEqual(wsgi_get(self.application, '/admin/'), 302)
+        cookie = bench.login_cookie()
+        self.assertEqual(wsgi_get(self.application, '/admin/', cookie), 200)
+
+        latencies, errors, seconds, queries = bench.bench_wsgi(
+            self.application, '/admin/', cookie, count=4, concurrency=2,
+            warmup=1
+        )
+        self.assertEqual((len(latencies), errors), (4, 0))
+        # the session and the user at least
+        self.assertGreaterEqual(queries, 2)
@@ -0,0 +1,162 @@
+from __future__ import absolute_import
+
+import zlib
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils.http import http_date
+
+from djeroku import compression
+from djeroku.middleware import CompressionMiddleware, WeakETagMiddleware
+
+
+PAGE = b'<p>' + b'hello world ' * 500 + b'</p>'
+
+
+def gunzip(data):
+    return zlib.decompress(data, compression.GZIP_WBITS)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def compress(self, response, **headers):
+        headers.setdefault('HTTP_ACCEPT_ENCODING', 'gzip')
+        with override_settings(COMPRESSION_ENABLED=True):
+            middleware = CompressionMiddleware()
+        # gzip whether or not brotli is installed
+        middleware.encoders = [compression.GzipEncoder()]
+        return middleware.process_response(
+            self.factory.get('/', **headers), response
+        )
+
+    def test_off_by_default(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            CompressionMiddleware()
+
+    def test_compresses_html(self):
+        response = self.compress(HttpResponse(PAGE))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gunzip(response.content), PAGE)
+        self.assertEqual(response['Content-Length'],
+                         str(len(response.content)))
+
+    def test_leaves_pages_with_csrf_tokens_alone(self):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        request.META['CSRF_COOKIE_USED'] = True
+        with override_settings(COMPRESSION_ENABLED=True):
+            response = CompressionMiddleware().process_response(
+                request, HttpResponse(PAGE)
+            )
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, PAGE)
+
+    def test_leaves_small_and_other_responses_alone(self):
+        for response, headers in (
+                (HttpResponse(b'<p>small</p>'), {}),
+                (HttpResponse(PAGE, content_type='image/png'), {}),
+                (HttpResponse(PAGE), {'HTTP_ACCEPT_ENCODING': 'identity'}),
+                (HttpResponse(PAGE), {'HTTP_ACCEPT_ENCODING': 'gzip;q=0'})):
+            response = self.compress(response, **headers)
+            self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streaming(self):
+        chunks = [PAGE[i:i + 100] for i in range(0, len(PAGE), 100)]
+        response = self.compress(StreamingHttpResponse(iter(chunks)))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gunzip(b''.join(response.streaming_content)), PAGE)
+
+        response = self.compress(StreamingHttpResponse(iter([b'<p>a</p>'])))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b'<p>a</p>')
+
+    def test_strong_etag_becomes_weak(self):
+        response = HttpResponse(PAGE)
+        response['ETag'] = '"abc"'
+        self.assertEqual(self.compress(response)['ETag'], 'W/"abc"')
+
+
+@override_settings(ETAGS_ENABLED=True)
+class WeakETagMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = WeakETagMiddleware()
+
+    def get(self, response, method='get', **headers):
+        request = getattr(self.factory, method)('/', **headers)
+        return self.middleware.process_response(request, response)
+
+    def test_adds_weak_etag(self):
+        response = self.get(HttpResponse(PAGE))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], compression.weak_etag(PAGE))
+        self.assertTrue(response['ETag'].startswith('W/"'))
+
+    def test_if_none_match(self):
+        etag = compression.weak_etag(PAGE)
+        response = HttpResponse(PAGE)
+        response['Cache-Control'] = 'max-age=60'
+        response.set_cookie('seen', '1')
+        response = self.get(response, HTTP_IF_NONE_MATCH='"x", ' + etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Cache-Control'], 'max-age=60')
+        self.assertIn('seen', response.cookies)
+
+        # weak comparison: a strong tag with the same value matches
+        response = self.get(HttpResponse(PAGE),
+                            HTTP_IF_NONE_MATCH=etag[2:])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(
+            self.get(HttpResponse(PAGE), HTTP_IF_NONE_MATCH='*').status_code,
+            304
+        )
+        self.assertEqual(
+            self.get(HttpResponse(PAGE), HTTP_IF_NONE_MATCH='W/"other"')
+            .status_code, 200
+        )
+
+    def test_if_modified_since(self):
+        def response():
+            response = HttpResponse(PAGE)
+            response['Last-Modified'] = http_date(1000000)
+            return response
+
+        for since, status in ((1000000, 304), (1000060, 304), (999940, 200)):
+            self.assertEqual(self.get(
+                response(), HTTP_IF_MODIFIED_SINCE=http_date(since)
+            ).status_code, status)
+
+        # If-None-Match takes precedence
+        self.assertEqual(self.get(
+            response(), HTTP_IF_MODIFIED_SINCE=http_date(1000000),
+            HTTP_IF_NONE_MATCH='W/"other"'
+        ).status_code, 200)
+
+    def test_only_successful_gets(self):
+        etag = compression.weak_etag(PAGE)
+        response = self.get(HttpResponse(PAGE), method='post',
+                            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+        response = self.get(HttpResponse(PAGE, status=404),
+                            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_streaming_bodies_are_not_read(self):
+        response = self.get(StreamingHttpResponse(iter([PAGE])))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(b''.join(response.streaming_content), PAGE)
+
+        response = StreamingHttpResponse(iter([PAGE]))
+        response['ETag'] = '"v1"'
+        self.assertEqual(
+            self.get(response, HTTP_IF_NONE_MATCH='"v1"').status_code, 304
+        )
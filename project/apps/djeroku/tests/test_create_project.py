@@ -0,0 +1,175 @@
+from __future__ import absolute_import
+
+import imp
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+from django.test import SimpleTestCase
+from django.utils.six.moves import BaseHTTPServer
+
+
+# the script that creates projects from this template, at its top level
+create = imp.load_source(
+    'create_djeroku_project',
+    os.path.join(settings.SITE_ROOT, 'create_djeroku_project.py')
+)
+
+
+class RequirementsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_read_requirements(self):
+        self.write('base.txt', 'Django==1.8.4  # the framework\n\ncelery\n')
+        path = self.write('dev.txt', '# dev\n-r base.txt\nflake8>=2\n')
+        self.assertEqual(create.read_requirements(path),
+                         ['Django==1.8.4', 'celery', "'flake8>=2'"])
+
+        path = self.write('prod.txt', '-r base.txt\n-e git+https://x#egg=x\n')
+        self.assertIsNone(create.read_requirements(path))
+
+    def test_cached_wheel(self):
+        self.write('Django-1.8.4-py2.py3-none-any.whl', '')
+        self.write('django_extensions-1.5.5-py2-none-any.whl', '')
+        self.assertTrue(create._cached_wheel(self.directory, 'Django==1.8.4'))
+        self.assertTrue(create._cached_wheel(self.directory,
+                                             "'django-extensions==1.5.5'"))
+        self.assertFalse(create._cached_wheel(self.directory, 'Django==1.8'))
+        # unpinned requirements are always built
+        self.assertFalse(create._cached_wheel(self.directory, 'Django'))
+
+
+class WheelCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache)
+        self.wheel_dir = os.path.join(self.cache, 'wheels')
+        self.commands = []
+        venv = create.venv
+        create.venv = self.pip
+        self.addCleanup(setattr, create, 'venv', venv)
+
+    def pip(self, project_name, command):
+        """Stands in for pip: every build also makes the shared `six`."""
+        self.commands.append(command)
+        match = re.match(r'pip wheel -q --wheel-dir=(\S+) --find-links=(\S+) '
+                         r'(\w+)==([\d.]+)', command)
+        if match is None:
+            return True
+        build_dir, find_links, name, version = match.groups()
+        self.assertEqual(find_links, self.wheel_dir)
+        self.assertNotEqual(build_dir, self.wheel_dir)
+        for wheel in (name, 'six'):
+            path = os.path.join(build_dir,
+                                '%s-%s-py2-none-any.whl' % (wheel, version))
+            with open(path, 'w') as f:
+                f.write(name)
+        return name != 'broken'
+
+    def test_builds_in_directories_of_their_own(self):
+        requirements = ['celery==3.1', 'redis==2.10', 'broken==1.0']
+        self.assertTrue(create.install_requirements(
+            'project', requirements, self.wheel_dir
+        ))
+        self.assertEqual(len(self.commands), 4)
+        self.assertTrue(self.commands[-1].startswith(
+            'pip install -q --no-index --find-links=%s ' % self.wheel_dir
+        ))
+        self.assertEqual(sorted(os.listdir(self.wheel_dir)), [
+            'broken-1.0-py2-none-any.whl',
+            'celery-3.1-py2-none-any.whl',
+            'redis-2.10-py2-none-any.whl',
+            'six-1.0-py2-none-any.whl',
+            'six-2.10-py2-none-any.whl',
+            'six-3.1-py2-none-any.whl',
+        ])
+        # the build directories are gone
+        self.assertEqual(os.listdir(self.cache), ['wheels'])
+
+        # cached wheels aren't built again
+        del self.commands[:]
+        create.install_requirements('project', requirements, self.wheel_dir)
+        self.assertEqual(len(self.commands), 1)
+
+    def test_offline_installs_from_the_cache_only(self):
+        create.install_requirements('project', ['celery==3.1'],
+                                    self.wheel_dir, offline=True)
+        self.assertEqual(len(self.commands), 1)
+        self.assertIn('--no-index', self.commands[0])
+
+
+class TemplateHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    etag = '"abc123"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(b'template ' + self.etag.encode('ascii'))
+
+    def log_message(self, *args):
+        pass
+
+
+class TemplateCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache)
+        TemplateHandler.etag = '"abc123"'
+        TemplateHandler.requests = []
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), TemplateHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = 'http://127.0.0.1:%d/master.zip' % server.server_port
+
+    def fetch(self, offline=False):
+        path = create.fetch_template(self.url, self.cache, offline)
+        with open(path) as f:
+            return path, f.read()
+
+    def test_revalidates_with_the_etag(self):
+        path, content = self.fetch()
+        self.assertEqual(content, 'template "abc123"')
+        self.assertEqual(os.path.basename(path), 'abc123.zip')
+
+        self.assertEqual(self.fetch(), (path, content))
+        self.assertEqual(TemplateHandler.requests, [None, '"abc123"'])
+
+        # a new template replaces the old one
+        TemplateHandler.etag = '"def456"'
+        new_path, content = self.fetch()
+        self.assertEqual(content, 'template "def456"')
+        self.assertFalse(os.path.exists(path))
+
+        # offline, from the cache
+        self.assertEqual(self.fetch(offline=True), (new_path, content))
+        self.assertEqual(len(TemplateHandler.requests), 3)
+
+    def test_offline_without_a_cached_copy(self):
+        with self.assertRaises(create.CacheMiss):
+            self.fetch(offline=True)
+        self.assertEqual(create.fetch_template('/local/djeroku', self.cache),
+                         '/local/djeroku')
@@ -0,0 +1,104 @@
+from __future__ import absolute_import, unicode_literals
+
+import json
+
+from django.contrib import admin
+from django.test import RequestFactory, TestCase
+
+from djeroku.admin import export_as_csv, export_as_json
+from djeroku.export import export_response, iterate_rows
+from djeroku.models import SlowQuery
+
+
+def content(response):
+    return b''.join(response.streaming_content).decode('utf-8')
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        for i, sql in enumerate(['SELECT 1', 'SELECT "caf\xe9"', 'SELECT 3',
+                                 'SELECT 4', 'SELECT 5']):
+            SlowQuery.objects.create(
+                database='default', fingerprint='f%d' % i, sql=sql,
+                duration=i / 10.0,
+            )
+        self.queryset = SlowQuery.objects.all()
+
+    def test_csv(self):
+        response = export_response(self.queryset, ['fingerprint', 'sql'],
+                                   chunk_size=2)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="slowquery.csv"')
+        self.assertEqual(content(response).splitlines(), [
+            'fingerprint,sql',
+            'f0,SELECT 1',
+            'f1,"SELECT ""caf\xe9"""',
+            'f2,SELECT 3',
+            'f3,SELECT 4',
+            'f4,SELECT 5',
+        ])
+
+    def test_json(self):
+        response = export_response(
+            self.queryset.filter(duration__gte=0.2),
+            ['fingerprint', 'duration'], format='json', filename='slow.json',
+            chunk_size=2,
+        )
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="slow.json"')
+        self.assertEqual(json.loads(content(response)), [
+            {'fingerprint': 'f2', 'duration': 0.2},
+            {'fingerprint': 'f3', 'duration': 0.3},
+            {'fingerprint': 'f4', 'duration': 0.4},
+        ])
+        self.assertEqual(
+            content(export_response(self.queryset.none(), ['sql'], 'json')),
+            '[\n]\n'
+        )
+
+    def test_every_concrete_field_by_default(self):
+        header = content(export_response(self.queryset)).splitlines()[0]
+        self.assertEqual(header, 'id,created,database,fingerprint,sql,'
+                                 'duration,stack,explain,analyzed')
+
+    def test_keyset_chunks(self):
+        chunks = list(iterate_rows(self.queryset.order_by('-duration'),
+                                   ['fingerprint'], chunk_size=2))
+        # in primary key order, a page at a time
+        self.assertEqual(chunks, [[('f0',), ('f1',)], [('f2',), ('f3',)],
+                                  [('f4',)]])
+        self.assertEqual(list(iterate_rows(self.queryset.filter(pk__in=[]),
+                                           ['sql'])), [])
+
+    def test_sliced_querysets(self):
+        chunks = list(iterate_rows(
+            self.queryset.order_by('-duration')[1:4], ['fingerprint'],
+            chunk_size=2,
+        ))
+        # read in their own order
+        self.assertEqual(chunks, [[('f3',), ('f2',)], [('f1',)]])
+        response = export_response(self.queryset.order_by('pk')[:2],
+                                   ['fingerprint'])
+        self.assertEqual(content(response).splitlines(),
+                         ['fingerprint', 'f0', 'f1'])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_response(self.queryset, format='xml')
+
+    def test_admin_actions(self):
+        model_admin = admin.ModelAdmin(SlowQuery, admin.site)
+        model_admin.export_fields = ('fingerprint',)
+        request = RequestFactory().post('/')
+        response = export_as_csv(model_admin, request,
+                                 self.queryset.filter(fingerprint='f4'))
+        self.assertEqual(content(response).splitlines(),
+                         ['fingerprint', 'f4'])
+        response = export_as_json(model_admin, request,
+                                  self.queryset.order_by('pk')[:1])
+        self.assertEqual(json.loads(content(response)),
+                         [{'fingerprint': 'f0'}])
+        self.assertEqual(export_as_csv.short_description,
+                         'Export selected %(verbose_name_plural)s as CSV')
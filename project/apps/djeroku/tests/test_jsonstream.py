@@ -0,0 +1,133 @@
+from __future__ import absolute_import, unicode_literals
+
+from datetime import date, datetime, time
+from decimal import Decimal
+import json
+from unittest import skipIf
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from djeroku import jsonstream
+from djeroku.jsonstream import StreamingJsonResponse, json_view
+from djeroku.models import SlowQuery
+
+
+def content(response):
+    return b''.join(response.streaming_content).decode('utf-8')
+
+
+class StreamingJsonTests(TestCase):
+
+    def setUp(self):
+        created = datetime(2015, 6, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+        for i in range(5):
+            SlowQuery.objects.create(
+                database='default', fingerprint='f%d' % (i % 2),
+                sql='SELECT "%d" \u2013 /' % i, duration=i / 4.0,
+            )
+        SlowQuery.objects.update(created=created)
+
+    def assertMatchesJsonResponse(self, queryset, expected=None, **kwargs):
+        """The same JSON as DjangoJSONEncoder makes of the list."""
+        response = StreamingJsonResponse(queryset, **kwargs)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        expected = json.loads(json.dumps(
+            list(queryset if expected is None else expected),
+            cls=DjangoJSONEncoder
+        ))
+        self.assertEqual(json.loads(content(response)), expected)
+        return expected
+
+    def test_values(self):
+        queryset = SlowQuery.objects.values('id', 'created', 'sql',
+                                            'duration')
+        # without an order_by(), in primary key order
+        rows = self.assertMatchesJsonResponse(
+            queryset, queryset.order_by('pk'), chunk_size=2,
+        )
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['created'], '2015-06-01T12:30:15.123Z')
+
+    def test_own_order_slices_and_annotations(self):
+        rows = self.assertMatchesJsonResponse(
+            SlowQuery.objects.order_by('-duration').values('sql')[1:4],
+            chunk_size=2,
+        )
+        self.assertEqual([row['sql'] for row in rows],
+                         ['SELECT "%d" \u2013 /' % i for i in (3, 2, 1)])
+        self.assertMatchesJsonResponse(
+            SlowQuery.objects.values('fingerprint').annotate(
+                n=Count('pk')
+            ).order_by('fingerprint')
+        )
+
+    def test_models_and_empty_querysets(self):
+        response = StreamingJsonResponse(SlowQuery.objects.all(),
+                                         fields=['id', 'duration'])
+        self.assertEqual(json.loads(content(response))[1],
+                         {'id': SlowQuery.objects.order_by('pk')[1].pk,
+                          'duration': 0.25})
+        self.assertEqual(
+            content(StreamingJsonResponse(SlowQuery.objects.none())), '[]'
+        )
+
+    def test_json_view(self):
+        @json_view
+        def view(request, result):
+            return result
+
+        request = RequestFactory().get('/')
+        response = view(request, SlowQuery.objects.values('id'))
+        self.assertIsInstance(response, StreamingJsonResponse)
+        self.assertEqual(len(json.loads(content(response))), 5)
+        response = view(request, {'a': [1]})
+        self.assertEqual(json.loads(response.content.decode()), {'a': [1]})
+        plain = HttpResponse('plain')
+        self.assertIs(view(request, plain), plain)
+
+    def test_converters_match_django(self):
+        values = [
+            datetime(2015, 6, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+            datetime(2015, 6, 1, 12, 30),
+            date(2015, 6, 1),
+            time(12, 30, 15, 123456),
+            Decimal('1.10'),
+            uuid.UUID('12345678123456781234567812345678'),
+            'text', 3, 1.5,
+        ]
+        encoder = DjangoJSONEncoder()
+        for value in values:
+            self.assertEqual(
+                json.dumps(jsonstream.convert_any(value)),
+                encoder.encode(value), value
+            )
+        with self.assertRaises(ValueError):
+            jsonstream.convert_time(time(12, tzinfo=timezone.utc))
+
+    def test_field_converters(self):
+        queryset = SlowQuery.objects.annotate(n=Count('pk'))
+        self.assertEqual(
+            jsonstream.field_converters(
+                queryset, ['created', 'duration', 'pk', 'n', 'missing']
+            ),
+            [jsonstream.convert_datetime, None, None,
+             jsonstream.convert_any, jsonstream.convert_any]
+        )
+
+    @override_settings(JSON_STREAM_UJSON=False)
+    def test_standard_library_encoder(self):
+        self.assertEqual(jsonstream.get_encoder(),
+                         jsonstream._encoder.encode)
+
+    @skipIf(jsonstream.ujson is None, 'ujson is not installed')
+    def test_ujson_encoder(self):
+        self.assertEqual(jsonstream.get_encoder(), jsonstream._ujson_encode)
+        self.assertMatchesJsonResponse(
+            SlowQuery.objects.order_by('pk').values('created', 'sql',
+                                                    'duration')
+        )
@@ -0,0 +1,217 @@
+from __future__ import absolute_import
+
+import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.conf.urls import url
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils import formats, translation
+from django.utils.safestring import SafeData, mark_safe
+from django.utils.translation import trans_real
+
+from djeroku import l10n
+
+
+def original(module, name):
+    return l10n._originals.get((module, name), getattr(module, name))
+
+
+class PatchTests(SimpleTestCase):
+    """The cached functions give Django's output."""
+
+    def setUp(self):
+        # installed at startup unless LOCALE_CACHE_SIZE is 0
+        self.installed = bool(l10n._originals)
+        l10n.install()
+
+    def tearDown(self):
+        if not self.installed:
+            l10n.uninstall()
+
+    def test_installed(self):
+        self.assertIs(formats.number_format, l10n.number_format)
+        self.assertIs(formats.date_format, l10n.date_format)
+        self.assertIs(formats.time_format, l10n.time_format)
+        self.assertIs(trans_real.do_translate, l10n.do_translate)
+
+    def test_formats_match(self):
+        moment = datetime.datetime(2015, 7, 4, 9, 5, 6)
+        cases = [
+            ('number_format', Decimal('1234567.891'), (2,), {}),
+            ('number_format', 1234567, (), {'force_grouping': True}),
+            ('number_format', -0.5, (3,), {'use_l10n': False}),
+            ('date_format', moment, (), {}),
+            ('date_format', moment.date(), ('SHORT_DATE_FORMAT',), {}),
+            ('date_format', moment, (r'\D\a\y j \o\f F, l',), {}),
+            ('date_format', moment, ('DATETIME_FORMAT',), {'use_l10n': False}),
+            ('time_format', moment.time(), (), {}),
+            ('time_format', moment.time(), ('H:i:s',), {}),
+        ]
+        for language in ('en', 'de', 'fr', 'ja'):
+            with translation.override(language):
+                for name, value, args, kwargs in cases:
+                    for _ in range(2):
+                        # computed, then from the cache
+                        self.assertEqual(
+                            getattr(formats, name)(value, *args, **kwargs),
+                            original(formats, name)(value, *args, **kwargs),
+                            '%s %s %r' % (language, name, args)
+                        )
+
+    def test_translations_are_per_language(self):
+        for language, yes in (('de', 'Ja'), ('fr', 'Oui'), ('de', 'Ja'),
+                              ('en', 'Yes')):
+            with translation.override(language):
+                self.assertEqual(translation.ugettext('Yes'), yes)
+        with translation.override('de'):
+            self.assertEqual(
+                translation.ungettext('%(count)d item', '%(count)d items', 2),
+                '%(count)d items'
+            )
+            self.assertEqual(
+                translation.pgettext('abbrev. month', 'May'), 'Mai'
+            )
+
+    def test_keeps_safe_strings_safe(self):
+        with translation.override('de'):
+            self.assertEqual(translation.ugettext('Yes'), 'Ja')
+            translated = translation.ugettext(mark_safe('Yes'))
+            self.assertEqual(translated, 'Ja')
+            self.assertIsInstance(translated, SafeData)
+            self.assertNotIsInstance(translation.ugettext('Yes'), SafeData)
+
+    def test_setting_changes_clear_the_caches(self):
+        value = Decimal('1234.5')
+        with override_settings(USE_L10N=False, DECIMAL_SEPARATOR='.'):
+            self.assertEqual(formats.number_format(value, 1), '1234.5')
+        with override_settings(USE_L10N=False, DECIMAL_SEPARATOR=','):
+            self.assertEqual(formats.number_format(value, 1), '1234,5')
+
+
+class LanguageTests(SimpleTestCase):
+    HEADERS = (
+        'en-US,en;q=0.9', 'en-GB,en-US;q=0.9', 'de-DE,de;q=0.9', 'de-AT',
+        'fr;q=0.5, de;q=0.8', 'pt-br', 'xx-YY', 'xx, *', '*', '',
+        'not a header;;',
+    )
+
+    def test_matches_django(self):
+        factory = RequestFactory()
+        for header in self.HEADERS:
+            request = factory.get('/', HTTP_ACCEPT_LANGUAGE=header)
+            request.session = {}
+            self.assertEqual(
+                l10n.get_request_language(request),
+                translation.get_language_from_request(request), header
+            )
+
+        request = factory.get('/', HTTP_ACCEPT_LANGUAGE='de')
+        request.session = {}
+        request.COOKIES[settings.LANGUAGE_COOKIE_NAME] = 'fr'
+        self.assertEqual(l10n.get_request_language(request), 'fr')
+        request.session = {translation.LANGUAGE_SESSION_KEY: 'ja'}
+        self.assertEqual(l10n.get_request_language(request), 'ja')
+
+    def test_default_language(self):
+        self.assertEqual(
+            l10n.default_language(),
+            trans_real.get_supported_language_variant(settings.LANGUAGE_CODE)
+        )
+
+    def test_cache_request_keys_by_language(self):
+        factory = RequestFactory()
+        request = factory.get('/', HTTP_ACCEPT_LANGUAGE='de-DE,de;q=0.9')
+        request.session = {}
+        keyed = l10n.cache_request(request)
+        self.assertEqual(keyed.META['HTTP_ACCEPT_LANGUAGE'], 'de')
+        self.assertEqual(request.META['HTTP_ACCEPT_LANGUAGE'],
+                         'de-DE,de;q=0.9')
+
+
+class LRUCacheTests(SimpleTestCase):
+
+    def test_bounded(self):
+        cache = l10n.LRUCache(8)
+        for key in range(8):
+            cache.set(key, str(key))
+        # keep the oldest two in use
+        cache.get(0)
+        cache.get(1)
+        cache.set(8, '8')
+        self.assertLessEqual(len(cache._entries), 8)
+        self.assertEqual(cache.get(0), '0')
+        self.assertEqual(cache.get(1), '1')
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(8), '8')
+
+        for key in range(100):
+            cache.set(key, key)
+        self.assertLessEqual(len(cache._entries), 8)
+
+
+views = []
+
+
+def page(request):
+    views.append(request.path)
+    return HttpResponse('%s %s' % (
+        translation.get_language(), translation.ugettext('Yes')
+    ))
+
+
+urlpatterns = [url(r'^page/$', page)]
+
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    LOCALE_MIDDLEWARE_ENABLED=True,
+    LOCALE_PAGE_CACHE_ENABLED=True,
+    CACHE_MIDDLEWARE_ALIAS='l10n-tests',
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'l10n-tests': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'l10n-tests',
+        },
+    },
+)
+class LocaleMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        del views[:]
+        caches['l10n-tests'].clear()
+
+    def get(self, accept_language):
+        response = self.client.get('/page/',
+                                   HTTP_ACCEPT_LANGUAGE=accept_language)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_activates_other_languages(self):
+        response = self.get('de-DE,de;q=0.9')
+        self.assertEqual(response.content, b'de Ja')
+        self.assertEqual(response['Content-Language'], 'de')
+        self.assertIn('Accept-Language', response['Vary'])
+
+        response = self.get('en-US,en;q=0.9')
+        self.assertEqual(response.content, b'en-us Yes')
+        self.assertEqual(response['Content-Language'],
+                         l10n.default_language())
+
+    def test_page_cache_is_per_language(self):
+        self.assertEqual(self.get('de-DE,de;q=0.9').content, b'de Ja')
+        self.assertEqual(len(views), 1)
+        # other headers resolving to German share the cached page
+        for header in ('de', 'de-AT,de;q=0.5', 'de-CH'):
+            self.assertEqual(self.get(header).content, b'de Ja')
+        self.assertEqual(len(views), 1)
+
+        self.assertEqual(self.get('fr').content, b'fr Oui')
+        self.assertEqual(self.get('en-US,en;q=0.9').content, b'en-us Yes')
+        self.assertEqual(self.get('en-us').content, b'en-us Yes')
+        self.assertEqual(len(views), 3)
@@ -0,0 +1,100 @@
+from __future__ import absolute_import
+
+import threading
+from time import time
+
+from celery import Celery
+from django.test import SimpleTestCase
+from kombu.exceptions import EncodeError
+
+from djeroku.localbroker import HOSTNAME, LocalBroker
+
+
+# an app of its own, so the project's eager settings don't apply
+app = Celery('djeroku-localbroker-tests', set_as_current=False)
+app.conf.update(
+    BROKER_URL='memory://',
+    BROKER_TRANSPORT_OPTIONS={'polling_interval': 0.002},
+    CELERY_RESULT_BACKEND='cache+memory://',
+    CELERY_TASK_SERIALIZER='json',
+    CELERY_RESULT_SERIALIZER='json',
+    CELERY_ACCEPT_CONTENT=['json'],
+    CELERY_DEFAULT_QUEUE='djeroku-localbroker-tests',
+)
+
+runs = []
+ran = threading.Condition()
+
+
+def wait_for(count, timeout=5):
+    deadline = time() + timeout
+    with ran:
+        while len(runs) < count and time() < deadline:
+            ran.wait(deadline - time())
+    return list(runs)
+
+
+@app.task(bind=True)
+def record(self, value):
+    with ran:
+        runs.append(dict(
+            value=value, at=time(), is_eager=self.request.is_eager,
+            hostname=self.request.hostname,
+            thread=threading.current_thread().name,
+        ))
+        ran.notify_all()
+    return value * 2
+
+
+@app.task(bind=True, max_retries=1, default_retry_delay=0.05)
+def flaky(self):
+    record(self.request.retries)
+    if not self.request.retries:
+        raise self.retry()
+
+
+class LocalBrokerTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(LocalBrokerTests, cls).setUpClass()
+        cls.broker = LocalBroker(app, workers=2, latency=0.05)
+        cls.broker.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.broker.stop()
+        super(LocalBrokerTests, cls).tearDownClass()
+
+    def setUp(self):
+        del runs[:]
+
+    def test_runs_tasks_like_a_worker(self):
+        queued = time()
+        result = record.delay(21)
+        [run] = wait_for(1)
+        self.assertEqual(run['value'], 21)
+        self.assertFalse(run['is_eager'])
+        self.assertEqual(run['hostname'], HOSTNAME)
+        self.assertTrue(run['thread'].startswith('localbroker-worker-'))
+        # not before the latency is up
+        self.assertGreaterEqual(run['at'] - queued, 0.05)
+        self.assertEqual(result.get(timeout=5), 42)
+
+    def test_countdowns_and_retries(self):
+        queued = time()
+        record.apply_async((1,), countdown=0.3)
+        record.delay(2)
+        first, second = wait_for(2)
+        self.assertEqual((first['value'], second['value']), (2, 1))
+        self.assertGreaterEqual(second['at'] - queued, 0.3)
+
+        del runs[:]
+        flaky.delay()
+        self.assertEqual([run['value'] for run in wait_for(2)], [0, 1])
+
+    def test_arguments_are_serialized(self):
+        with self.assertRaises(EncodeError):
+            record.delay(object())
+        # nothing reached the workers
+        self.assertEqual(wait_for(1, timeout=0.2), [])
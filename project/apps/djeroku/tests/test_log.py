@@ -0,0 +1,133 @@
+from __future__ import absolute_import
+
+import logging
+import sys
+import threading
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from djeroku import log, tasks
+from djeroku.log import ErrorDigestHandler
+
+
+class ErrorDigestHandlerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.digests = []
+        self.countdowns = []
+        apply_async = tasks.send_error_digest.apply_async
+        tasks.send_error_digest.apply_async = self.queue_digest
+        self.addCleanup(setattr, tasks.send_error_digest, 'apply_async',
+                        apply_async)
+
+        # no digest before stop() within the test
+        self.handler = self.make_handler(cache=None)
+        self.logger = logging.getLogger('djeroku.tests.log')
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def queue_digest(self, args, countdown=None):
+        self.digests.append(tuple(args))
+        self.countdowns.append(countdown)
+
+    def make_handler(self, **kwargs):
+        handler = ErrorDigestHandler(interval=3600, buffer_size=5,
+                                     max_fingerprints=2, **kwargs)
+        self.addCleanup(handler.stop)
+        return handler
+
+    def fail_and_log(self, exception):
+        try:
+            raise exception
+        except Exception:
+            self.logger.error('failed %s', exception, exc_info=True)
+
+    def test_stop_sends_the_aggregated_errors(self):
+        for i in range(3):
+            self.fail_and_log(ValueError(i))
+        self.fail_and_log(KeyError('x'))
+
+        self.handler.stop()
+
+        [(entries, dropped)] = self.digests
+        self.assertEqual(dropped, 0)
+        self.assertEqual(
+            [(entry['exception'], entry['count']) for entry in entries],
+            [('ValueError', 3), ('KeyError', 1)]
+        )
+        self.assertEqual(entries[0]['message'], 'failed 0')
+        self.assertIn('ValueError: 0', entries[0]['traceback'])
+        self.assertFalse(self.handler._listener.is_running())
+
+        # only once
+        self.handler.stop()
+        self.assertEqual(len(self.digests), 1)
+
+    def test_overflow_is_counted(self):
+        self.fail_and_log(ValueError())
+        self.fail_and_log(KeyError())
+        # over max_fingerprints
+        self.fail_and_log(TypeError())
+        self.handler.stop()
+
+        [(entries, dropped)] = self.digests
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(dropped, 1)
+
+    def test_records_hold_no_tracebacks(self):
+        try:
+            raise ValueError()
+        except ValueError:
+            record = logging.LogRecord(
+                'x', logging.ERROR, __file__, 1, 'msg', (), sys.exc_info()
+            )
+        entry = self.handler.prepare(record)
+        self.assertIsInstance(entry['traceback'], type(u''))
+        self.assertNotIn('exc_info', entry)
+
+    def test_stop_waits_for_a_busy_listener(self):
+        # a listener stuck queueing a digest
+        busy = threading.Event()
+        self.addCleanup(busy.set)
+        self.handler._listener.target = busy.wait
+        self.fail_and_log(ValueError())
+        self.handler.stop(timeout=0.01)
+        # left to the listener, which is still sending
+        self.assertEqual(self.digests, [])
+        self.assertEqual(self.handler.buffer.qsize(), 2)
+
+    def test_handlers_are_stopped_at_exit(self):
+        self.assertIn(self.handler, log._handlers)
+        self.fail_and_log(ValueError())
+        log._stop_handlers()
+        self.assertEqual(len(self.digests), 1)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'djeroku-tests-log',
+    }})
+    def test_one_digest_per_interval_across_processes(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        # another process sharing the cache
+        other = self.make_handler()
+        self.handler.cache = 'default'
+
+        self.fail_and_log(ValueError())
+        self.handler.stop()
+        self.assertEqual(self.countdowns, [None])
+
+        other.aggregate(self.handler.prepare(logging.LogRecord(
+            'x', logging.ERROR, __file__, 1, 'other', (), None
+        )))
+        other.send_digest()
+        # kept for the next interval
+        self.assertEqual(len(self.digests), 1)
+        self.assertEqual(len(other._pending), 1)
+
+        # at exit it goes out once the interval is over
+        other.stop()
+        self.assertEqual(self.countdowns, [None, 3600])
+        self.assertEqual(self.digests[1][0][0]['message'], 'other')
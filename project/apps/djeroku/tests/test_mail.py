@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import json
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.test import SimpleTestCase, override_settings
+
+from djeroku.mail import (
+    close_connection_pool, deserialize_message, serialize_message
+)
+from djeroku.tasks import send_emails
+
+
+# a 1x1 transparent GIF
+GIF = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04'
+    b'\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D'
+    b'\x01\x00;'
+)
+
+
+def make_message():
+    message = EmailMultiAlternatives(
+        'Subject', 'Body', 'from@example.com', ['to@example.com'],
+        cc=['cc@example.com'], bcc=['bcc@example.com'],
+        reply_to=['reply@example.com'], headers={'X-Tag': 'test'},
+    )
+    message.attach_alternative('<p>Body</p>', 'text/html')
+    return message
+
+
+def round_trip(message):
+    """As send_emails gets it, through the json task serializer."""
+    return deserialize_message(json.loads(json.dumps(
+        serialize_message(message)
+    )))
+
+
+def attachment_parts(message):
+    """(content type, filename, payload) of each attachment as sent."""
+    return [
+        (part.get_content_type(), part.get_filename(),
+         part.get_payload(decode=True))
+        for part in message.message().walk()
+        if part.get_filename() or part.get('Content-ID')
+    ]
+
+
+class SerializationTests(SimpleTestCase):
+
+    def assertRoundTrips(self, message):
+        rebuilt = round_trip(message)
+        for name in ('subject', 'body', 'from_email', 'to', 'cc', 'bcc',
+                     'reply_to', 'extra_headers', 'alternatives',
+                     'content_subtype', 'mixed_subtype', 'encoding'):
+            self.assertEqual(
+                getattr(rebuilt, name), getattr(message, name), name
+            )
+        self.assertEqual(attachment_parts(rebuilt), attachment_parts(message))
+        return rebuilt
+
+    def test_plain_message(self):
+        self.assertRoundTrips(make_message())
+
+    def test_text_attachment(self):
+        message = make_message()
+        message.attach('notes.txt', u'caf\xe9 notes', 'text/plain')
+        self.assertRoundTrips(message)
+
+    def test_binary_attachment(self):
+        message = make_message()
+        message.attach('report.bin', b'\x00\x01\xff binary', 'application/'
+                       'octet-stream')
+        self.assertRoundTrips(message)
+
+    def test_inline_image(self):
+        message = make_message()
+        message.mixed_subtype = 'related'
+        image = MIMEImage(GIF, 'gif')
+        image.add_header('Content-ID', '<logo>')
+        image.add_header('Content-Disposition', 'inline', filename='logo.gif')
+        message.attach(image)
+        rebuilt = self.assertRoundTrips(message)
+        self.assertEqual(attachment_parts(rebuilt)[0][2], GIF)
+
+    def test_mime_text(self):
+        message = make_message()
+        part = MIMEText('an attached text part', 'plain', 'utf-8')
+        part.add_header('Content-Disposition', 'attachment',
+                        filename='part.txt')
+        message.attach(part)
+        self.assertRoundTrips(message)
+
+    def test_multipart_attachment(self):
+        message = make_message()
+        part = MIMEMultipart('mixed')
+        inner = MIMEText('inner', 'plain', 'utf-8')
+        inner.add_header('Content-Disposition', 'attachment',
+                         filename='inner.txt')
+        part.attach(inner)
+        message.attach(part)
+        self.assertRoundTrips(message)
+
+
+@override_settings(
+    EMAIL_QUEUE_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+)
+class SendEmailsTests(SimpleTestCase):
+
+    def setUp(self):
+        close_connection_pool()
+        mail.outbox = []
+
+    def tearDown(self):
+        close_connection_pool()
+
+    def test_sends_every_attachment_kind(self):
+        message = make_message()
+        message.attach('notes.txt', u'notes', 'text/plain')
+        message.attach('report.bin', b'\x00\xff', 'application/octet-stream')
+        message.attach(MIMEImage(GIF, 'gif'))
+
+        result = send_emails.apply(
+            args=([serialize_message(message)],)
+        ).get()
+
+        self.assertEqual(result['sent'], 1)
+        self.assertEqual(result['failed'], 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            attachment_parts(mail.outbox[0]), attachment_parts(message)
+        )
@@ -0,0 +1,147 @@
+from __future__ import absolute_import
+
+from django.contrib import admin
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+from djeroku.admin import (
+    EstimatedCountAdminMixin, FacetAllValuesFieldListFilter,
+    FacetBooleanFieldListFilter
+)
+from djeroku.models import SlowQuery
+from djeroku.pagination import (
+    EstimatedCountPaginator, cached_count, count_rows, estimated_count,
+    keyset_pages
+)
+
+
+def slow_query(sql, database='default', analyzed=False):
+    return SlowQuery.objects.create(
+        database=database, fingerprint='x', sql=sql, duration=0.5,
+        analyzed=analyzed,
+    )
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'djeroku-pagination-tests',
+}})
+class PaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i in range(5):
+            slow_query('SELECT %d' % i)
+
+    def test_cached_count(self):
+        queryset = SlowQuery.objects.all()
+        self.assertEqual(cached_count(queryset, timeout=60), 5)
+        slow_query('SELECT 5')
+        self.assertEqual(cached_count(queryset, timeout=60), 5)
+        self.assertEqual(cached_count(queryset, timeout=0), 6)
+
+    def test_empty_querysets(self):
+        empty = SlowQuery.objects.filter(pk__in=[])
+        self.assertEqual(cached_count(empty, timeout=60), 0)
+        self.assertEqual(count_rows(empty), (0, False))
+        self.assertEqual(EstimatedCountPaginator(empty, 10).count, 0)
+
+    def test_no_estimates_off_postgres(self):
+        self.assertIsNone(estimated_count(SlowQuery.objects.all()))
+        self.assertEqual(count_rows(SlowQuery.objects.all(), threshold=1),
+                         (5, False))
+
+    def test_paginator(self):
+        paginator = EstimatedCountPaginator(
+            SlowQuery.objects.order_by('pk'), 2
+        )
+        self.assertEqual((paginator.count, paginator.num_pages), (5, 3))
+        self.assertFalse(paginator.estimated)
+        self.assertEqual(len(paginator.page(3).object_list), 1)
+
+    def test_keyset_pages(self):
+        pages = list(keyset_pages(
+            SlowQuery.objects.values_list('pk', 'sql'), size=2
+        ))
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([row[1] for page in pages for row in page],
+                         ['SELECT %d' % i for i in range(5)])
+        self.assertEqual(
+            list(keyset_pages(SlowQuery.objects.filter(pk__in=[]))), []
+        )
+
+
+class SlowQueryAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_filter = (
+        ('database', FacetAllValuesFieldListFilter),
+        ('analyzed', FacetBooleanFieldListFilter),
+    )
+    search_fields = ('sql',)
+    count_cache_timeout = 0
+
+
+@override_settings(COUNT_CACHE_TIMEOUT=0)
+class FacetFilterTests(TestCase):
+
+    def setUp(self):
+        slow_query('SELECT a', 'default', analyzed=True)
+        slow_query('SELECT a', 'default')
+        slow_query('SELECT b', 'default')
+        slow_query('SELECT a', 'replica')
+        self.model_admin = SlowQueryAdmin(SlowQuery, admin.site)
+
+    def changelist(self, **params):
+        request = RequestFactory().get('/', params)
+        model_admin = self.model_admin
+        ChangeList = model_admin.get_changelist(request)
+        changelist = ChangeList(
+            request, SlowQuery, model_admin.list_display,
+            model_admin.list_display_links, model_admin.list_filter,
+            model_admin.date_hierarchy, model_admin.search_fields,
+            model_admin.list_select_related, model_admin.list_per_page,
+            model_admin.list_max_show_all, model_admin.list_editable,
+            model_admin,
+        )
+        changelist.get_results(request)
+        return changelist
+
+    def facets(self, changelist):
+        return [
+            [choice['display'] for choice in spec.choices(changelist)]
+            for spec in changelist.filter_specs
+        ]
+
+    def test_counts_per_choice(self):
+        databases, analyzed = self.facets(self.changelist())
+        self.assertEqual(databases,
+                         ['All (4)', 'default (3)', 'replica (1)'])
+        self.assertEqual(analyzed, ['All (4)', 'Yes (1)', 'No (3)'])
+
+    def test_counts_within_the_rest_of_the_changelist(self):
+        changelist = self.changelist(**{
+            SEARCH_VAR: 'SELECT a', 'database': 'default'
+        })
+        self.assertEqual(changelist.result_count, 2)
+        databases, analyzed = self.facets(changelist)
+        # the search, but not the filter's own selection
+        self.assertEqual(databases,
+                         ['All (3)', 'default (2)', 'replica (1)'])
+        # the search and the database
+        self.assertEqual(analyzed, ['All (2)', 'Yes (1)', 'No (1)'])
+
+    def test_other_lookups(self):
+        changelist = self.changelist(sql='SELECT b')
+        databases, analyzed = self.facets(changelist)
+        self.assertEqual(databases,
+                         ['All (1)', 'default (1)', 'replica (0)'])
+        self.assertEqual(analyzed, ['All (1)', 'Yes (0)', 'No (1)'])
+
+    def test_nothing_can_match(self):
+        self.model_admin.get_queryset = lambda request: (
+            SlowQuery.objects.filter(pk__in=[])
+        )
+        changelist = self.changelist()
+        self.assertEqual(changelist.result_count, 0)
+        self.assertEqual(self.facets(changelist)[1],
+                         ['All (0)', 'Yes (0)', 'No (0)'])
@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+
+import sys
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from djeroku.management.commands.release import Command
+from djeroku.schema import MigrationState
+
+
+SQUASHED = ('djeroku', '0001_squashed_0003_upload_uploadpart')
+
+
+class Terminal(StringIO):
+    """A stdin that is a terminal."""
+
+    def isatty(self):
+        return True
+
+
+class MigrationStateTests(TestCase):
+
+    def unapply(self, app, name):
+        MigrationRecorder(connection).migration_qs.filter(
+            app=app, name=name
+        ).delete()
+
+    def test_up_to_date(self):
+        state = MigrationState(connection)
+        self.assertTrue(state.up_to_date)
+        self.assertIn(('djeroku', '0001_initial'), state.applied)
+        self.assertEqual(state.code, state.applied)
+        self.assertEqual(state.missing_tables, [])
+
+    def test_unapplied_migration(self):
+        self.unapply('djeroku', '0003_upload_uploadpart')
+        state = MigrationState(connection)
+        self.assertFalse(state.up_to_date)
+        self.assertNotIn(('djeroku', '0003_upload_uploadpart'), state.applied)
+
+    @override_settings(MIGRATION_MODULES={
+        'djeroku': 'djeroku.tests.squashed_migrations'
+    })
+    def test_squashed_migrations(self):
+        # applied as the migrations it replaces
+        state = MigrationState(connection)
+        self.assertTrue(state.up_to_date)
+        self.assertIn(SQUASHED, state.code)
+        self.assertNotIn(('djeroku', '0001_initial'), state.code)
+
+        self.unapply('djeroku', '0001_initial')
+        self.unapply('djeroku', '0002_batchjob_batchchunk')
+        self.unapply('djeroku', '0003_upload_uploadpart')
+        state = MigrationState(connection)
+        self.assertFalse(state.up_to_date)
+        self.assertNotIn(SQUASHED, state.applied)
+
+
+class ReleaseTests(TestCase):
+
+    def setUp(self):
+        stdin, stdout = sys.stdin, sys.stdout
+        self.addCleanup(setattr, sys, 'stdin', stdin)
+        self.addCleanup(setattr, sys, 'stdout', stdout)
+        sys.stdout = StringIO()
+
+    def test_skips_migrate_when_up_to_date(self):
+        out = StringIO()
+        call_command('release', interactive=False, skip_static=True,
+                     skip_warmup=True, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('migrate'))
+        self.assertIn('skipped, up to date', lines[0])
+        self.assertTrue(lines[-1].startswith('release finished'))
+        self.assertEqual(len(lines), 2)
+
+    def offer_superuser(self, stdin):
+        sys.stdin = stdin
+        return Command().offer_superuser({'database': 'default'})
+
+    def test_no_superuser_prompt_without_a_terminal(self):
+        self.assertEqual(self.offer_superuser(StringIO('yes\n')),
+                         'skipped, no terminal')
+
+    def test_end_of_input_declines(self):
+        self.assertEqual(self.offer_superuser(Terminal('')), 'declined')
+        self.assertEqual(self.offer_superuser(Terminal('maybe\nno\n')),
+                         'declined')
+        self.assertIn('Please enter either', sys.stdout.getvalue())
@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils.six import StringIO
+
+from djeroku import instrumentation
+from djeroku.instrumentation import QueryEvent
+from djeroku.models import SlowQuery
+from djeroku.slowquery import SlowQueryLog
+
+
+SELECT = 'SELECT id FROM djeroku_slowquery WHERE duration > %s'
+
+
+def event(sql=SELECT, params=(1,), duration=0.5, many=False):
+    return QueryEvent('default', connection.vendor, sql, params, duration,
+                      many)
+
+
+class SlowQueryLogTests(TestCase):
+
+    def setUp(self):
+        self.log = SlowQueryLog(threshold_ms=100, buffer_size=2, max_rows=3)
+        # keep the writer from starting: the tests write batches themselves
+        self.log._writer.ensure_started = lambda: None
+
+    def buffered(self):
+        entries = []
+        while not self.log.buffer.empty():
+            entries.append(self.log.buffer.get_nowait())
+            self.log.buffer.task_done()
+        return entries
+
+    def test_samples_slow_statements(self):
+        self.log(event(duration=0.05))
+        self.log(event(many=True))
+        self.log(event())
+        [entry] = self.buffered()
+        self.assertEqual((entry['sql'], entry['params']), (SELECT, (1,)))
+        # the call site leaves out django and djeroku (these tests too)
+        self.assertIn('testMethod()', entry['stack'])
+        self.assertNotIn('djeroku', entry['stack'])
+        self.assertNotIn('django', entry['stack'])
+
+    def test_full_buffer_drops_entries(self):
+        for _ in range(4):
+            self.log(event())
+        self.assertEqual(len(self.buffered()), 2)
+        self.assertEqual(self.log.dropped, 2)
+
+    def test_write_explains_reads_only(self):
+        self.log(event())
+        self.log(event(sql='DELETE FROM djeroku_slowquery WHERE id = %s'))
+        self.log.write(self.buffered())
+
+        select, delete = SlowQuery.objects.order_by('pk')
+        self.assertEqual(select.fingerprint, instrumentation.fingerprint(
+            SELECT
+        ))
+        self.assertEqual(select.database, 'default')
+        self.assertEqual(select.duration, 0.5)
+        self.assertTrue(select.explain)
+        self.assertFalse(select.analyzed)
+        self.assertEqual(delete.explain, '')
+
+    def test_keeps_the_newest_rows(self):
+        for i in range(5):
+            self.log.write([dict(
+                alias='default', vendor='unknown', sql='SELECT %d' % i,
+                params=(), duration=0.5, stack='',
+            )])
+        kept = SlowQuery.objects.order_by('pk').values_list('sql', flat=True)
+        self.assertEqual(list(kept), ['SELECT 2', 'SELECT 3', 'SELECT 4'])
+
+
+class SlowQueryWriterTests(TransactionTestCase):
+    """The background thread, registered like SLOW_QUERY_LOG_ENABLED does."""
+
+    def setUp(self):
+        if (connection.vendor == 'sqlite' and
+                connection.is_in_memory_db(connection.settings_dict['NAME'])):
+            # the writer thread's connection would get a database of its own
+            self.skipTest('in-memory test database')
+
+    def test_records_slow_queries_in_the_background(self):
+        log = SlowQueryLog(threshold_ms=0)
+        with instrumentation.observing(log):
+            SlowQuery.objects.filter(duration__gt=1).count()
+        log.flush()
+
+        # only the count: the writer's own queries are not observed
+        recorded = SlowQuery.objects.get()
+        self.assertIn('COUNT(*)', recorded.sql)
+        self.assertIn('testMethod()', recorded.stack)
+
+
+class SlowQueriesCommandTests(TestCase):
+
+    def setUp(self):
+        for sql, duration, analyzed in (
+                ('SELECT * FROM a WHERE id = 1', 0.3, False),
+                ('SELECT * FROM a WHERE id = 2', 0.5, True),
+                ('SELECT * FROM b', 0.2, False)):
+            SlowQuery.objects.create(
+                database='default', fingerprint=instrumentation.fingerprint(
+                    sql
+                ), sql=sql, duration=duration, stack='  File "views.py"',
+                explain='SCAN TABLE', analyzed=analyzed,
+            )
+
+    def run_command(self, **options):
+        out = StringIO()
+        call_command('slowqueries', stdout=out, **options)
+        return out.getvalue()
+
+    def test_summary_by_fingerprint(self):
+        output = self.run_command(plans=True)
+        first, second = output.strip().split('\n\n')
+        self.assertIn('count=2  total=800ms  mean=400ms  max=500ms', first)
+        self.assertIn('SELECT * FROM a WHERE id = ?', first)
+        self.assertIn('plan (analyzed):\n    SCAN TABLE', first)
+        self.assertIn('call site:\n      File "views.py"', first)
+        self.assertIn('count=1  total=200ms', second)
+
+        self.assertNotIn('plan', self.run_command(limit=1))
+        self.assertEqual(self.run_command(limit=1).count('count='), 1)
+
+    def test_clear(self):
+        self.assertEqual(self.run_command(clear=True).strip(),
+                         'Deleted 3 slow queries.')
+        self.assertEqual(self.run_command().strip(),
+                         'No slow queries recorded.')
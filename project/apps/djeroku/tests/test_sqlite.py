@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import skipUnless
+
+from django.db import connection, connections
+from django.test import SimpleTestCase, override_settings
+
+from djeroku import sqlite
+
+
+@skipUnless(connection.vendor == 'sqlite', 'sqlite only')
+class SQLiteTests(SimpleTestCase):
+    """A connection of its own, to a database file of its own."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'test.db')
+
+    def connect(self):
+        wrapper = type(connections['default'])(
+            dict(connection.settings_dict, NAME=self.path), alias='sqlite'
+        )
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        cursor = wrapper.connection.cursor()
+        cursor.execute('PRAGMA %s' % name)
+        return cursor.fetchone()[0]
+
+    def test_pragmas_applied_as_connections_open(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 20000)
+
+    @override_settings(SQLITE_PRAGMAS=(('busy_timeout', 5),),
+                       SQLITE_TRANSACTION_MODE=None)
+    def test_settings(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5)
+        self.assertNotIn('_start_transaction_under_autocommit',
+                         vars(wrapper))
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        wrapper = self.connect()
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+
+        wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        # before the transaction has written anything
+        with self.assertRaisesRegexp(sqlite3.OperationalError, 'locked'):
+            other.execute('INSERT INTO t VALUES (1)')
+        # readers carry on
+        self.assertEqual(other.execute('SELECT COUNT(*) FROM t').fetchone(),
+                         (0,))
+        wrapper.connection.rollback()
+
+    def test_checkpoint_empties_the_log(self):
+        wrapper = self.connect()
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+            cursor.execute('INSERT INTO t VALUES (1)')
+        self.assertGreater(os.path.getsize(self.path + '-wal'), 0)
+
+        sqlite.checkpoint(wrapper)
+        self.assertEqual(os.path.getsize(self.path + '-wal'), 0)
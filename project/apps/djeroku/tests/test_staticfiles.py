@@ -0,0 +1,177 @@
+from __future__ import absolute_import
+
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from djeroku import staticfiles
+from djeroku.staticfiles import (
+    FingerprintedStaticFilesStorage, IncrementalCollector, load_manifest
+)
+
+
+LOGO = b'\x89PNG logo'
+STYLES = b'''body { background: url("../img/logo.png"); }
+.icon { background: url(/static/img/logo.png?v=1#x); }
+.remote { background: url(https://example.com/a.png); }
+@import "base.css";
+''' + b'/* padding */' * 30
+BASE = b'p { background: url(../img/missing.png); }'
+
+
+class StaticFilesTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = os.path.join(self.directory, 'source')
+        self.static_root = os.path.join(self.directory, 'static')
+        self.manifest = os.path.join(self.directory, 'staticfiles.json')
+        self.write('img/logo.png', LOGO)
+        self.write('css/styles.css', STYLES)
+        self.write('css/base.css', BASE)
+
+        overridden = override_settings(
+            STATICFILES_DIRS=(self.source,),
+            STATICFILES_FINDERS=(
+                'django.contrib.staticfiles.finders.FileSystemFinder',
+            ),
+            STATIC_ROOT=self.static_root,
+            STATIC_URL='/static/',
+            STATICFILES_MANIFEST=self.manifest,
+        )
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def write(self, path, content, mtime=None):
+        path = os.path.join(self.source, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def collect(self):
+        return IncrementalCollector(workers=1).collect()
+
+    def collected(self, path):
+        with open(os.path.join(self.static_root, path), 'rb') as f:
+            return f.read()
+
+    def hashed(self, path):
+        return load_manifest(self.manifest)[path]['hashed']
+
+    def test_collects_changed_files_only(self):
+        result = self.collect()
+        self.assertEqual(sorted(result['processed']),
+                         ['css/base.css', 'css/styles.css', 'img/logo.png'])
+        # outside the served files
+        self.assertFalse(os.path.exists(
+            os.path.join(self.static_root, 'staticfiles.json')
+        ))
+        self.assertEqual(self.collected('img/logo.png'), LOGO)
+        self.assertEqual(self.collected(self.hashed('img/logo.png')), LOGO)
+        with gzip.open(os.path.join(self.static_root,
+                                    'css/styles.css.gz')) as f:
+            self.assertEqual(f.read(), STYLES)
+
+        result = self.collect()
+        self.assertEqual(result['processed'], [])
+        self.assertEqual(len(result['skipped']), 3)
+
+    def test_stylesheets_link_to_hashed_names(self):
+        self.collect()
+        logo = self.hashed('img/logo.png')
+        base = self.hashed('css/base.css')
+        content = self.collected(self.hashed('css/styles.css'))
+        self.assertIn(
+            ('url("../img/%s")' % os.path.basename(logo)).encode(), content
+        )
+        self.assertIn(('url(/static/%s?v=1#x)' % logo).encode(), content)
+        self.assertIn(b'url(https://example.com/a.png)', content)
+        self.assertIn(('@import "%s"' % os.path.basename(base)).encode(),
+                      content)
+        # the plain copy is left as it is
+        self.assertEqual(self.collected('css/styles.css'), STYLES)
+
+    def test_references_changing_rehash_the_stylesheet(self):
+        self.collect()
+        styles, logo = self.hashed('css/styles.css'), self.hashed(
+            'img/logo.png'
+        )
+
+        self.write('img/logo.png', LOGO + b' v2', mtime=1)
+        result = self.collect()
+        self.assertEqual(sorted(result['processed']),
+                         ['css/styles.css', 'img/logo.png'])
+        self.assertNotEqual(self.hashed('img/logo.png'), logo)
+        self.assertNotEqual(self.hashed('css/styles.css'), styles)
+        self.assertIn(
+            os.path.basename(self.hashed('img/logo.png')).encode(),
+            self.collected(self.hashed('css/styles.css'))
+        )
+        for stale in (styles, logo):
+            self.assertFalse(
+                os.path.exists(os.path.join(self.static_root, stale))
+            )
+
+        # a file showing up for a reference that was missing
+        base = self.hashed('css/base.css')
+        self.write('img/missing.png', b'found')
+        self.collect()
+        self.assertNotEqual(self.hashed('css/base.css'), base)
+        self.assertIn(
+            os.path.basename(self.hashed('img/missing.png')).encode(),
+            self.collected(self.hashed('css/base.css'))
+        )
+
+    def test_small_files_lose_their_gzipped_copy(self):
+        self.collect()
+        gzipped = os.path.join(self.static_root, 'css/styles.css.gz')
+        self.assertTrue(os.path.exists(gzipped))
+
+        self.write('css/styles.css', b'body {}', mtime=1)
+        self.collect()
+        self.assertFalse(os.path.exists(gzipped))
+        self.assertFalse(load_manifest(self.manifest)['css/styles.css'][
+            'gzipped'
+        ])
+
+    def test_removes_files_whose_source_is_gone(self):
+        self.collect()
+        logo = self.hashed('img/logo.png')
+        os.remove(os.path.join(self.source, 'img/logo.png'))
+
+        result = self.collect()
+        self.assertEqual(result['removed'], ['img/logo.png'])
+        for name in ('img/logo.png', logo):
+            self.assertFalse(
+                os.path.exists(os.path.join(self.static_root, name))
+            )
+        # its stylesheet goes back to the plain name
+        self.assertIn(b'url("../img/logo.png")',
+                      self.collected(self.hashed('css/styles.css')))
+
+    def test_storage_serves_hashed_names(self):
+        storage = FingerprintedStaticFilesStorage()
+        self.assertEqual(storage.url('img/logo.png'), '/static/img/logo.png')
+
+        self.collect()
+        storage = FingerprintedStaticFilesStorage()
+        self.assertEqual(storage.url('img/logo.png'),
+                         '/static/' + self.hashed('img/logo.png'))
+        self.assertEqual(storage.url('img/other.png'), '/static/img/other.png')
+
+    def test_default_ignore_patterns(self):
+        self.assertEqual(staticfiles.default_ignore_patterns(),
+                         ['CVS', '.*', '*~'])
+        self.write('.hidden', b'x')
+        self.write('img/logo.png~', b'x')
+        self.assertEqual(
+            sorted(IncrementalCollector().find_files()),
+            ['css/base.css', 'css/styles.css', 'img/logo.png']
+        )
@@ -0,0 +1,183 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from djeroku.middleware import QueryInspectionMiddleware
+from djeroku.models import Upload, UploadPart
+from djeroku.queries import QueryBudgetExceeded, query_budget
+from djeroku.tests import runner_sample
+from djeroku.testing import FINGERPRINT_TABLE, QueryBudgetMixin, partition
+
+
+# runs `manage.py test` with the project's settings on a database of its own
+RUN_TESTS = '''
+import sys
+sys.path.insert(0, %(root)r)
+import os
+os.environ['DJANGO_SETTINGS_MODULE'] = %(settings)r
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = %(database)r
+import django
+django.setup()
+from django.core.management import call_command
+call_command('test', 'djeroku.tests.runner_sample', parallel=%(parallel)d,
+             verbosity=1)
+'''
+
+
+class PartitionTests(SimpleTestCase):
+
+    def suite(self):
+        loader = unittest.TestLoader()
+        tests = []
+        for case in (runner_sample.First, runner_sample.Second,
+                     PartitionTests):
+            tests.extend(loader.loadTestsFromTestCase(case))
+        return unittest.TestSuite(tests)
+
+    def test_keeps_classes_together(self):
+        shards = partition(self.suite(), 2)
+        self.assertEqual(len(shards), 2)
+        classes = [set(type(test) for test in shard) for shard in shards]
+        self.assertFalse(classes[0] & classes[1])
+        self.assertEqual(
+            sum(shard.countTestCases() for shard in shards),
+            self.suite().countTestCases()
+        )
+
+    def test_keeps_order(self):
+        order = [test.id() for test in self.suite()]
+        for shard in partition(self.suite(), 2):
+            ids = [test.id() for test in shard]
+            self.assertEqual(ids, sorted(ids, key=order.index))
+
+    def test_no_more_shards_than_classes(self):
+        self.assertEqual(len(partition(self.suite(), 10)), 3)
+
+
+class RunnerTests(SimpleTestCase):
+    """The runner end to end, in a subprocess with its own database."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.database = os.path.join(self.directory, 'default.db')
+        self.test_database = os.path.join(self.directory, 'test_default.db')
+
+    def run_tests(self, parallel=1):
+        process = subprocess.Popen(
+            [sys.executable, '-c', RUN_TESTS % dict(
+                root=os.path.dirname(settings.DJANGO_ROOT),
+                settings=os.environ['DJANGO_SETTINGS_MODULE'],
+                database=self.database,
+                parallel=parallel,
+            )],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        )
+        output = process.communicate()[0].decode('utf-8')
+        self.assertEqual(process.returncode, 0, output)
+        self.assertIn('OK', output)
+        return output
+
+    def stored_fingerprint(self):
+        database = sqlite3.connect(self.test_database)
+        try:
+            return database.execute(
+                'SELECT fingerprint FROM %s' % FINGERPRINT_TABLE
+            ).fetchone()[0]
+        finally:
+            database.close()
+
+    def test_reuses_database_until_the_schema_changes(self):
+        output = self.run_tests()
+        self.assertNotIn('Reusing', output)
+        fingerprint = self.stored_fingerprint()
+
+        output = self.run_tests()
+        self.assertIn('Reusing test database', output)
+        self.assertIn(fingerprint, output)
+
+        database = sqlite3.connect(self.test_database)
+        database.execute('UPDATE %s SET fingerprint = ?' % FINGERPRINT_TABLE,
+                         ['stale'])
+        database.commit()
+        database.close()
+        output = self.run_tests()
+        self.assertIn('changed (stale -> %s)' % fingerprint, output)
+        self.assertEqual(self.stored_fingerprint(), fingerprint)
+
+    def test_parallel_shards(self):
+        output = self.run_tests(parallel=2)
+        self.assertIn('Running 4 tests in 2 processes', output)
+        self.assertIn('Ran 4 tests', output)
+        # the copies for the workers are removed
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.directory)
+                   if name.endswith('.db')),
+            ['test_default.db']
+        )
+
+
+class QueryBudgetMixinTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(6):
+            upload = Upload.objects.create(filename='%d.txt' % i, size=1)
+            UploadPart.objects.create(
+                upload=upload, offset=0, size=1, name='%d' % i
+            )
+
+    def test_assert_max_queries(self):
+        with self.assertMaxQueries(1):
+            list(Upload.objects.all())
+        with self.assertRaises(AssertionError):
+            with self.assertMaxQueries(1):
+                list(Upload.objects.all())
+                list(UploadPart.objects.all())
+
+    def test_assert_no_n_plus_one(self):
+        with self.assertRaises(AssertionError) as raised:
+            with self.assertNoNPlusOne():
+                for part in UploadPart.objects.all():
+                    part.upload.filename
+        message = str(raised.exception)
+        self.assertIn('N+1: 6 x', message)
+        self.assertIn('select_related() the foreign key to Upload', message)
+        self.assertIn('UploadPart.upload', message)
+
+        with self.assertNoNPlusOne():
+            for part in UploadPart.objects.select_related('upload'):
+                part.upload.filename
+
+    def test_repeated_identical_query_is_not_n_plus_one(self):
+        with self.assertNoNPlusOne():
+            for _ in range(6):
+                Upload.objects.filter(filename='0.txt').exists()
+
+    def request_view(self, view):
+        middleware = QueryInspectionMiddleware()
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        middleware.process_view(request, view, (), {})
+        return middleware.process_response(request, view(request))
+
+    def test_view_query_budget(self):
+        def view(request):
+            return HttpResponse(
+                Upload.objects.count() + UploadPart.objects.count()
+            )
+
+        self.request_view(query_budget(2)(view))
+        with self.assertRaises(QueryBudgetExceeded):
+            self.request_view(query_budget(1)(view))
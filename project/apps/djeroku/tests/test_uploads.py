@@ -0,0 +1,154 @@
+from __future__ import absolute_import
+
+import hashlib
+import json
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, override_settings
+
+from djeroku import uploads
+from djeroku.models import Upload
+
+
+class TemporaryStorage(FileSystemStorage):
+    """The UPLOAD_STORAGE of these tests, in a directory of their own."""
+    location = None
+
+    def __init__(self):
+        super(TemporaryStorage, self).__init__(
+            location=TemporaryStorage.location, base_url='/media/'
+        )
+
+
+CONTENT = b'0123456789abcdefghij'
+
+
+@override_settings(
+    UPLOAD_STORAGE='%s.TemporaryStorage' % __name__,
+    UPLOAD_CHUNK_SIZE=8,
+    UPLOAD_MAX_SIZE=100,
+    UPLOAD_DERIVATIVES={},
+)
+class UploadProtocolTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(UploadProtocolTests, cls).setUpClass()
+        TemporaryStorage.location = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TemporaryStorage.location, ignore_errors=True)
+        super(UploadProtocolTests, cls).tearDownClass()
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('uploader', password='secret')
+        self.client.login(username='uploader', password='secret')
+
+    def create(self, size=len(CONTENT)):
+        response = self.client.post('/uploads/', json.dumps({
+            'filename': 'notes.txt', 'size': size,
+            'content_type': 'text/plain',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response['Location']
+
+    def put(self, url, offset, data):
+        return self.client.put(
+            url, data, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_upload_in_chunks(self):
+        url = self.create()
+        status = json.loads(self.client.get(url).content.decode('utf-8'))
+        self.assertEqual((status['offset'], status['status']),
+                         (0, Upload.UPLOADING))
+
+        for offset in range(0, len(CONTENT), 8):
+            response = self.put(url, offset, CONTENT[offset:offset + 8])
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response['Upload-Offset'],
+                             str(min(offset + 8, len(CONTENT))))
+
+        # processed by the (eager) celery task after the last chunk
+        status = json.loads(self.client.get(url).content.decode('utf-8'))
+        sha256 = hashlib.sha256(CONTENT).hexdigest()
+        self.assertEqual(status['status'], Upload.READY)
+        self.assertEqual(status['sha256'], sha256)
+        self.assertEqual(status['md5'], hashlib.md5(CONTENT).hexdigest())
+        upload = Upload.objects.get()
+        self.assertEqual(upload.name, 'uploads/%s/%s.txt' % (sha256[:2],
+                                                             sha256))
+        with uploads.get_storage().open(upload.name) as f:
+            self.assertEqual(f.read(), CONTENT)
+        self.assertFalse(upload.parts.exists())
+
+    def test_wrong_offset_is_a_conflict(self):
+        url = self.create()
+        self.assertEqual(self.put(url, 0, CONTENT[:8]).status_code, 200)
+
+        # the same chunk again, as after a lost response
+        response = self.put(url, 0, CONTENT[:8])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '8')
+        # a chunk past the received bytes
+        response = self.put(url, 16, CONTENT[16:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '8')
+
+        # the client resumes where the server says
+        offset = int(self.client.get(url)['Upload-Offset'])
+        self.assertEqual(self.put(url, offset, CONTENT[8:16]).status_code,
+                         200)
+        self.assertEqual(Upload.objects.get().parts.count(), 2)
+
+    def test_bad_chunks(self):
+        url = self.create()
+        # over UPLOAD_CHUNK_SIZE
+        self.assertEqual(self.put(url, 0, CONTENT[:9]).status_code, 400)
+        response = self.client.put(url, CONTENT[:8],
+                                   content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Upload.objects.get().offset, 0)
+
+        url = self.create(size=4)
+        # past the end of the upload
+        self.assertEqual(self.put(url, 0, CONTENT[:8]).status_code, 400)
+
+    def test_bad_uploads(self):
+        response = self.client.post('/uploads/', {
+            'filename': 'big.bin', 'size': 101
+        })
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/uploads/', {'filename': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+        self.client.logout()
+        response = self.client.post('/uploads/', {
+            'filename': 'notes.txt', 'size': 4
+        })
+        self.assertEqual(response.status_code, 403)
+
+    def test_only_the_owner_sees_an_upload(self):
+        url = self.create()
+        get_user_model().objects.create_user('other', password='secret')
+        self.client.login(username='other', password='secret')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.put(url, 0, CONTENT[:8]).status_code, 404)
+
+    def test_abort(self):
+        url = self.create()
+        self.put(url, 0, CONTENT[:8])
+        storage = uploads.get_storage()
+        parts = uploads._parts_directory(Upload.objects.get())
+        self.assertEqual(len(storage.listdir(parts)[1]), 1)
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(storage.listdir(parts)[1], [])
+        self.assertEqual(self.client.get(url).status_code, 404)
@@ -0,0 +1,141 @@
+from __future__ import absolute_import
+
+import threading
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from djeroku import warmup
+from djeroku.middleware import CacheWarmupMiddleware
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'djeroku.cache.RecordingCache',
+            'LOCATION': 'locmem',
+        },
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'djeroku-warmup-tests',
+        },
+    },
+    CACHE_WARMUP_ENABLED=True,
+    CACHE_WARMUP_CACHE='default',
+)
+class WarmupTests(SimpleTestCase):
+
+    def setUp(self):
+        caches['locmem'].clear()
+        self.recorder = warmup.Recorder(sample_rate=1, flush_interval=3600,
+                                        max_items=2)
+        self.addCleanup(setattr, warmup, '_recorder', warmup._recorder)
+        warmup._recorder = self.recorder
+
+    def test_recording_cache_samples_reads(self):
+        cache = caches['default']
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b', 'default'), 'default')
+        self.assertEqual(cache.get_many(['a', 'b']), {'a': 1})
+        self.assertEqual(self.recorder.keys, {'a': 2, 'b': 2})
+        self.assertEqual((self.recorder.hits, self.recorder.misses), (2, 2))
+
+    def test_flush_keeps_the_most_frequent(self):
+        for path, count in (('/a/', 3), ('/b/', 1), ('/c/', 2)):
+            for _ in range(count):
+                self.recorder.record_url(path)
+        self.recorder.flush()
+        self.assertEqual(self.recorder.urls, {})
+
+        for _ in range(4):
+            self.recorder.record_url('/b/')
+        self.recorder.flush()
+        store = warmup.get_store()
+        self.assertEqual(list(store.get(warmup.URLS).items()),
+                         [('/b/', 4), ('/a/', 3)])
+        # counts per minute for hit_rates
+        self.recorder.record_key('k', True)
+        self.recorder.flush()
+        self.assertEqual(warmup.hit_rates(1)[0][1:], (1, 0))
+
+    def test_middleware_records_cacheable_anonymous_paths(self):
+        middleware = CacheWarmupMiddleware()
+
+        def respond(path='/page/', response=None, user=AnonymousUser(),
+                    method='get'):
+            request = getattr(RequestFactory(), method)(path)
+            request.user = user
+            middleware.process_response(request, response or HttpResponse())
+
+        respond('/page/?token=secret&email=a@example.com')
+        respond()
+        respond(method='post')
+        respond(response=HttpResponse(status=404))
+        respond(response=StreamingHttpResponse([]))
+        respond(user=User(username='someone'))
+        private = HttpResponse()
+        private['Cache-Control'] = 'private, max-age=60'
+        respond(response=private)
+        with_cookie = HttpResponse()
+        with_cookie.set_cookie('sessionid', 'x')
+        respond(response=with_cookie)
+
+        self.assertEqual(self.recorder.urls, {'/page/': 2})
+
+    def test_warm_requests_paths_and_rebuilds_keys(self):
+        requested = []
+
+        def application(environ, start_response):
+            requested.append((environ['PATH_INFO'], environ['QUERY_STRING']))
+            # reads made while warming aren't traffic
+            caches['default'].get('read-by-a-page')
+            start_response('200 OK', [])
+            return [b'ok']
+
+        store = warmup.get_store()
+        store.set(warmup.URLS, {'/a/': 2, '/b/?q=1': 1})
+        store.set(warmup.KEYS, {'present': 2, 'product:1': 1, 'other': 1})
+        store.set('present', True)
+        self.addCleanup(setattr, warmup, '_warmers', list(warmup._warmers))
+
+        @warmup.warms('product:')
+        def warm_product(key):
+            caches['default'].get('read-by-a-warmer')
+            return 'product %s' % key.split(':')[1]
+
+        result = warmup.warm(concurrency=2, application=application)
+        self.assertEqual(sorted(requested), [('/a/', ''), ('/b/', '')])
+        self.assertEqual(store.get('product:1'), 'product 1')
+        del result['seconds']
+        self.assertEqual(result, dict(
+            urls=2, urls_ok=2, keys=3, keys_present=1, keys_rebuilt=1,
+            keys_missing=1,
+        ))
+        self.assertEqual(self.recorder.keys, {})
+        self.assertIsNotNone(store.get(warmup.WARMED))
+
+    def test_other_threads_record_while_warming(self):
+        started, finish = threading.Event(), threading.Event()
+
+        def application(environ, start_response):
+            started.set()
+            finish.wait(5)
+            start_response('200 OK', [])
+            return [b'ok']
+
+        warmup.get_store().set(warmup.URLS, {'/a/': 1})
+        thread = threading.Thread(
+            target=warmup.warm, kwargs=dict(application=application)
+        )
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(finish.set)
+        self.assertTrue(started.wait(5))
+
+        caches['default'].get('traffic')
+        self.recorder.record_url('/traffic/')
+        self.assertEqual(self.recorder.keys, {'traffic': 1})
+        self.assertEqual(self.recorder.urls, {'/traffic/': 1})
@@ -0,0 +1,310 @@
+"""
+Resumable chunked uploads into a pluggable storage.
+
+A big file sent as one multipart POST is held by a web worker for as long
+as the upload takes (past heroku's 30 second router timeout on a slow
+connection), buffered by Django's upload handlers, and lost entirely when
+the connection drops. Here the client sends it in pieces instead:
+
+    POST /uploads/     {"filename": ..., "size": ..., "content_type": ...}
+        201 {"upload_url": ..., "offset": 0, "chunk_size": ...}
+    PUT upload_url     Upload-Offset: 0, body: the first chunk_size bytes
+        200 {"offset": ..., ...}
+    PUT upload_url     Upload-Offset: <offset>, body: the next bytes ...
+    GET upload_url     the offset to carry on from after a dropped
+                       connection (409 answers a PUT at the wrong offset),
+                       and once processed the file's "url", "sha256" and
+                       "derivatives"
+    DELETE upload_url  gives up on the upload
+
+(PUTs and DELETEs need the X-CSRFToken header.) Each chunk is read from the
+request and written to the UPLOAD_STORAGE a buffer at a time, as a part of
+its own, so a web worker never holds more than that of a file. Once the
+last byte is in, the `process_upload` task joins the parts, computes the
+sha256 and md5 of the whole and saves it under a name made from its sha256
+- a URL that never changes content, so it can be cached forever - and
+`make_upload_derivatives` makes the UPLOAD_DERIVATIVES of images (with
+Pillow) in a worker, under hashed names too.
+
+Any Django storage works, since parts are separate files: the local
+FileSystemStorage under MEDIA_ROOT in development and tests, a shared one
+(S3 through django-storages) where web and worker processes don't share a
+disk.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+from io import BytesIO
+import json
+import os
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.text import get_valid_filename
+
+from djeroku.models import Upload, UploadPart
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class UploadConflict(Exception):
+    """A chunk that doesn't start where the upload's received bytes end."""
+
+    def __init__(self, offset):
+        super(UploadConflict, self).__init__(
+            'The upload continues at offset %d.' % offset
+        )
+        self.offset = offset
+
+
+def get_storage():
+    path = getattr(settings, 'UPLOAD_STORAGE', None)
+    if path is None:
+        return default_storage
+    return import_string(path)()
+
+
+# RECEIVING
+def create_upload(filename, size, content_type='', user=None):
+    """Start an upload of `size` bytes. Returns the Upload."""
+    max_size = getattr(settings, 'UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+    if not 0 < size <= max_size:
+        raise ValueError('Uploads must be 1 to %d bytes.' % max_size)
+    return Upload.objects.create(
+        filename=os.path.basename(filename)[:255] or 'upload',
+        size=size,
+        content_type=content_type[:100],
+        user=user if user is not None and user.is_authenticated() else None,
+    )
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Store `length` bytes read from `stream` (a request) as the part of
+    `upload` at `offset`, and queue the upload's processing after its last
+    part. Returns the upload's new offset.
+    """
+    from djeroku.tasks import process_upload
+
+    if upload.status != Upload.UPLOADING or offset != upload.offset:
+        raise UploadConflict(upload.offset)
+    chunk_size = getattr(settings, 'UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+    if not 0 < length <= chunk_size:
+        raise ValueError('Chunks must be 1 to %d bytes.' % chunk_size)
+    if offset + length > upload.size:
+        raise ValueError('The chunk runs past the end of the upload.')
+
+    storage = get_storage()
+    reader = _Reader(stream, length)
+    name = storage.save(
+        posixpath.join(_parts_directory(upload), '%012d' % offset),
+        File(reader)
+    )
+    if reader.received != length:
+        # the client went away mid-chunk; it sends the chunk again
+        storage.delete(name)
+        raise ValueError('Received %d of the chunk\'s %d bytes.' % (
+            reader.received, length))
+
+    end = offset + length
+    finished = end == upload.size
+    with transaction.atomic():
+        # only one of two requests sending the same chunk gets it in
+        claimed = Upload.objects.filter(
+            pk=upload.pk, offset=offset, status=Upload.UPLOADING
+        ).update(
+            offset=end,
+            status=Upload.PROCESSING if finished else Upload.UPLOADING,
+            updated=timezone.now(),
+        )
+        if claimed:
+            UploadPart.objects.create(
+                upload=upload, offset=offset, size=length, name=name
+            )
+    if not claimed:
+        storage.delete(name)
+        upload.refresh_from_db()
+        raise UploadConflict(upload.offset)
+
+    upload.offset = end
+    if finished:
+        upload.status = Upload.PROCESSING
+        process_upload.delay(str(upload.pk))
+    return end
+
+
+def abort(upload):
+    """Delete an upload and everything stored for it."""
+    _delete_directory(get_storage(), _parts_directory(upload))
+    upload.delete()
+
+
+class _Reader(object):
+    """At most `length` bytes of a stream, counting those read."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.size = length
+        self.received = 0
+
+    def read(self, size=-1):
+        remaining = self.size - self.received
+        if size < 0 or size > remaining:
+            size = remaining
+        data = self.stream.read(size) if size else b''
+        self.received += len(data)
+        return data
+# END RECEIVING
+
+
+# PROCESSING
+def process(upload):
+    """
+    Join an upload's parts under its content hashed name and record its
+    checksums. Runs in a worker (the process_upload task); the file passes
+    through a temporary file on disk, never memory.
+    """
+    storage = get_storage()
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    with tempfile.TemporaryFile() as joined:
+        for part in upload.parts.order_by('offset'):
+            with storage.open(part.name) as source:
+                for data in source.chunks():
+                    sha256.update(data)
+                    md5.update(data)
+                    joined.write(data)
+        size = joined.tell()
+        if size != upload.size:
+            fail(upload, 'Joined %d of %d bytes.' % (size, upload.size))
+            return
+
+        name = hashed_name(upload.filename, sha256.hexdigest())
+        if not storage.exists(name):
+            joined.seek(0)
+            saved = storage.save(name, File(joined, name))
+            if saved != name:
+                # the same content, finished by another upload meanwhile
+                storage.delete(saved)
+
+    upload.name = name
+    upload.sha256 = sha256.hexdigest()
+    upload.md5 = md5.hexdigest()
+    upload.status = Upload.READY
+    upload.save(update_fields=('name', 'sha256', 'md5', 'status',
+                               'updated'))
+    _delete_directory(storage, _parts_directory(upload))
+    upload.parts.all().delete()
+
+
+def make_derivatives(upload):
+    """
+    Save a copy of an uploaded image scaled to fit each of the
+    UPLOAD_DERIVATIVES bounding boxes, named after the original's hash.
+    """
+    sizes = getattr(settings, 'UPLOAD_DERIVATIVES', {})
+    if Image is None or not sizes:
+        return
+
+    storage = get_storage()
+    with storage.open(upload.name) as source:
+        try:
+            image = Image.open(source)
+            # JPEGs are decoded at a fraction of their size when that's
+            # still big enough
+            image.draft('RGB', (max(width for width, _ in sizes.values()),
+                                max(height for _, height in sizes.values())))
+            image.load()
+        except (IOError, SyntaxError):
+            # not an image Pillow reads
+            return
+
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        format, extension = 'PNG', '.png'
+    else:
+        format, extension = 'JPEG', '.jpg'
+        image = image.convert('RGB')
+
+    derivatives = {}
+    for label, (width, height) in sorted(sizes.items()):
+        name = '%s-%s-%dx%d%s' % (
+            os.path.splitext(upload.name)[0], label, width, height, extension
+        )
+        if not storage.exists(name):
+            derivative = image.copy()
+            derivative.thumbnail((width, height), Image.ANTIALIAS)
+            content = BytesIO()
+            derivative.save(content, format)
+            storage.save(name, ContentFile(content.getvalue()))
+        derivatives[label] = name
+
+    upload.derivatives = json.dumps(derivatives)
+    upload.save(update_fields=('derivatives', 'updated'))
+
+
+def fail(upload, error):
+    upload.status = Upload.FAILED
+    upload.error = error
+    upload.save(update_fields=('status', 'error', 'updated'))
+
+
+def hashed_name(filename, sha256):
+    """Where content with this hash is kept, whatever it was called."""
+    extension = os.path.splitext(get_valid_filename(filename))[1].lower()
+    return posixpath.join(
+        getattr(settings, 'UPLOAD_DIRECTORY', 'uploads'),
+        sha256[:2], sha256 + extension[:16]
+    )
+# END PROCESSING
+
+
+def describe(upload):
+    """An upload's progress, checksums and URLs, as the views return it."""
+    storage = get_storage()
+    ready = upload.status == Upload.READY
+    return {
+        'id': str(upload.pk),
+        'filename': upload.filename,
+        'content_type': upload.content_type,
+        'size': upload.size,
+        'offset': upload.offset,
+        'status': upload.status,
+        'sha256': upload.sha256,
+        'md5': upload.md5,
+        'url': storage.url(upload.name) if ready else None,
+        'derivatives': dict(
+            (label, storage.url(name))
+            for label, name in json.loads(upload.derivatives).items()
+        ),
+        'error': upload.error,
+    }
+
+
+def _parts_directory(upload):
+    return posixpath.join(
+        getattr(settings, 'UPLOAD_DIRECTORY', 'uploads'), 'parts',
+        str(upload.pk)
+    )
+
+
+def _delete_directory(storage, path):
+    """Every file under `path`, including parts left by failed requests."""
+    try:
+        directories, files = storage.listdir(path)
+    except OSError:
+        return
+    for name in files:
+        storage.delete(posixpath.join(path, name))
+    for name in directories:
+        _delete_directory(storage, posixpath.join(path, name))
@@ -0,0 +1,10 @@
+from django.conf.urls import url
+
+from djeroku import views
+
+
+urlpatterns = [
+    url(r'^$', views.create_upload, name='upload_create'),
+    url(r'^(?P<upload_id>[0-9a-f-]{32,36})/$', views.upload_detail,
+        name='upload_detail'),
+]
@@ -0,0 +1,47 @@
+"""
+Small helpers shared by the djeroku modules.
+"""
+
+from __future__ import absolute_import
+
+import os
+import threading
+
+
+class BackgroundThread(object):
+    """
+    Runs `target` on a daemon thread, started on the first call to
+    `ensure_started`. Threads don't survive a fork, so it is started again
+    in any process forked after it began (gunicorn --preload, celery
+    prefork workers).
+    """
+
+    def __init__(self, target, name):
+        self.target = target
+        self.name = name
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def is_running(self):
+        return (
+            self._pid == os.getpid() and
+            self._thread is not None and
+            self._thread.is_alive()
+        )
+
+    def ensure_started(self):
+        if self.is_running():
+            return
+        with self._lock:
+            if self.is_running():
+                return
+            self._thread = threading.Thread(target=self.target, name=self.name)
+            self._thread.daemon = True
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def join(self, timeout=None):
+        """Wait for a thread started in this process to finish."""
+        if self.is_running():
+            self._thread.join(timeout)
@@ -0,0 +1,93 @@
+"""
+Views for the djeroku app, included under /uploads/ by project/urls.py.
+See djeroku.uploads for the upload protocol.
+"""
+
+from __future__ import absolute_import
+
+import json
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import add_never_cache_headers
+from django.views.decorators.http import require_http_methods
+
+from djeroku import uploads
+from djeroku.models import Upload
+
+
+@require_http_methods(['POST'])
+def create_upload(request):
+    if not request.user.is_authenticated():
+        return _error('Log in to upload files.', 403)
+    if request.META.get('CONTENT_TYPE', '').startswith('application/json'):
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            return _error('The body is not valid JSON.')
+    else:
+        data = request.POST
+    try:
+        upload = uploads.create_upload(
+            data.get('filename') or '',
+            int(data.get('size')),
+            data.get('content_type') or '',
+            user=request.user,
+        )
+    except (TypeError, ValueError) as e:
+        return _error(str(e))
+
+    location = request.build_absolute_uri(
+        reverse('upload_detail', args=(upload.pk,))
+    )
+    response = _status(
+        upload, status=201, upload_url=location,
+        chunk_size=getattr(settings, 'UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024),
+    )
+    response['Location'] = location
+    return response
+
+
+@require_http_methods(['GET', 'HEAD', 'PUT', 'DELETE'])
+def upload_detail(request, upload_id):
+    try:
+        upload = Upload.objects.get(pk=upload_id)
+    except (Upload.DoesNotExist, ValueError):
+        raise Http404
+    if upload.user_id is not None and upload.user_id != request.user.pk:
+        raise Http404
+
+    if request.method == 'DELETE':
+        uploads.abort(upload)
+        return HttpResponse(status=204)
+
+    if request.method == 'PUT':
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            return _error('PUT chunks with Upload-Offset and Content-Length '
+                          'headers.')
+        try:
+            uploads.write_chunk(upload, offset, request, length)
+        except uploads.UploadConflict:
+            return _status(upload, status=409)
+        except ValueError as e:
+            return _error(str(e))
+
+    return _status(upload)
+
+
+def _status(upload, status=200, **extra):
+    response = JsonResponse(
+        dict(uploads.describe(upload), **extra), status=status
+    )
+    response['Upload-Offset'] = upload.offset
+    response['Upload-Length'] = upload.size
+    add_never_cache_headers(response)
+    return response
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
@@ -0,0 +1,304 @@
+"""
+Post-release cache warming.
+
+After a release the cache is cold for every code path whose keys changed,
+and the first minutes of traffic go straight to the database. To warm it
+back up, djeroku samples what the cache is used for while the site runs:
+
+- `djeroku.cache.RecordingCache` (wrapping the real cache in
+  settings/prod.py) samples the keys read, whether each read was a hit, and
+  hit/miss counts per minute
+- `djeroku.middleware.CacheWarmupMiddleware` samples the paths (without
+  query strings) of anonymous GET requests answered with a cacheable 200
+
+Each process keeps its samples in memory and merges them into the cache
+every CACHE_WARMUP_FLUSH_INTERVAL seconds, keeping the CACHE_WARMUP_MAX_ITEMS
+most frequent of each. Sampling and recording are on with
+CACHE_WARMUP_ENABLED.
+
+`warm` (run by `python manage.py release`, `python manage.py warmcache`
+and the `djeroku.tasks.warm_cache` task) requests the hottest urls through
+the WSGI application with CACHE_WARMUP_CONCURRENCY threads, which fills the
+caches they use, then rebuilds hot keys that are still missing with the
+functions registered for them:
+
+    @warmup.warms('product:')
+    def warm_product(key):
+        return Product.objects.get(pk=key.split(':')[1]).summary()
+
+`hit_rates` reports the per-minute hit rate since the last warm up.
+"""
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import random
+import threading
+from time import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.wsgi import get_wsgi_application
+
+from djeroku.wsgi import wsgi_get
+
+
+KEYS = 'djeroku:warmup:keys'
+URLS = 'djeroku:warmup:urls'
+WARMED = 'djeroku:warmup:warmed'
+RATE = 'djeroku:warmup:rate:%d:%s'
+
+# recorded samples and counts outlive the deploys they are for
+STORE_TIMEOUT = 7 * 24 * 60 * 60
+RATE_TIMEOUT = 24 * 60 * 60
+
+_warmers = []
+
+
+class _Warming(threading.local):
+    # requests and reads made by `warm` aren't traffic, so aren't recorded;
+    # per thread, since the traffic goes on in other threads meanwhile
+    active = False
+
+
+_warming = _Warming()
+
+
+def warms(prefix):
+    """Register a function that rebuilds the value of keys with `prefix`."""
+    def register(function):
+        _warmers.append((prefix, function))
+        return function
+    return register
+
+
+def get_store():
+    """The cache samples are kept in, bypassing any RecordingCache."""
+    cache = caches[getattr(settings, 'CACHE_WARMUP_CACHE', 'default')]
+    return getattr(cache, 'wrapped', cache)
+
+
+# RECORDING
+class Recorder(object):
+    """Samples cache reads and requests, and merges them into the store."""
+
+    def __init__(self, sample_rate=None, flush_interval=None, max_items=None):
+        if sample_rate is None:
+            sample_rate = getattr(settings, 'CACHE_WARMUP_SAMPLE_RATE', 0.01)
+        if flush_interval is None:
+            flush_interval = getattr(
+                settings, 'CACHE_WARMUP_FLUSH_INTERVAL', 60
+            )
+        if max_items is None:
+            max_items = getattr(settings, 'CACHE_WARMUP_MAX_ITEMS', 500)
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._reset()
+        self._flushed = time()
+
+    def _reset(self):
+        self.keys = {}
+        self.urls = {}
+        self.hits = self.misses = 0
+
+    def record_key(self, key, hit):
+        if random.random() >= self.sample_rate or _warming.active:
+            return
+        with self._lock:
+            self.keys[key] = self.keys.get(key, 0) + 1
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        self.maybe_flush()
+
+    def record_url(self, path):
+        if random.random() >= self.sample_rate or _warming.active:
+            return
+        with self._lock:
+            self.urls[path] = self.urls.get(path, 0) + 1
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            keys, urls = self.keys, self.urls
+            hits, misses = self.hits, self.misses
+            self._reset()
+            self._flushed = time()
+        if not (keys or urls or hits or misses):
+            return
+
+        store = get_store()
+        try:
+            # read-modify-write across processes can lose a flush, which
+            # sampled counts can afford
+            for name, counts in ((KEYS, keys), (URLS, urls)):
+                if counts:
+                    store.set(name, top(
+                        merge(store.get(name) or {}, counts), self.max_items
+                    ), STORE_TIMEOUT)
+            minute = int(time() // 60)
+            for name, count in (('hits', hits), ('misses', misses)):
+                if count:
+                    key = RATE % (minute, name)
+                    store.add(key, 0, RATE_TIMEOUT)
+                    store.incr(key, count)
+        except Exception:
+            # never let bookkeeping break the request that triggered it
+            pass
+
+
+def merge(counts, more):
+    merged = dict(counts)
+    for item, count in more.items():
+        merged[item] = merged.get(item, 0) + count
+    return merged
+
+
+def top(counts, limit):
+    """The `limit` items with the highest counts, highest first."""
+    return OrderedDict(
+        sorted(counts.items(), key=lambda item: -item[1])[:limit]
+    )
+
+
+_recorder = None
+
+
+def get_recorder():
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder()
+    return _recorder
+# END RECORDING
+
+
+# WARMING
+def warm(limit=None, concurrency=None, application=None):
+    """
+    Request the hottest urls and rebuild the hottest missing keys. Returns a
+    dict of counts of what happened, with the seconds it took.
+    """
+    if limit is None:
+        limit = getattr(settings, 'CACHE_WARMUP_URLS', 100)
+    if concurrency is None:
+        concurrency = getattr(settings, 'CACHE_WARMUP_CONCURRENCY', 4)
+    application = application or get_wsgi_application()
+    store = get_store()
+    start = time()
+
+    urls = list((store.get(URLS) or {}).keys())[:limit]
+    statuses = run_bounded(
+        lambda url: _get(application, url), urls, concurrency
+    )
+    keys = list((store.get(KEYS) or {}).keys())
+    present = store.get_many(keys) if keys else {}
+    missing = [key for key in keys if key not in present]
+    rebuilt = run_bounded(_rebuild, missing, concurrency)
+
+    result = dict(
+        urls=len(urls),
+        urls_ok=sum(1 for status in statuses if status == 200),
+        keys=len(keys),
+        keys_present=len(present),
+        keys_rebuilt=sum(1 for done in rebuilt if done),
+        keys_missing=sum(1 for done in rebuilt if not done),
+        seconds=time() - start,
+    )
+    store.set(WARMED, time(), STORE_TIMEOUT)
+    return result
+
+
+@contextmanager
+def warming():
+    """Stop recording what this thread does while warming the cache."""
+    active, _warming.active = _warming.active, True
+    try:
+        yield
+    finally:
+        _warming.active = active
+
+
+def _get(application, url):
+    # only paths are recorded, but samples from older releases had query
+    # strings
+    path = url.partition('?')[0]
+    with warming():
+        try:
+            return wsgi_get(application, path)
+        except Exception:
+            return None
+
+
+def _rebuild(key):
+    for prefix, function in _warmers:
+        if key.startswith(prefix):
+            try:
+                with warming():
+                    value = function(key)
+            except Exception:
+                return False
+            caches[getattr(settings, 'CACHE_WARMUP_CACHE', 'default')].set(
+                key, value
+            )
+            return True
+    return False
+
+
+def run_bounded(function, items, concurrency):
+    """`map(function, items)` with at most `concurrency` calls at a time."""
+    results = [None] * len(items)
+    pending = list(enumerate(items))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                index, item = pending.pop()
+            results[index] = function(item)
+
+    threads = [
+        threading.Thread(target=worker)
+        for _ in range(min(concurrency, len(items)))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def hit_rates(minutes=15):
+    """
+    Sampled (minute start, hits, misses) for each minute since the last
+    warm up, up to `minutes` of them.
+    """
+    store = get_store()
+    warmed = store.get(WARMED)
+    now = int(time() // 60)
+    first = now - minutes + 1
+    if warmed is not None:
+        first = max(first, int(warmed // 60))
+    minutes = range(first, now + 1)
+    counts = store.get_many([
+        RATE % (minute, name)
+        for minute in minutes for name in ('hits', 'misses')
+    ])
+    return [
+        (
+            minute * 60,
+            counts.get(RATE % (minute, 'hits'), 0),
+            counts.get(RATE % (minute, 'misses'), 0),
+        )
+        for minute in minutes
+    ]
+# END WARMING
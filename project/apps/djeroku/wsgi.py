@@ -0,0 +1,61 @@
+"""
+Requests to a WSGI application in this process, for the benchmarks
+(djeroku.bench) and cache warming (djeroku.warmup).
+"""
+
+from __future__ import absolute_import
+
+from io import BytesIO
+import sys
+
+from django.conf import settings
+
+
+def local_host():
+    """The Host requests made here use, the first ALLOWED_HOSTS entry."""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def wsgi_get(application, path, cookie=None, query_string=''):
+    """
+    GET `path` from a WSGI application in this process. Returns the status
+    code.
+    """
+    host = local_host()
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query_string,
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': host,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if cookie:
+        environ['HTTP_COOKIE'] = cookie
+
+    status = []
+
+    def start_response(status_line, headers, exc_info=None):
+        status.append(int(status_line.split()[0]))
+
+    body = application(environ, start_response)
+    try:
+        for chunk in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return status[0] if status else None
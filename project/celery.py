@@ -2,6 +2,9 @@
 Celery configuration that uses the Django settings for everything,
 including autodiscovering tasks by searching installed apps  /tasks.py
 files.
+
+To spread work over a big table across the workers, use
+djeroku.batches.fan_out rather than slicing querysets into tasks.
 """
 
 from __future__ import absolute_import
@@ -73,6 +73,24 @@ DATABASES = {
 # END DATABASE CONFIGURATION
 
 
+# EMAIL QUEUE CONFIGURATION
+# Used when EMAIL_BACKEND is djeroku.mail.CeleryEmailBackend (the default in
+# settings/prod.py). The celery workers send the queued email with this
+# backend:
+EMAIL_QUEUE_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+# messages per send_emails task
+EMAIL_QUEUE_BATCH_SIZE = 50
+
+# seconds a worker keeps reusing one SMTP connection
+EMAIL_QUEUE_CONNECTION_MAX_AGE = 300
+
+# failed messages are retried after 30s, 60s, 120s...
+EMAIL_QUEUE_MAX_RETRIES = 5
+EMAIL_QUEUE_RETRY_DELAY = 30
+# END EMAIL QUEUE CONFIGURATION
+
+
 # GENERAL CONFIGURATION
 
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#site-id
@@ -116,6 +134,15 @@ STATICFILES_FINDERS = (
     'django.contrib.staticfiles.finders.FileSystemFinder',
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',
 )
+
+# `python manage.py collectstatic_incremental` (used by the fabfile) only
+# copies changed files and also writes content-hashed and gzipped copies.
+# Use this storage to link to the hashed copies (cacheable forever):
+# STATICFILES_STORAGE = 'djeroku.staticfiles.FingerprintedStaticFilesStorage'
+
+# What collectstatic_incremental collected last time, kept out of
+# STATIC_ROOT so it is never served.
+STATICFILES_MANIFEST = normpath(join(SITE_ROOT, 'staticfiles.json'))
 # END STATIC FILE CONFIGURATION
 
 
@@ -152,8 +179,18 @@ TEMPLATES = [
 # MIDDLEWARE CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#middleware-classes
 MIDDLEWARE_CLASSES = (
+    # First, so they see the response every other middleware returns:
+    # compression last of all, with ETags computed on the body before it.
+    'djeroku.middleware.CompressionMiddleware',
+    'djeroku.middleware.WeakETagMiddleware',
+
+    # Saves whole pages (LOCALE_PAGE_CACHE_ENABLED) as every middleware
+    # below left them.
+    'djeroku.middleware.LocaleUpdateCacheMiddleware',
+
     # Default Django middleware.
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'djeroku.middleware.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -162,6 +199,12 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
 
+    # Djeroku middleware, each enabled by its own setting below.
+    'djeroku.middleware.QueryInspectionMiddleware',
+    'djeroku.middleware.CacheWarmupMiddleware',
+
+    # Last, so a cached page is found after the language is known.
+    'djeroku.middleware.LocaleFetchFromCacheMiddleware',
 )
 # END MIDDLEWARE CONFIGURATION
 
@@ -198,6 +241,9 @@ THIRD_PARTY_APPS = (
 )
 
 LOCAL_APPS = (
+    # djeroku performance and operations tooling (project/apps/djeroku)
+    'djeroku',
+
     # add your apps in the project/apps folder here (without any prefix)
 )
 
@@ -207,19 +253,32 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 # LOGGING CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#logging
+# Errors are emailed to the ADMINS as a periodic digest instead of one
+# synchronous email per error (see djeroku/log.py). The handler queues
+# records for a background thread, which de-duplicates them and every
+# `interval` seconds hands the digest to a celery task - at most one digest
+# per interval across every process sharing `cache`.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
-        'mail_admins': {
+        'error_digest': {
             'level': 'ERROR',
-            'class': 'django.utils.log.AdminEmailHandler',
-            'filters': []
+            'class': 'djeroku.log.ErrorDigestHandler',
+            'filters': [],
+            'interval': 60,
+            # queued records and distinct errors per digest - overflow is
+            # dropped and counted in the next digest
+            'buffer_size': 1000,
+            'max_fingerprints': 100,
+            # claims each interval's digest with cache.add - use a cache
+            # shared by every dyno, or None for one digest per process
+            'cache': 'default',
         }
     },
     'loggers': {
         'django.request': {
-            'handlers': ['mail_admins'],
+            'handlers': ['error_digest'],
             'level': 'ERROR',
             'propagate': True,
         },
@@ -228,6 +287,82 @@ LOGGING = {
 # END LOGGING CONFIGURATION
 
 
+# SLOW QUERY LOG CONFIGURATION
+# Samples queries slower than the threshold, with their call site and query
+# plan, into the djeroku SlowQuery table from a background thread.
+# Summarize with `python manage.py slowqueries`.
+SLOW_QUERY_LOG_ENABLED = False
+SLOW_QUERY_THRESHOLD_MS = 200
+
+# fraction of slow queries to record, and fraction of recorded queries that
+# are re-run with EXPLAIN ANALYZE (postgres only) instead of a plain EXPLAIN
+SLOW_QUERY_SAMPLE_RATE = 1.0
+SLOW_QUERY_ANALYZE_RATE = 0.05
+
+# in-memory buffer size (overflow is dropped) and rows kept in the table
+SLOW_QUERY_BUFFER_SIZE = 500
+SLOW_QUERY_MAX_ROWS = 10000
+# END SLOW QUERY LOG CONFIGURATION
+
+
+# QUERY INSPECTION CONFIGURATION
+# Logs likely N+1 query loops in each request and celery task, and checks
+# view query budgets (see djeroku/queries.py).
+QUERY_INSPECTION_ENABLED = False
+
+# times a statement can repeat with different parameters before it is
+# reported as an N+1 loop
+N_PLUS_ONE_THRESHOLD = 5
+
+# query budgets by url name, for views that aren't decorated with
+# djeroku.queries.query_budget - eg, {'admin:index': 12}
+QUERY_BUDGETS = {}
+
+# raise QueryBudgetExceeded instead of logging (the test runner sets this)
+QUERY_BUDGET_RAISE = False
+# END QUERY INSPECTION CONFIGURATION
+
+
+# TEST CONFIGURATION
+# See: https://docs.djangoproject.com/en/dev/ref/settings/#test-runner
+TEST_RUNNER = 'djeroku.testing.DjerokuTestRunner'
+
+# Worker processes the suite is split across, 0 for one per CPU and 1 to run
+# serially. Override per run with `python manage.py test --parallel=N`.
+TEST_PARALLEL = 0
+
+# Keep the test database between runs, rebuilding it only when migrations or
+# models change. Override per run with `python manage.py test --no-reuse-db`.
+TEST_REUSE_DB = True
+
+# Keep sqlite test databases in memory instead of a file next to the
+# database. Faster to build, but can't be reused between runs (so it
+# overrides TEST_REUSE_DB) or copied for parallel workers. Override per run
+# with `python manage.py test --in-memory`.
+TEST_SQLITE_IN_MEMORY = False
+# END TEST CONFIGURATION
+
+
+# SQLITE CONFIGURATION
+# Applied to every sqlite connection as it opens (see djeroku/sqlite.py), so
+# a web process and a celery worker can share the development database
+# without "database is locked" stalls. Production uses postgres and is
+# unaffected.
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    # milliseconds to wait for another connection's write lock
+    ('busy_timeout', 20000),
+)
+
+# How atomic blocks begin their transaction. IMMEDIATE takes the write lock
+# at the start, so concurrent writers wait for each other (up to the busy
+# timeout) instead of failing part way through.
+SQLITE_TRANSACTION_MODE = 'IMMEDIATE'
+# END SQLITE CONFIGURATION
+
+
 # CELERY CONFIGURATION
 CELERY_TASK_RESULT_EXPIRES = timedelta(minutes=30)
 
@@ -240,6 +375,174 @@ setup_loader()
 # END CELERY CONFIGURATION
 
 
+# BATCH JOB CONFIGURATION
+# Defaults for djeroku.batches.fan_out: rows per chunk task, and how many
+# chunk tasks of one job may be queued or running at once.
+BATCH_CHUNK_SIZE = 500
+BATCH_CONCURRENCY = 4
+
+# Seconds after which a chunk that hasn't finished is taken to be lost with
+# its worker and dispatched again (keep it above your slowest chunk), and
+# how often a running job is checked for lost chunks.
+BATCH_CHUNK_TIMEOUT = 600
+BATCH_WATCH_INTERVAL = 60
+# END BATCH JOB CONFIGURATION
+
+
+# COUNT CONFIGURATION
+# djeroku.pagination.count_rows (and the admin changelists using
+# djeroku.admin.EstimatedCountAdminMixin) use the postgres planner's row
+# estimate instead of COUNT(*) when it is at least this many rows.
+COUNT_ESTIMATE_THRESHOLD = 100000
+
+# Seconds exact counts and admin filter facet counts are cached for.
+COUNT_CACHE_TIMEOUT = 60
+# END COUNT CONFIGURATION
+
+
+# EXPORT CONFIGURATION
+# Rows read and written at a time by djeroku.export's streaming exports.
+EXPORT_CHUNK_SIZE = 2000
+# END EXPORT CONFIGURATION
+
+
+# JSON STREAM CONFIGURATION
+# Rows read and encoded at a time by djeroku.jsonstream's
+# StreamingJsonResponse.
+JSON_STREAM_CHUNK_SIZE = 1000
+
+# Encode with ujson when it is installed (reqs/prod.txt). It writes floats
+# with at most 15 decimal places; turn it off to keep every digit.
+JSON_STREAM_UJSON = True
+# END JSON STREAM CONFIGURATION
+
+
+# UPLOAD CONFIGURATION
+# djeroku.uploads: resumable chunked uploads (POST /uploads/, then a PUT per
+# chunk), joined, checksummed and resized by celery tasks. Dotted path of the
+# storage class chunks and finished files are saved with; None uses
+# DEFAULT_FILE_STORAGE, a FileSystemStorage under MEDIA_ROOT. Web and worker
+# dynos don't share a disk, so use a shared storage (S3 through
+# django-storages) on heroku.
+UPLOAD_STORAGE = None
+
+# Directory of the storage uploads are saved in.
+UPLOAD_DIRECTORY = 'uploads'
+
+# Largest chunk one PUT may carry, and largest upload.
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+
+# Copies made of uploaded images (when Pillow reads them), scaled to fit a
+# (width, height) box.
+UPLOAD_DERIVATIVES = {
+    'thumbnail': (200, 200),
+    'preview': (1200, 1200),
+}
+
+# Files sent in ordinary multipart forms go to a temporary file as they
+# arrive, instead of memory up to 2.5MB.
+# See: https://docs.djangoproject.com/en/dev/ref/settings/#file-upload-handlers
+FILE_UPLOAD_HANDLERS = (
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+)
+# END UPLOAD CONFIGURATION
+
+
+# COMPRESSION CONFIGURATION
+# djeroku.middleware.CompressionMiddleware compresses dynamic responses with
+# brotli (when the brotli package is installed) or gzip, whichever the
+# client accepts. Static files are precompressed by collectstatic instead.
+# Off by default, like django's GZipMiddleware: compressing pages that mix
+# secrets with reflected input is open to BREACH. Responses to requests that
+# used the CSRF token are never compressed, but other secrets in a page
+# (session-specific data) are; check your pages before turning it on.
+COMPRESSION_ENABLED = False
+
+# smaller bodies aren't worth the CPU and the extra header
+COMPRESSION_MIN_SIZE = 1024
+
+# Content-Type prefixes that are compressed
+COMPRESSION_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/xhtml+xml',
+    'image/svg+xml',
+)
+
+# Levels for responses compressed per request; `python manage.py
+# compressbench` shows the bytes saved and CPU time of each.
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+
+# djeroku.middleware.WeakETagMiddleware: weak ETags and 304s for GET
+# requests.
+ETAGS_ENABLED = True
+# END COMPRESSION CONFIGURATION
+
+
+# LOCALE CONFIGURATION
+# djeroku.l10n keeps the number and date formats and translated strings
+# templates use, and the language each Accept-Language header asks for, in
+# LRUs of this many entries each. 0 turns the caches off.
+LOCALE_CACHE_SIZE = 1000
+
+# djeroku.middleware.LocaleMiddleware serves each visitor the language (out
+# of LANGUAGES) their session, language cookie or browser asks for, and only
+# activates a translation for languages other than LANGUAGE_CODE's.
+LOCALE_MIDDLEWARE_ENABLED = False
+
+# Cache whole pages for CACHE_MIDDLEWARE_SECONDS, one copy per language
+# rather than per Accept-Language header (LocaleUpdateCacheMiddleware and
+# LocaleFetchFromCacheMiddleware). As with Django's cache middleware, pages
+# are shared between visitors unless they vary on Cookie.
+LOCALE_PAGE_CACHE_ENABLED = False
+
+# See: https://docs.djangoproject.com/en/dev/topics/cache/#the-per-site-cache
+CACHE_MIDDLEWARE_SECONDS = 600
+CACHE_MIDDLEWARE_KEY_PREFIX = SITE_NAME
+# END LOCALE CONFIGURATION
+
+
+# CACHE WARMUP CONFIGURATION
+# Sample the cache keys read and the anonymous pages served, so
+# djeroku.warmup can fill the cache again after a release (turned on in
+# settings/prod.py, where the cache is wrapped in djeroku.cache).
+CACHE_WARMUP_ENABLED = False
+
+# Fraction of cache reads and requests sampled, how often (in seconds) each
+# process merges its samples into the cache, and how many of the most
+# frequent keys and urls are kept.
+CACHE_WARMUP_SAMPLE_RATE = 0.01
+CACHE_WARMUP_FLUSH_INTERVAL = 60
+CACHE_WARMUP_MAX_ITEMS = 500
+
+# How many of the hottest urls a warm up requests, and how many at once.
+CACHE_WARMUP_URLS = 100
+CACHE_WARMUP_CONCURRENCY = 4
+# END CACHE WARMUP CONFIGURATION
+
+
+# BENCHMARK CONFIGURATION
+# urls benchmarked by `python manage.py bench` (fab bench), as
+# (name, path, needs a logged in user)
+BENCHMARK_URLS = (
+    ('admin login', '/admin/login/', False),
+    ('admin index', '/admin/', True),
+    ('admin user changelist', '/admin/auth/user/', True),
+    ('static file', STATIC_URL + 'admin/css/base.css', False),
+)
+
+# results from `python manage.py bench --save-baseline`; later runs fail if
+# they are more than BENCHMARK_TOLERANCE slower or bigger, or run more
+# queries per request
+BENCHMARK_BASELINE = normpath(join(SITE_ROOT, 'benchmarks.json'))
+BENCHMARK_TOLERANCE = 0.2
+# END BENCHMARK CONFIGURATION
+
+
 # WSGI CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#wsgi-application
 WSGI_APPLICATION = 'project.wsgi.application'
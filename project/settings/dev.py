@@ -4,12 +4,14 @@ Development settings and globals.
     Debug ON
 
     Console Email Backend
-    SQLite as the database
+    SQLite as the database, in WAL mode with persistent connections
     Local Memory Cache
     Debug Toolbar Enabled
+    N+1 Query Detection and View Query Budgets Enabled
 
     Task Queue Faked (CELERY_ALWAYS_EAGER = True)
-    - Or local Redis if CELERY_ALWAYS_EAGER is set to False
+    - Or worker threads in this process if CELERY_LOCAL_BROKER is True
+    - Or local Redis if both are False
 
     Looks for localhost redis
 """
@@ -73,6 +75,12 @@ MIDDLEWARE_CLASSES += (
 # END TOOLBAR CONFIGURATION
 
 
+# QUERY INSPECTION CONFIGURATION
+# Log N+1 query loops and view query budget overruns while developing
+QUERY_INSPECTION_ENABLED = True
+# END QUERY INSPECTION CONFIGURATION
+
+
 # REDIS CONFIGURATION
 REDIS_SERVER_URL = environ.get('REDIS_SERVER_URL', 'localhost')
 # END REDIS CONFIGURATION
@@ -87,4 +95,28 @@ BROKER_URL = 'redis://' + REDIS_SERVER_URL
 CELERY_RESULT_BACKEND = 'redis://' + REDIS_SERVER_URL
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_ACCEPT_CONTENT = ['json']
+
+# Or set CELERY_LOCAL_BROKER to queue tasks in memory and run them on worker
+# threads inside runserver, serialized and delayed like the real queue
+# (see djeroku/localbroker.py). Needs no redis.
+CELERY_LOCAL_BROKER = False
+
+# worker threads (the Procfile's workers run 2 each), and seconds between a
+# task being queued and a worker taking it
+CELERY_LOCAL_WORKERS = 2
+CELERY_LOCAL_LATENCY = 0.005
+
+if CELERY_LOCAL_BROKER:
+    CELERY_ALWAYS_EAGER = False
+    BROKER_URL = 'memory://'
+    BROKER_TRANSPORT_OPTIONS = {'polling_interval': 0.002}
+    CELERY_RESULT_BACKEND = 'cache+memory://'
+    LOGGING['handlers']['console'] = {
+        'level': 'INFO',
+        'class': 'logging.StreamHandler',
+    }
+    LOGGING['loggers']['djeroku.localbroker'] = {
+        'handlers': ['console'],
+        'level': 'INFO',
+    }
 # END CELERY CONFIGURATION
@@ -4,10 +4,12 @@ Production settings
 Debug OFF
 
 Djeroku Defaults:
-    Mandrill Email -- Requires Mandrill addon
+    Mandrill Email -- Requires Mandrill addon, sent from the celery workers
     dj_database_url and django-postgrespool for heroku postgres configuration
     memcachify for heroku memcache configuration
     Commented out by default - redisify for heroku redis cache configuration
+    Sampled slow query log (python manage.py slowqueries)
+    Sampled hot cache keys and urls, warmed after each release
 
 What you need to set in your heroku environment (heroku config:set key=value):
 
@@ -54,7 +56,10 @@ ALLOWED_HOSTS = [
 
 # EMAIL CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#email-backend
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Email is queued to celery and sent by the workers in batches over pooled
+# SMTP connections (see djeroku/mail.py), so sending mail never adds an SMTP
+# round trip to a request.
+EMAIL_BACKEND = 'djeroku.mail.CeleryEmailBackend'
 
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#email-host
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#email-host-password
@@ -91,10 +96,21 @@ DATABASES['default']['ENGINE'] = 'django_postgrespool'
 
 # CACHE CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#caches
-CACHES = memcacheify()
-# CACHES = redisify()
+# The real cache is kept under 'memcached', and the default cache wraps it
+# to sample the hottest keys for warming after a release (djeroku.warmup).
+CACHES = {'memcached': memcacheify()['default']}
+# CACHES = {'memcached': redisify()['default']}
+CACHES['default'] = {
+    'BACKEND': 'djeroku.cache.RecordingCache',
+    'LOCATION': 'memcached',
+}
 # END CACHE CONFIGURATION
 
+
+# CACHE WARMUP CONFIGURATION
+CACHE_WARMUP_ENABLED = True
+# END CACHE WARMUP CONFIGURATION
+
 # Simplest redis-based config possible
 # *very* easy to overload free redis/MQ connection limits
 # You MUST update REDIS_SERVER_URL or use djeroku_redis to set it automatically
@@ -105,6 +121,11 @@ CELERY_STORE_ERRORS_EVEN_IF_IGNORED = True
 # END CELERY CONFIGURATION
 
 
+# SLOW QUERY LOG CONFIGURATION
+SLOW_QUERY_LOG_ENABLED = True
+# END SLOW QUERY LOG CONFIGURATION
+
+
 # SECRET CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#secret-key
 SECRET_KEY = environ.get('SECRET_KEY', SECRET_KEY)
@@ -18,4 +18,7 @@ from django.contrib import admin
 
 urlpatterns = [
     url(r'^admin/', include(admin.site.urls)),
+
+    # resumable chunked uploads (djeroku.uploads)
+    url(r'^uploads/', include('djeroku.urls')),
 ]